@@ -1,8 +1,31 @@
 import logging
-from model.analyzer import OESAnalyzer
-import pandas as pd
+from model.analyzer import OESAnalyzer, Line
+from model.discovery import RunDiscovery, RunInfo
+from model.archive_index import ArchiveIndexer, ArchiveRun
+from model.extractor import WavebandExtractor
+from model.batch_render import WAVE_TOLERANCE, BatchRenderer, PlotJob, intensity_series
+from model.comparison import ExperimentComparison
+from model.preprocessing import PreprocessConfig
+from model.activation import ActivationConfig
+from model.quality import QualityConfig
+from model.heatmap import SpectralHeatmap, DEFAULT_HEATMAP_DIR, DEFAULT_MAX_HEATMAP_BYTES
+from model.threshold_sweep import DEFAULT_SWEEP_POINTS, ThresholdSweep, render_sweep_plot, write_sweep_excel
+from model.envelope import BatchEnvelope, render_envelope_plot, write_envelope_excel
+from model.band_integration import (INTEGRATE_SUM, Band, BandRatio, BandSeries, integrate_run, parse_band,
+                                    parse_bands, render_band_plot, write_band_excel)
+from model.ranking import (DEFAULT_TOP_K, MARKED_PEAKS, RANK_BY_MAXIMUM, RANK_BY_RANGE, RankedBand,
+                           merge_rankings, write_rankings_excel)
+from controller.result_cache import ResultCache, fingerprint_files
+from controller.export_queue import ExportQueue
 import os
-from typing import Tuple, Optional, List, Dict
+import hashlib
+import numpy as np
+from concurrent.futures import Future
+from typing import Any, Hashable, Tuple, Optional, List, Dict, Callable, Union, TYPE_CHECKING
+
+# pandas 只在匯出時才載入，縮短程式啟動時間
+if TYPE_CHECKING:
+    import pandas as pd
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -19,9 +42,23 @@ class OESController:
     def __init__(self):
         """Initialize the OES Controller with the OESAnalyzer instance."""
         self.analyzer = OESAnalyzer()
+        self.discovery = RunDiscovery()
+        self._archive_index = None  # 第一次索引或搜尋時才建立
         self.analysis_results = None  # To store analysis results
+        self.cache = ResultCache()  # 依輸入檔案指紋與參數快取中間結果
+        self.analyzer.series_cache = self.cache  # 逐檔讀取的波長值也受同一記憶體上限管理
+        self._series_key = None  # 目前 _all_data 對應的快取鍵
+        self._values_key = None  # 目前 analyzer.aggregates 對應的 (檔案指紋, 前處理設定, 品質檢查)
+        self._band_key = None  # 最近一次 band_series 的快取鍵
+        self._output_sources = {}  # 輸出檔路徑 -> 最後寫入該檔的快取鍵
+        self.export_queue = ExportQueue()  # 背景寫出 Excel 與圖檔
+        self.batch_renderer = BatchRenderer()  # 多資料夾圖表以多行程平行繪製
+        self.heatmap_directory = DEFAULT_HEATMAP_DIR  # 熱圖圖塊金字塔的磁碟快取
+        self.heatmap_cache_bytes = DEFAULT_MAX_HEATMAP_BYTES  # 熱圖磁碟快取的總大小上限
+        self.activation_segments = {}  # 最近一次分析：譜線 -> 啟動區間列表
 
-    def load_and_process_data(self, base_path: str, base_name: str, start_index: int, end_index: int) -> None:
+    def load_and_process_data(self, base_path: str, base_name: str, start_index: int, end_index: int,
+                              wavelengths: Optional[List[float]] = None) -> None:
         """
         Load data from files and process them.
 
@@ -30,6 +67,7 @@ class OESController:
             base_name: Base name of the files to process.
             start_index: Starting index of the files.
             end_index: Ending index of the files.
+            wavelengths: Only keep these wavelengths in memory (default: all).
 
         Returns:
             None
@@ -38,16 +76,79 @@ class OESController:
             logger.info("Generating file names...")
             file_names = self.analyzer.generate_file_names(base_name, start_index, end_index)
 
-            logger.info("Reading and processing data...")
-            self.analyzer.read_file_to_data(file_names, base_path)
+            file_paths = [os.path.join(base_path, file_name) for file_name in file_names]
+            key = ('series', fingerprint_files(file_paths), tuple(wavelengths) if wavelengths is not None else None)
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info("Input files unchanged, reusing loaded data.")
+                self.analyzer._all_data = {wave: list(values) for wave, values in cached.items()}
+            else:
+                logger.info("Reading and processing data...")
+                data = self.analyzer.read_file_to_data(file_names, base_path, wavelengths)
+                self.cache.put(key, {wave: list(values) for wave, values in data.items()})
+            self._series_key = key
             logger.info("Data successfully loaded and processed.")
 
         except Exception as e:
             logger.error(f"Error during data loading and processing: {e}")
             raise
     
+    def _export(self, key: Hashable, output_paths: List[str], fn: Callable, *args,
+                background: bool = False) -> Union[Any, Future]:
+        """
+        Write output files through the export queue, reusing them if still current.
+
+        The files are reused when the cache holds ``key`` and no other job wrote
+        (or is about to write) the same paths since. Each path is attributed to
+        its job when the job is queued, since jobs on one path run in order.
+
+        Args:
+            key: Cache key of the output (stage name plus inputs and parameters)
+            output_paths: Files written by ``fn``
+            fn: Function writing the files; its result is cached under ``key``
+            background: Return a future instead of waiting for the files
+
+        Returns:
+            Result of ``fn``, or its future when ``background`` is set
+        """
+        cached = self.cache.get(key)
+        if cached is not None and all(os.path.exists(path) and self._output_sources.get(path) == key for path in output_paths):
+            return ExportQueue.completed(cached) if background else cached
+
+        for path in output_paths:
+            self._output_sources[path] = key
+        future = self.export_queue.submit(key, output_paths, fn, *args)
+
+        def record(done: Future) -> None:
+            if not done.cancelled() and done.exception() is None and done.result() is not None:
+                self.cache.put(key, done.result())
+                return
+            # 寫入失敗的檔案不可被沿用
+            for path in output_paths:
+                if self._output_sources.get(path) == key:
+                    del self._output_sources[path]
+
+        future.add_done_callback(record)
+        return future if background else future.result()
+
     def execute_OES_analysis(self, folder_path, save_folder_path, base_name, file_paths,initial_start,
-                initial_end, wavebands, thresholds, skip_range_nm, filter_enabled, intensity_threshold):
+                initial_end, wavebands, thresholds, skip_range_nm, filter_enabled, intensity_threshold,
+                background: bool = False, preprocessing: Optional[PreprocessConfig] = None,
+                quality: Optional[QualityConfig] = None):
+            """
+            Gather the spectra, export the difference workbooks and draw the spectrum plot.
+
+            With ``background`` set, the workbooks and the plot are written on the
+            export queue and futures of their paths are returned instead, so the
+            caller can show the peaks before the files are on disk. ``preprocessing``
+            (dark frame, baseline, smoothing) is applied to the spectra before the
+            peaks and differences are computed. ``quality`` screens every spectrum
+            while it is read; flagged spectra are listed in the all-waveband
+            workbook and left out of the analysis if the checks exclude.
+
+            Returns:
+                Tuple of (excel file, specific excel file, plot path, peak points)
+            """
             try:
                                 
                 # activate_time, end_time = self.analyzer.detect_activate_time(detect_wave, thresholds, start_index)
@@ -56,76 +157,549 @@ class OESController:
                 #     raise ValueError("Could not detect activation time.")
 
                 self.analyzer.set_files(file_paths)
+                self.analyzer.set_preprocessing(preprocessing)
+                self.analyzer.set_quality(quality)
                 # 執行分析
                 logger.info("開始分析...")
                 output_directory = self.prepare_output_directory(save_folder_path)
 
-                excel_file, specific_excel_file = self.analyzer.OES_analyze_and_export(
-                    wavebands=wavebands,
-                    thresholds=thresholds,
-                    base_name=base_name,
-                    skip_range_nm=skip_range_nm,
-                    output_directory=output_directory
-                )
-
-                # 檢查是否需要過濾低強度波段
-                if filter_enabled:
-                    self.analyzer.filter_low_intensity(intensity_threshold)
+                # 輸入檔案未變動時沿用已收集的數據
+                self._values_key = (fingerprint_files(file_paths), self.analyzer._preprocess_key, quality)
+                cached = self.cache.get(('values', self._values_key))
+                if cached is not None:
+                    logger.info("Input files unchanged, reusing gathered values.")
+                    self.analyzer.file_table, self.analyzer.aggregates, self.analyzer.quality_report = cached
+                else:
+                    self.analyzer.gather_values()
+                    self.cache.put(('values', self._values_key), (self.analyzer.file_table, self.analyzer.aggregates,
+                                                                  self.analyzer.quality_report))
 
-                # 找出並顯示峰值點
-                peak_points = self.analyzer.find_peak_points(self.analyzer.all_values)
+                # 差異表在此計算，寫檔交給背景佇列
+                excel_name, specific_excel_name = self.analyzer.difference_excel_names(base_name, output_directory)
+                export_key = ('export', self._values_key, tuple(wavebands), tuple(thresholds), base_name, output_directory)
+                sheets, specific_sheets = self.analyzer.build_difference_sheets(wavebands, thresholds)
+                excel_file = self._export(export_key + (excel_name,), [excel_name],
+                                          self.analyzer.write_difference_excel, excel_name, sheets,
+                                          background=background)
+                specific_excel_file = self._export(export_key + (specific_excel_name,), [specific_excel_name],
+                                                   self.analyzer.write_difference_excel, specific_excel_name,
+                                                   specific_sheets, background=background)
 
-                # 生成全波段圖
-                output_path = self.analyzer.allSpectrum_plot(
-                    self.analyzer.all_values,
-                    skip_range_nm,
-                    output_directory,
-                    base_name.split('_')[1]  # 取得檔案前段名稱
-                )
+                output_path, peak_points = self.update_intensity_filter(
+                    save_folder_path, base_name, skip_range_nm, filter_enabled, intensity_threshold,
+                    background=background)
                 
                 return excel_file, specific_excel_file, output_path, peak_points
 
             except Exception as e:
                 logger.error(e)
                 raise RuntimeError(f"分析過程發生錯誤: {str(e)}")
-                
+
+    def update_intensity_filter(self, save_folder_path: str, base_name: str, skip_range_nm: float,
+                                filter_enabled: bool, intensity_threshold: Optional[float],
+                                background: bool = False) -> Tuple[Union[Optional[str], Future], List[dict]]:
+        """
+        Re-apply the low intensity filter to the last analysis and redraw the spectrum plot.
+
+        The filter is a mask over the gathered data, so changing it only recomputes
+        the masked envelope, the peaks and the plot; no file is read again.
+
+        Args:
+            save_folder_path: Directory where the plot should be saved.
+            base_name: Base name of the analyzed files.
+            skip_range_nm: Minimum distance between marked peaks.
+            filter_enabled: Whether the low intensity filter is applied.
+            intensity_threshold: Intensities below this value are treated as 0.
+            background: Draw the plot on the export queue and return its future.
+
+        Returns:
+            Tuple of the plot path (or its future) and the peak points.
+        """
+        if self.analyzer.aggregates is None:
+            raise ValueError("請先執行光譜分析")
+        output_directory = self.prepare_output_directory(save_folder_path)
+
+        # 檢查是否需要過濾低強度波段
+        self.analyzer.filter_low_intensity(intensity_threshold if filter_enabled else None)
+        filtered_values = self.analyzer.filtered_values()
+
+        # 找出並顯示峰值點：只選出圖上標註的前幾強（間隔大於 skip_range_nm），不排序全部波段
+        filter_key = (self._values_key, self.analyzer.intensity_threshold)
+        peak_points = self.cache.get(('peaks',) + filter_key + (skip_range_nm,))
+        if peak_points is None:
+            peak_points = self.analyzer.find_peak_points(filtered_values, MARKED_PEAKS, skip_range_nm)
+            self.cache.put(('peaks',) + filter_key + (skip_range_nm,), peak_points)
+
+        # 生成全波段圖（圖檔仍存在時不重繪）；峰值已算好，背景繪圖不需再讀取 analyzer 狀態
+        file_name = base_name.split('_')[1]  # 取得檔案前段名稱
+        plot_path = os.path.join(output_directory, f"{file_name}_allspectrum_highestPeaks.png")
+        plot_key = ('plot',) + filter_key + (skip_range_nm, output_directory, base_name)
+        output_path = self._export(plot_key, [plot_path], self.analyzer.allSpectrum_plot,
+                                   filtered_values, skip_range_nm, output_directory, file_name,
+                                   None, peak_points, background=background)
+        return output_path, peak_points
+
+    def sweep_thresholds(self, save_folder_path: str, base_name: str, wavebands: List[float],
+                         points: int = DEFAULT_SWEEP_POINTS,
+                         background: bool = False) -> Tuple[ThresholdSweep, Union[Optional[str], Future]]:
+        """
+        Count the significant wavebands over a dense threshold grid for the last analysis.
+
+        The counts come from the gathered per-wavelength ranges, so no file is
+        read again. The curve and a compact table are written next to the
+        difference workbooks.
+
+        Args:
+            save_folder_path: Directory where the results should be saved.
+            base_name: Base name of the analyzed files.
+            wavebands: Specific wavebands counted separately.
+            points: Number of thresholds in the sweep.
+            background: Write the files on the export queue and return a future.
+
+        Returns:
+            Tuple of the sweep and the plot path (or its future).
+        """
+        if self.analyzer.aggregates is None:
+            raise ValueError("請先執行光譜分析")
+        output_directory = self.prepare_output_directory(save_folder_path)
+        sweep_key = ('sweep', self._values_key, tuple(wavebands), points)
+        sweep = self.cache.get(sweep_key)
+        if sweep is None:
+            sweep = self.analyzer.threshold_sweep(wavebands, points=points)
+            self.cache.put(sweep_key, sweep)
+
+        excel_name = os.path.join(output_directory, f"{base_name}_閾值掃描.xlsx")
+        plot_path = os.path.join(output_directory, f"{base_name}_threshold_sweep.png")
+        output_path = self._export(sweep_key + (base_name, output_directory), [excel_name, plot_path],
+                                   self._write_sweep, sweep, excel_name, plot_path, base_name,
+                                   background=background)
+        return sweep, output_path
+
+    @staticmethod
+    def _write_sweep(sweep: ThresholdSweep, excel_name: str, plot_path: str, title: str) -> str:
+        write_sweep_excel(sweep, excel_name)
+        return render_sweep_plot(sweep, plot_path, title)
+
+    def export_top_bands(self, save_folder_path: str, base_name: str, k: int = DEFAULT_TOP_K,
+                         background: bool = False) -> Tuple[Dict[str, List[RankedBand]], Union[Optional[str], Future]]:
+        """
+        Rank the strongest wavebands of the last analysis and export a compact table.
+
+        Args:
+            save_folder_path: Directory where the table should be saved.
+            base_name: Base name of the analyzed files.
+            k: Number of wavebands per ranking.
+            background: Write the file on the export queue and return a future.
+
+        Returns:
+            Tuple of the rankings (by maximum and by range) and the Excel path (or its future).
+        """
+        if self.analyzer.aggregates is None:
+            raise ValueError("請先執行光譜分析")
+        output_directory = self.prepare_output_directory(save_folder_path)
+        ranking_key = ('ranking', self._values_key, k)
+        rankings = self.cache.get(ranking_key)
+        if rankings is None:
+            rankings = {by: self.analyzer.rank_bands(k, by) for by in (RANK_BY_MAXIMUM, RANK_BY_RANGE)}
+            self.cache.put(ranking_key, rankings)
+
+        excel_name = os.path.join(output_directory, f"{base_name}_前{k}強波段.xlsx")
+        output_path = self._export(ranking_key + (base_name, output_directory), [excel_name],
+                                   write_rankings_excel, rankings, excel_name, background=background)
+        return rankings, output_path
+
+    def merge_top_bands(self, folders: List[str], save_folder_path: str, k: int = DEFAULT_TOP_K,
+                        progress_callback: Optional[Callable[[int, int], None]] = None) -> Tuple[Dict[str, List[RankedBand]], str]:
+        """
+        Rank the strongest wavebands over many folders.
+
+        Only the top ``k`` of every run is kept (and cached by the run's file
+        fingerprint); the per-run rankings are then merged into one top ``k``.
+
+        Args:
+            folders: Folders to rank; the main run of each folder is used.
+            save_folder_path: Directory where the table should be saved.
+            k: Number of wavebands per ranking.
+            progress_callback: Called with (finished folders, total folders).
+
+        Returns:
+            Tuple of the merged rankings (by maximum and by range) and the Excel path.
+        """
+        per_run = {RANK_BY_MAXIMUM: [], RANK_BY_RANGE: []}
+        for done, folder in enumerate(folders, 1):
+            run = self.discovery.primary_run(folder)
+            if run is None:
+                logger.warning(f"No spectrum files found in {folder}")
+            else:
+                file_paths = run.file_paths(folder)
+                run_key = ('run_ranking', fingerprint_files(file_paths), k)
+                rankings = self.cache.get(run_key)
+                if rankings is None:
+                    analyzer = OESAnalyzer()
+                    analyzer.set_files(file_paths)
+                    analyzer.gather_values()
+                    label = f"{os.path.basename(os.path.normpath(folder))}/{run.base_name}"
+                    rankings = {by: analyzer.rank_bands(k, by, run=label) for by in per_run}
+                    self.cache.put(run_key, rankings)
+                for by, bands in rankings.items():
+                    per_run[by].append(bands)
+            if progress_callback:
+                progress_callback(done, len(folders))
+
+        merged = {by: merge_rankings(rankings, k) for by, rankings in per_run.items()}
+        excel_name = os.path.join(self.prepare_output_directory(save_folder_path), f"跨實驗前{k}強波段.xlsx")
+        return merged, write_rankings_excel(merged, excel_name)
+
+    def batch_envelope(self, folders: List[str], save_folder_path: str, skip_range_nm: float = 10.0,
+                       preprocessing: Optional[PreprocessConfig] = None, quality: Optional[QualityConfig] = None,
+                       progress_callback: Optional[Callable[[int, int], None]] = None) -> Tuple[BatchEnvelope, str, str]:
+        """
+        Build the intensity envelope over many folders and export its plot and summary.
+
+        The folders are read one at a time and only their aggregates are kept,
+        so memory does not grow with the number of spectra in the batch.
+
+        Args:
+            folders: Folders to combine; the main run of each folder is used.
+            save_folder_path: Directory where the plot and summary should be saved.
+            skip_range_nm: Minimum distance between marked peaks.
+            preprocessing: Preprocessing applied to every spectrum, or None.
+            quality: Quality checks applied to every spectrum, or None.
+            progress_callback: Called with (finished folders, total folders).
+
+        Returns:
+            Tuple of the envelope, the plot path and the Excel path.
+        """
+        envelope = BatchEnvelope()
+        for done, folder in enumerate(folders, 1):
+            run = self.discovery.primary_run(folder)
+            if run is None:
+                logger.warning(f"No spectrum files found in {folder}")
+            else:
+                analyzer = OESAnalyzer()
+                analyzer.formats = self.analyzer.formats
+                analyzer.set_files(run.file_paths(folder))
+                analyzer.set_preprocessing(preprocessing)
+                analyzer.set_quality(quality)
+                # 已分析過的資料夾直接沿用快取的統計量
+                values_key = (fingerprint_files(analyzer.selected_files), analyzer._preprocess_key, quality)
+                cached = self.cache.get(('values', values_key))
+                aggregates = cached[1] if cached is not None else analyzer.gather_values()
+                envelope.add(f"{os.path.basename(os.path.normpath(folder))}/{run.base_name}", aggregates)
+            if progress_callback:
+                progress_callback(done, len(folders))
+        if not len(envelope):
+            raise ValueError("所選資料夾中沒有光譜數據")
+
+        output_directory = self.prepare_output_directory(save_folder_path)
+        plot_path = render_envelope_plot(envelope, os.path.join(output_directory, "batch_envelope.png"), skip_range_nm)
+        excel_name = write_envelope_excel(envelope, os.path.join(output_directory, "跨實驗包絡線.xlsx"), skip_range_nm,
+                                          os.path.join(output_directory, "跨實驗包絡線.csv"))
+        logger.info(f"Envelope of {len(envelope)} runs written to {output_directory}")
+        return envelope, plot_path, excel_name
 
     def scan_file_indices(self, folder_path: str) -> Tuple[Optional[str], Optional[int], Optional[int]]:
         """
         Scan the folder to find the range of indices for the given base name.
+        When the folder holds several runs, the run with the most files is used.
 
         Args:
             folder_path: Path to the folder containing the files.
 
         Returns:
-            A tuple containing the start and end indices.
+            A tuple containing the base name, start and end indices.
         """
         try:
-            files = os.listdir(folder_path)
-            spectrum_files = [f for f in files if f.endswith('.txt') and '_S' in f]
-            
-            if not spectrum_files:
+            run = self.discovery.primary_run(folder_path)
+            if run is None:
                 return None, None, None
-            
-            base_name = spectrum_files[0].split('_S')[0]            
-            indices = []
-            for file in spectrum_files:
-                if file.startswith(base_name):
-                    try:
-                        index = int(file.split('_S')[-1].replace('.txt', ''))
-                        indices.append(index)
-                    except ValueError:
-                        continue
-            
-            if not indices:
-                return None, None, None
-                
-            return base_name, min(indices), max(indices)
+            return run.base_name, run.start_index, run.end_index
         
         except Exception as e:
             logger.error(f"Error finding spectrum files: {e}")
             return None, None, None
-    def analyze_data(self, detect_wave: float, threshold: float, section_count: int,base_name: str, base_path: str, start_index: int ) -> Tuple[pd.DataFrame, int, int]:
+
+    def scan_folders(self, folders: List[str]) -> Dict[str, Tuple[Optional[str], Optional[int], Optional[int]]]:
+        """
+        Scan several folders (see ``scan_file_indices``), writing the run catalog once.
+
+        Args:
+            folders: Folders to scan.
+
+        Returns:
+            Folder -> (base name, start index, end index).
+        """
+        with self.discovery.batch():
+            return {folder: self.scan_file_indices(folder) for folder in folders}
+
+    def discover_runs(self, folder_path: str) -> List[RunInfo]:
+        """
+        List every run (base name, index range, gaps and duplicates) in a folder.
+
+        Args:
+            folder_path: Path to the folder containing the files.
+
+        Returns:
+            List of RunInfo, the run with the most files first.
+        """
+        return self.discovery.scan(folder_path)
+
+    def forget_formats(self, folders: List[str]) -> None:
+        """
+        Drop the cached file format of newly selected folders so it is detected again.
+
+        Args:
+            folders: Folders the user just picked
+        """
+        for folder in folders:
+            self.analyzer.formats.forget(folder)
+
+    @property
+    def archive_index(self) -> ArchiveIndexer:
+        """Archive catalog, created on first use so startup does not touch it."""
+        if self._archive_index is None:
+            self._archive_index = ArchiveIndexer()
+        return self._archive_index
+
+    def index_archive(self, root: str, progress_callback: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Recursively index every OES run below an archive root into the catalog.
+
+        Args:
+            root: Archive root directory.
+            progress_callback: Called with (scanned folders, discovered folders).
+
+        Returns:
+            Number of runs recorded below the root.
+        """
+        return self.archive_index.index(root, progress_callback)
+
+    def query_archive(self, text: str = "", min_files: int = 0, wavelength: Optional[float] = None) -> List[ArchiveRun]:
+        """Query the archive catalog without touching the file system."""
+        return self.archive_index.query(text=text, min_files=min_files, wavelength=wavelength)
+
+    def render_batch(self, folders: List[str], save_folder_path: str, detect_waves: List[float] = (),
+                     skip_range_nm: float = 10.0, intensity_threshold: Optional[float] = None,
+                     progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[PlotJob, Optional[str]]:
+        """
+        Render the all-spectrum peak plot and the intensity plots of many folders in parallel.
+
+        Args:
+            folders: Folders to render; the main run of each folder is used.
+            save_folder_path: Directory where the figures should be saved.
+            detect_waves: Wavelengths to draw an intensity-over-time plot for.
+            skip_range_nm: Minimum distance between marked peaks.
+            intensity_threshold: Low intensity filter of the spectrum plots, or None.
+            progress_callback: Called with (finished figures, total figures).
+
+        Returns:
+            Mapping of every plot job to its figure path (None if it failed).
+        """
+        runs = []
+        with self.discovery.batch():
+            for folder in folders:
+                run = self.discovery.primary_run(folder)
+                if run is None:
+                    logger.warning(f"No spectrum files found in {folder}")
+                    continue
+                runs.append((folder, run))
+        output_directory = os.path.join(self.prepare_output_directory(save_folder_path), "批次圖表")
+        jobs = self.batch_renderer.plan(runs, output_directory, detect_waves=detect_waves,
+                                        skip_range_nm=skip_range_nm, intensity_threshold=intensity_threshold)
+        return self.batch_renderer.render(jobs, progress_callback)
+
+    @staticmethod
+    def parse_lines(text: str) -> List[Line]:
+        """
+        Parse a comma separated list of wavelengths and ranges, e.g. "486, 775-780, 656±1".
+
+        Raises:
+            ValueError: If an entry is not a number, a low-high range or a center±half-width
+        """
+        lines = []
+        for entry in text.split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            if '±' in entry or '+-' in entry:
+                lines.append(parse_band(entry))
+            elif '-' in entry.lstrip('-'):
+                low, high = (float(part) for part in entry.rsplit('-', 1))
+                lines.append((min(low, high), max(low, high)))
+            else:
+                lines.append(float(entry))
+        return lines
+
+    def expand_lines(self, lines: List[Line], base_path: str, base_name: str, start_index: int) -> List[float]:
+        """
+        Wavelengths to load for a set of lines.
+
+        Ranges are resolved against the wavelength grid of the first file, so
+        every line can be loaded in the same pass.
+        """
+        waves = {float(line) for line in lines if not isinstance(line, tuple)}
+        ranges = [line for line in lines if isinstance(line, tuple)]
+        if ranges:
+            first_file = os.path.join(base_path, self.analyzer.generate_file_names(base_name, start_index, start_index)[0])
+            grid = self.analyzer.read_values_by_line(first_file)
+            for low, high in ranges:
+                waves.update(wave for wave in grid if low <= wave <= high)
+        return sorted(waves)
+
+    def analyze_lines(self, lines: List[Line], threshold: float, section_count: int, base_name: str,
+                      base_path: str, start_index: int, activation: Optional[ActivationConfig] = None,
+                      robust: bool = False) -> Tuple['pd.DataFrame', Dict[str, Tuple[Optional[int], Optional[int]]]]:
+        """
+        Analyze the stability of several lines from one load of the data.
+
+        The activation window of every line is detected on the loaded series,
+        then the union of all windows is read once and every line's window is
+        sliced out of it, so an extra line costs no additional file reads. With
+        ``activation.multi_segment`` the sections cover all plasma-on segments
+        of a line joined together; the segments are kept in
+        ``activation_segments``.
+
+        Args:
+            lines: Wavelengths or (low, high) ranges, all loaded by ``load_and_process_data``
+            threshold: Threshold for activation detection.
+            section_count: Number of sections for analysis.
+            activation: Activation detection settings (default: first jump above ``threshold``).
+            robust: Add the median, MAD, IQR and trimmed mean of every section.
+
+        Returns:
+            Tuple containing:
+            - Combined DataFrame with a '波長' column
+            - Line label -> (activation time, end time); (None, None) if no activation was found
+
+        Raises:
+            ValueError: If no line has an activation window
+        """
+        sections_key = ('sections', self._series_key, tuple(lines), threshold, section_count, base_name, base_path,
+                        start_index, activation, robust)
+        cached = self.cache.get(sections_key) if self._series_key is not None else None
+        if cached is not None:
+            logger.info("Inputs unchanged, reusing section statistics.")
+            self.analysis_results, windows, self.activation_segments = cached
+            return self.analysis_results, windows
+
+        # 1. find active time point and end time point of every line
+        windows = {}
+        segments = {}
+        errors = []
+        for line in lines:
+            label = self.analyzer.line_label(line)
+            series = self.analyzer.line_series(line)
+            if series is None:
+                errors.append(f"Wave length {label} not found in the data.")
+                windows[label] = (None, None)
+                continue
+            windows[label] = self.analyzer.detect_activation(series, threshold, start_index, activation)
+            segments[label] = self.analyzer.detect_activation_segments(series, threshold, start_index, activation)
+            logger.info(f"{label}nm activate time: {windows[label][0]}, end time: {windows[label][1]}")
+            if None in windows[label]:
+                errors.append(f"Could not detect activation time at {label}nm.")
+        active = [(line, windows[self.analyzer.line_label(line)]) for line in lines
+                  if None not in windows[self.analyzer.line_label(line)]]
+        if not active:
+            raise ValueError(" ".join(errors))
+        for error in errors:
+            logger.warning(error)
+
+        # 2. read the union of the active periods once, for every line
+        waves = sorted({wave for line, _ in active for wave in self.analyzer.line_wavelengths(line)})
+        first = min(activate_time for _, (activate_time, _) in active) + 3
+        last = max(end_time for _, (_, end_time) in active) - 3
+        window_files = self.analyzer.generate_file_names(base_name, first, last)
+        window_data = self.analyzer.read_file_to_data(window_files, base_path, waves)
+
+        # 3. section statistics of every line's own window
+        sectioned = {}
+        wave_data_by_line = {}
+        for line, (activate_time, end_time) in active:
+            label = self.analyzer.line_label(line)
+            series = self.analyzer.line_series(line, window_data) or []
+            # 多區段時依序串接每個啟動區間（各自去掉頭尾 3 點）
+            wave_data = []
+            for segment_start, segment_end in segments[label] or [(activate_time, end_time)]:
+                wave_data.extend(series[segment_start + 3 - first:segment_end - 3 - first + 1])
+            sectioned[label] = self.analyzer.analyze_sections(wave_data, section_count)
+            wave_data_by_line[label] = wave_data
+        if robust:
+            # 所有譜線的所有區段一次計算
+            self.analyzer.add_robust_statistics(sectioned, wave_data_by_line, section_count)
+
+        self.analysis_results = self.analyzer.prepare_lines_dataframe(sectioned)
+        self.activation_segments = segments
+        if self._series_key is not None:
+            self.cache.put(sections_key, (self.analysis_results, windows, segments))
+        logger.info("Data analysis completed successfully.")
+        return self.analysis_results, windows
+
+    def screen_activation(self, folders: List[str], detect_wave: float, threshold: float,
+                          progress_callback: Optional[Callable[[int, int], None]] = None,
+                          activation: Optional[ActivationConfig] = None
+                          ) -> Tuple[Dict[str, Tuple[str, int, int]], List[Tuple[str, str]]]:
+        """
+        Check the activation window of every folder before any full load.
+
+        Only the ``detect_wave`` value of each file is read (or taken from the
+        cache), and the windows of all folders are detected in one vectorized
+        pass, so folders without activation are rejected before their data is
+        loaded.
+
+        Args:
+            folders: Folders to analyze.
+            detect_wave: Wave length used for activation detection.
+            threshold: Threshold for activation detection.
+            progress_callback: Called with (folders read, total folders).
+            activation: Activation detection settings (default: first jump above ``threshold``).
+
+        Returns:
+            Tuple containing:
+            - Folder -> (base name, start index, end index) of the folders with an activation window
+            - (folder, error message) of the rejected folders
+        """
+        failed = []
+        runs = {}
+        series = []
+        extractor = WavebandExtractor([detect_wave], self.analyzer.formats)
+        for index, folder in enumerate(folders):
+            base_name, start_index, end_index = self.scan_file_indices(folder)
+            if base_name is None:
+                failed.append((folder, "No spectrum files found."))
+                continue
+            # 使用掃描到的檔名，不依序號重組
+            run = next(r for r in self.discovery.scan(folder) if r.base_name == base_name)
+            file_paths = run.file_paths(folder)
+            key = ('activation_series', fingerprint_files(file_paths), detect_wave)
+            values = self.cache.get(key)
+            if values is None:
+                column = extractor.extract(file_paths)[:, 0]
+                # 與 read_file_to_data 相同：沒有此波長的檔案不列入時間序列
+                values = column[~np.isnan(column)]
+                self.cache.put(key, values)
+            if not len(values):
+                failed.append((folder, f"Wave length {detect_wave} not found in the data."))
+            else:
+                runs[folder] = (base_name, start_index, end_index)
+                series.append(values)
+            if progress_callback:
+                progress_callback(index + 1, len(folders))
+
+        windows = self.analyzer.detect_activation_batch(
+            series, threshold, [start_index for _, start_index, _ in runs.values()], activation)
+        passed = {}
+        for (folder, run), (activate_time, end_time) in zip(runs.items(), windows):
+            if activate_time is None or end_time is None:
+                failed.append((folder, f"Could not detect activation time at {detect_wave}nm."))
+                logger.warning(f"資料夾 {folder} 未偵測到啟動區間，略過載入")
+            else:
+                passed[folder] = run
+        logger.info(f"Activation pre-check: {len(passed)}/{len(folders)} folders passed")
+        return passed, failed
+
+    def analyze_data(self, detect_wave: float, threshold: float, section_count: int,base_name: str, base_path: str, start_index: int,
+                     activation: Optional[ActivationConfig] = None, robust: bool = False) -> Tuple['pd.DataFrame', int, int]:
         """
         Analyze the processed data and return a DataFrame of results.
 
@@ -133,6 +707,8 @@ class OESController:
             detect_wave: Wave length to analyze.
             threshold: Threshold for activation detection.
             section_count: Number of sections for analysis.
+            activation: Activation detection settings (default: first jump above ``threshold``).
+            robust: Add the median, MAD, IQR and trimmed mean of every section.
 
         Returns:
             Tuple containing:
@@ -142,79 +718,64 @@ class OESController:
         """
         try:
             logger.info("Detecting activation and analyzing data...")
-
-            # Ensure the data for the specific wave exists
-            if detect_wave not in self.analyzer._all_data:
-                raise ValueError(f"Wave length {detect_wave} not found in the data.")
-            
-            # 1. find active time point and end time point
-            activate_time, end_time = self.analyzer.detect_activate_time(detect_wave, threshold, start_index)
-            logger.info(f"Activate time: {activate_time}, End time: {end_time}")
-
-            if activate_time is None or end_time is None:
-                raise ValueError("Could not detect activation time.")
-
-            # 2. read data of active time period 
-            activate_time_file = self.analyzer.generate_file_names(base_name, activate_time + 3, end_time - 3)
-            activate_time_data = self.analyzer.read_file_to_data(activate_time_file, base_path)
-
-            wave_data = activate_time_data[detect_wave]
-            sectioned_data = self.analyzer.analyze_sections(wave_data, section_count)
-
-            # Store and return results
-            self.analysis_results = self.analyzer.prepare_results_dataframe(sectioned_data)
-            logger.info("Data analysis completed successfully.")
+            results, windows = self.analyze_lines([detect_wave], threshold, section_count, base_name, base_path, start_index,
+                                                  activation, robust)
+            activate_time, end_time = windows[self.analyzer.line_label(detect_wave)]
+            self.analysis_results = results.drop(columns='波長')
             return self.analysis_results, activate_time, end_time
 
         except Exception as e:
             logger.error(f"Error during data analysis: {e}")
             raise
 
-    def save_results_to_excel(self, base_path: str, threshold: float, selected_folders=None) -> None:
+    def compare_experiments(self, analysis_results: Dict[str, Optional['pd.DataFrame']],
+                            selected_folders: Optional[List[str]] = None) -> ExperimentComparison:
+        """
+        Stack the stability results of several experiments for comparison.
+
+        Args:
+            analysis_results: Folder -> section results DataFrame.
+            selected_folders: Folders in analysis order (for Exp.1, Exp.2...).
+
+        Returns:
+            ExperimentComparison with the cross-experiment statistics.
+        """
+        return ExperimentComparison(analysis_results, selected_folders)
+
+    def save_results_to_excel(self, base_path: str, threshold: float, selected_folders=None,
+                              analysis_results: Optional[Dict[str, 'pd.DataFrame']] = None) -> None:
         """
         Save all analysis results to a single Excel file, all in one sheet, with experiment label.
+        A second sheet holds the cross-experiment statistics.
         Args:
             base_path: Directory where the results should be saved.
             threshold: Threshold value used in the analysis (included in file naming).
             selected_folders: List of folders in分析順序 (for Exp.1, Exp.2...)
+            analysis_results: Folder -> results DataFrame (default: the controller's results)
         Returns:
             None
         """
         try:
+            if analysis_results is None:
+                analysis_results = self.analysis_results
             # 檢查 analysis_results 是否為 dict
-            if not isinstance(self.analysis_results, dict) or not self.analysis_results:
+            if not isinstance(analysis_results, dict) or not analysis_results:
                 logger.warning("目前沒有分析結果可儲存。")
                 return
 
+            import pandas as pd
             excel_path = os.path.join(base_path, '穩定性分析檔案.xlsx')
 
             # 欄位順序與 GUI 一致
-            columns = ['實驗', '區段', '平均值', '標準差', '變異數', '穩定度']
-            all_rows = []
-            exp_labels = []
-            if selected_folders is None:
-                selected_folders = list(self.analysis_results.keys())
-            for idx, folder in enumerate(selected_folders):
-                df = self.analysis_results.get(folder)
-                if df is None or df.empty:
-                    continue
-                exp_label = f"Exp.{idx+1}"
-                for _, row in df.iterrows():
-                    all_rows.append([
-                        exp_label,
-                        row['區段'],
-                        row['平均值'],
-                        row['標準差'],
-                        row['變異數'],
-                        row['穩定度']
-                    ])
-            out_df = pd.DataFrame(all_rows, columns=columns)
+            comparison = self.compare_experiments(analysis_results, selected_folders)
             with pd.ExcelWriter(excel_path) as writer:
-                out_df.to_excel(writer, sheet_name=f"Threshold_{threshold}", index=False)
+                comparison.results_table().to_excel(writer, sheet_name=f"Threshold_{threshold}", index=False)
+                comparison.summary().to_excel(writer, sheet_name="跨實驗統計", index=False)
             logger.info(f"Results successfully saved to {excel_path}")
         except Exception as e:
             logger.error(f"Error saving results to Excel: {e}")
             raise
+
     def prepare_output_directory(self, save_folder_path):
         if os.path.basename(save_folder_path) == "OES光譜分析結果":
             return save_folder_path
@@ -236,43 +797,222 @@ class OESController:
         Returns:
             None
         """
-        all_data = {}
-        
         # 獲取所有檔案
         try:
-            files = os.listdir(folder_path)
-            spectrum_files = [f for f in files if f.endswith('.txt') and f.startswith(base_name)]
-            
-            if not spectrum_files:
+            run = next((r for r in self.discovery.scan(folder_path) if r.base_name == base_name), None)
+            if run is None:
                 logger.warning("No spectrum files found.")
                 return
             
-            logger.info(f"Found {len(spectrum_files)} files to process.")
-
-            for file_name in spectrum_files:
-                file_path = os.path.join(folder_path, file_name)
-                try:
-                    data = self.analyzer.read_data(file_path)  # 使用 OESAnalyzer 的 read_data 方法
-                    for spectral_data in data:
-                        if spectral_data.time_point not in all_data:
-                            all_data[spectral_data.time_point] = {}
-                        for waveband in wavebands:
-                            if waveband not in all_data[spectral_data.time_point]:
-                                all_data[spectral_data.time_point][waveband] = spectral_data.intensity
-                except Exception as e:
-                    logger.error(f"Error processing file {file_name}: {e}")
+            sequences = run.sequences
+            file_paths = run.file_paths(folder_path)
+            logger.info(f"Found {len(file_paths)} files to process.")
+
+            # 波段只在第一個檔案解析一次對應行號，其餘檔案只讀取這幾行
+            matrix = WavebandExtractor(wavebands, self.analyzer.formats).extract(file_paths)
             
             # Save to Excel
+            import pandas as pd
             output_file = os.path.join(save_folder_path, f"{base_name}_特定波段數據.xlsx")
-            df = pd.DataFrame.from_dict(all_data, orient='index').reset_index()
-            df.columns = ['Time Point'] + [f'{wb} nm' for wb in wavebands]
+            df = pd.DataFrame(matrix, columns=[f'{wb} nm' for wb in wavebands])
+            df.insert(0, 'Time Point', sequences)
             df.to_excel(output_file, index=False)
             logger.info(f"特定波段數據已被存至 {output_file}")
 
         except Exception as e:
             logger.error(f"Error scanning files in {folder_path}: {e}")
 
-    def analyze_folders(self, selected_folders, detect_wave: float, threshold: float, section_count: int,base_name: str, base_path: str, start_index: int) -> Dict[str, pd.DataFrame]:
+    def intensity_over_time(self, folder_path: str, base_name: str, detect_wave: float,
+                            tolerance: float = WAVE_TOLERANCE) -> Tuple[List[int], List[float]]:
+        """
+        Read the intensity of one wavelength from every file of a run.
+
+        Args:
+            folder_path: Folder containing the run
+            base_name: Base name of the run's files
+            detect_wave: Wavelength to read
+            tolerance: Maximum distance between ``detect_wave`` and the file's wavelength (nm)
+
+        Returns:
+            Tuple of (time points, intensities) for the files containing the wavelength
+        """
+        run = next((r for r in self.discovery.scan(folder_path) if r.base_name == base_name), None)
+        if run is None:
+            return [], []
+        intensities = intensity_series(run.file_paths(folder_path), detect_wave, self.analyzer.formats, tolerance)
+        valid = ~np.isnan(intensities)
+        times = [sequence for sequence, found in zip(run.sequences, valid.tolist()) if found]
+        return times, intensities[valid].tolist()
+
+    def spectral_heatmap(self, folder_path: str, base_name: str,
+                         progress_callback: Optional[Callable[[int, int], None]] = None) -> SpectralHeatmap:
+        """
+        Open the time x wavelength heatmap of a run, building its tile pyramid on first use.
+
+        The pyramid is cached on disk under the fingerprint of the run's files
+        and the current preprocessing, so reopening an unchanged run is instant.
+
+        Args:
+            folder_path: Folder containing the run
+            base_name: Base name of the run's files
+            progress_callback: Called with (files read, total files) while building
+
+        Returns:
+            The heatmap of the run
+
+        Raises:
+            ValueError: If the run is not found or has no data
+        """
+        run = next((r for r in self.discovery.scan(folder_path) if r.base_name == base_name), None)
+        if run is None:
+            raise ValueError(f"No spectrum files of {base_name} found in {folder_path}")
+        file_paths = run.file_paths(folder_path)
+        identity = f"{fingerprint_files(file_paths)}\0{self.analyzer._preprocess_key!r}\0{self.analyzer.quality!r}"
+        key = hashlib.blake2b(identity.encode('utf-8'), digest_size=16).hexdigest()
+        return SpectralHeatmap.open_or_build(
+            self.heatmap_directory, key, lambda: self.analyzer.iter_spectra_chunks(file_paths),
+            np.asarray(run.sequences), progress_callback, self.heatmap_cache_bytes)
+
+    @staticmethod
+    def parse_bands(text: str) -> Tuple[List[Band], List[BandRatio]]:
+        """Parse integration windows and ratios, e.g. "656±1, 750.4±0.5, 656±1/750.4±0.5"."""
+        return parse_bands(text)
+
+    def band_series(self, folder_path: str, base_name: str, bands: List[Band], ratios: List[BandRatio] = (),
+                    method: str = INTEGRATE_SUM,
+                    progress_callback: Optional[Callable[[int, int], None]] = None) -> BandSeries:
+        """
+        Integrate every window, and the ratios, over every file of a run.
+
+        The spectra are read in chunks with the current preprocessing and
+        quality checks; every chunk is integrated for all windows at once. The
+        series are cached under the fingerprint of the run's files.
+
+        Args:
+            folder_path: Folder containing the run
+            base_name: Base name of the run's files
+            bands: (low, high) integration windows
+            ratios: Ratios of two windows
+            method: ``INTEGRATE_SUM`` or ``INTEGRATE_TRAPEZOID``
+            progress_callback: Called with (files read, total files)
+
+        Returns:
+            The time series of the run
+
+        Raises:
+            ValueError: If the run is not found
+        """
+        run = next((r for r in self.discovery.scan(folder_path) if r.base_name == base_name), None)
+        if run is None:
+            raise ValueError(f"No spectrum files of {base_name} found in {folder_path}")
+        file_paths = run.file_paths(folder_path)
+        key = ('band_series', fingerprint_files(file_paths), self.analyzer._preprocess_key, self.analyzer.quality,
+               tuple(bands), tuple(ratios), method)
+        series = self.cache.get(key)
+        if series is None:
+            series = integrate_run(self.analyzer.iter_spectra_chunks(file_paths), np.asarray(run.sequences),
+                                   bands, ratios, method, progress_callback)
+            self.cache.put(key, series)
+        self._band_key = key
+        return series
+
+    def band_stability(self, series: BandSeries, threshold: float, section_count: int,
+                       activation: Optional[ActivationConfig] = None,
+                       robust: bool = False) -> Tuple['pd.DataFrame', Tuple[int, int]]:
+        """
+        Section statistics of every integrated window and ratio.
+
+        The activation window is detected on the first window (``threshold``
+        is in its integrated units) and applied to every series, so all
+        windows and ratios are compared over the same files. As in
+        ``analyze_lines`` 3 points are cut at both ends of every segment.
+
+        Returns:
+            Tuple of the combined DataFrame (with a '波長' column) and the
+            (activation time, end time) of the reference window
+
+        Raises:
+            ValueError: If no activation is found on the reference window
+        """
+        reference = series.integrals[:, 0]
+        valid = ~np.isnan(reference)
+        times = series.times[valid]
+        values = series.values()[valid]
+        reference = reference[valid].tolist()
+        window = self.analyzer.detect_activation(reference, threshold, 0, activation)
+        if None in window:
+            raise ValueError(f"Could not detect activation time at {series.labels[0]}nm.")
+        segments = self.analyzer.detect_activation_segments(reference, threshold, 0, activation) or [window]
+        rows = np.concatenate([np.arange(start + 3, end - 3 + 1) for start, end in segments])
+
+        sectioned = {}
+        wave_data_by_label = {}
+        for label, column in zip(series.labels, values[rows].T):
+            wave_data = column[~np.isnan(column)].tolist()
+            if not wave_data:
+                logger.warning(f"No data of {label} in the activation window")
+                continue
+            sectioned[label] = self.analyzer.analyze_sections(wave_data, section_count)
+            wave_data_by_label[label] = wave_data
+        if robust:
+            self.analyzer.add_robust_statistics(sectioned, wave_data_by_label, section_count)
+        return self.analyzer.prepare_lines_dataframe(sectioned), (int(times[window[0]]), int(times[window[1]]))
+
+    def analyze_bands(self, folder_path: str, base_name: str, save_folder_path: str, bands: List[Band],
+                      ratios: List[BandRatio], threshold: float, section_count: int,
+                      activation: Optional[ActivationConfig] = None, robust: bool = False,
+                      method: str = INTEGRATE_SUM, progress_callback: Optional[Callable[[int, int], None]] = None,
+                      background: bool = False) -> Tuple[BandSeries, Optional['pd.DataFrame'],
+                                                         Tuple[Optional[int], Optional[int]], Union[str, Future]]:
+        """
+        Integrated band intensities and line ratios of one run: time series, stability and export.
+
+        Args:
+            folder_path: Folder containing the run.
+            base_name: Base name of the run's files.
+            save_folder_path: Directory where the workbook and plot should be saved.
+            bands: (low, high) integration windows; the first one is used for activation detection.
+            ratios: Ratios of two windows.
+            threshold: Threshold for activation detection, in integrated units of the first window.
+            section_count: Number of sections for analysis.
+            activation: Activation detection settings (default: first jump above ``threshold``).
+            robust: Add the median, MAD, IQR and trimmed mean of every section.
+            method: ``INTEGRATE_SUM`` or ``INTEGRATE_TRAPEZOID``.
+            progress_callback: Called with (files read, total files).
+            background: Write the files on the export queue and return a future.
+
+        Returns:
+            Tuple of the series, the stability DataFrame (None if no activation
+            was found), the activation window and the plot path (or its future).
+        """
+        series = self.band_series(folder_path, base_name, bands, ratios, method, progress_callback)
+        stability_key = ('band_stability', self._band_key, threshold, section_count, activation, robust)
+        cached = self.cache.get(stability_key)
+        if cached is None:
+            try:
+                cached = self.band_stability(series, threshold, section_count, activation, robust)
+            except ValueError as e:
+                # 沒有啟動區間時仍輸出時間序列
+                logger.warning(str(e))
+                cached = (None, (None, None))
+            self.cache.put(stability_key, cached)
+        stability, window = cached
+
+        output_directory = self.prepare_output_directory(save_folder_path)
+        excel_name = os.path.join(output_directory, f"{base_name}_積分強度.xlsx")
+        plot_path = os.path.join(output_directory, f"{base_name}_band_integration.png")
+        output_path = self._export(stability_key + (base_name, output_directory), [excel_name, plot_path],
+                                   self._write_bands, series, stability, excel_name, plot_path, base_name,
+                                   background=background)
+        return series, stability, window, output_path
+
+    @staticmethod
+    def _write_bands(series: BandSeries, stability: Optional['pd.DataFrame'], excel_name: str,
+                     plot_path: str, title: str) -> str:
+        write_band_excel(series, excel_name, stability)
+        return render_band_plot(series, plot_path, title)
+
+    def analyze_folders(self, selected_folders, detect_wave: float, threshold: float, section_count: int,base_name: str, base_path: str, start_index: int) -> Dict[str, 'pd.DataFrame']:
         """分析多個資料夾並返回結果字典。"""
         analysis_results = {}
         
@@ -280,17 +1020,18 @@ class OESController:
             try:
                 logger.info(f"分析第 {index + 1} 筆資料夾: {folder}")
                 
-                # # 使用已存儲的參數
-                # base_name = self.base_names[folder]
-                # start_index = self.start_indices[folder]
-                # end_index = self.end_indices[folder]
+                # 結束序號依各資料夾實際的檔案範圍
+                run = next((r for r in self.discovery.scan(folder) if r.base_name == base_name), None)
+                if run is None:
+                    raise ValueError(f"No spectrum files of {base_name} found in {folder}")
 
                 # 加載和處理資料
                 self.load_and_process_data(
                     base_path=folder,
                     base_name=base_name,
                     start_index=start_index,
-                    # end_index=end_index
+                    end_index=run.end_index,
+                    wavelengths=[detect_wave]
                 )
 
                 # 調用原有的 analyze_data 方法進行分析
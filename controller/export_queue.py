@@ -0,0 +1,102 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 背景寫檔的執行緒數量（Excel 與圖檔可同時寫出）
+DEFAULT_EXPORT_WORKERS = 2
+
+
+class ExportQueue:
+    """
+    Background writer queue for result files (Excel workbooks, plots).
+
+    Jobs run on a small thread pool so writing overlaps with the remaining
+    computation, and ``submit`` returns a ``Future`` the caller can wait on or
+    attach callbacks to. Jobs writing the same output path run in submission
+    order, so the file on disk always comes from the last submitted job. A job
+    whose key is still pending is shared instead of being submitted twice.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_EXPORT_WORKERS):
+        """
+        Initialize the queue.
+
+        Args:
+            max_workers: Number of writer threads
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='oes-export')
+        self._lock = threading.Lock()
+        self._pending: Dict[Hashable, Future] = {}
+        self._last_writer: Dict[str, Future] = {}
+
+    @staticmethod
+    def completed(result: Any) -> Future:
+        """Return an already finished future holding ``result``."""
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def submit(self, key: Hashable, output_paths: List[str], fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queue a job that writes ``output_paths``.
+
+        Args:
+            key: Identity of the job (stage name plus inputs and parameters)
+            output_paths: Files the job writes
+            fn: Function doing the work; its return value becomes the future's result
+
+        Returns:
+            Future of the job
+        """
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            # 同一路徑的前一個寫入工作須先完成，確保檔案內容來自最後提交的工作
+            previous = [self._last_writer[path] for path in output_paths if path in self._last_writer]
+            future = self._executor.submit(self._run, previous, fn, args, kwargs)
+            self._pending[key] = future
+            for path in output_paths:
+                self._last_writer[path] = future
+        future.add_done_callback(lambda done: self._finished(key, output_paths, done))
+        return future
+
+    @staticmethod
+    def _run(previous: List[Future], fn: Callable, args, kwargs) -> Any:
+        wait(previous)
+        return fn(*args, **kwargs)
+
+    def _finished(self, key: Hashable, output_paths: List[str], future: Future) -> None:
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+            for path in output_paths:
+                if self._last_writer.get(path) is future:
+                    del self._last_writer[path]
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Export job {key[0] if isinstance(key, tuple) else key} failed: {future.exception()}")
+
+    @property
+    def pending_count(self) -> int:
+        """Number of jobs queued or running."""
+        with self._lock:
+            return len(self._pending)
+
+    def wait_all(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for every queued job.
+
+        Returns:
+            True if all jobs finished within ``timeout``
+        """
+        with self._lock:
+            futures = list(self._pending.values())
+        _, not_done = wait(futures, timeout=timeout)
+        return not not_done
+
+    def shutdown(self, wait_for_jobs: bool = True) -> None:
+        """Stop the writer threads, by default after the queued jobs finish."""
+        self._executor.shutdown(wait=wait_for_jobs)
@@ -0,0 +1,123 @@
+import os
+import sys
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 預設快取記憶體上限 (bytes)
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+
+def fingerprint_files(file_paths: List[str]) -> str:
+    """
+    Fingerprint a list of input files by path, size and modification time.
+
+    Args:
+        file_paths: Input files in analysis order
+
+    Returns:
+        Hex digest that changes whenever a file is added, removed or modified
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for file_path in file_paths:
+        try:
+            stat = os.stat(file_path)
+            entry = f"{file_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n"
+        except OSError:
+            entry = f"{file_path}\0missing\n"
+        digest.update(entry.encode('utf-8', errors='surrogateescape'))
+    return digest.hexdigest()
+
+
+def estimate_size(value: Any) -> int:
+    """Rough memory footprint of a cached value in bytes."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    # 未載入 pandas 時不可能是 DataFrame；背景執行緒可能正在載入 pandas，模組尚未完整
+    data_frame = getattr(sys.modules.get('pandas'), 'DataFrame', None)
+    if data_frame is not None and isinstance(value, data_frame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    LRU memoization cache for intermediate analysis results.
+
+    Entries are keyed by a stage name plus the fingerprint of the stage's
+    inputs (see ``fingerprint_files``) and its parameters. When the total
+    estimated size exceeds the memory budget, the least recently used entries
+    are evicted. The cache is thread-safe, since background export jobs
+    record their results from writer threads.
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        """
+        Initialize the cache.
+
+        Args:
+            memory_budget: Maximum total size of the cached values in bytes
+        """
+        self.memory_budget = memory_budget
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes = {}
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value (marking it recently used), or None."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting least recently used entries beyond the budget."""
+        size = estimate_size(value)
+        if size > self.memory_budget:
+            logger.info(f"Not caching {key[0] if isinstance(key, tuple) else key}: {size} bytes exceeds budget")
+            return
+        with self._lock:
+            self.discard(key)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self.total_size += size
+            while self.total_size > self.memory_budget:
+                oldest = next(iter(self._entries))
+                self.discard(oldest)
+
+    def discard(self, key: Hashable) -> None:
+        """Remove an entry if present."""
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+                self.total_size -= self._sizes.pop(key)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.total_size = 0
@@ -0,0 +1,224 @@
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+from model.preprocessing import SMOOTHING_MOVING_AVERAGE, moving_average
+
+logger = logging.getLogger(__name__)
+
+# 啟動偵測方法
+ACTIVATION_JUMP = 'jump'  # 相鄰兩點的跳變超過閾值（原始方法），下一次反向跳變結束
+ACTIVATION_HYSTERESIS = 'hysteresis'  # 強度高於基線 + 閾值開始，低於基線 + 閾值 x 釋放比例結束
+SMOOTHING_MEDIAN = 'median'
+
+Window = Tuple[Optional[int], Optional[int]]
+
+
+@dataclass(frozen=True)
+class ActivationConfig:
+    """Data class describing how plasma-on windows are detected in an intensity series."""
+    method: str = ACTIVATION_JUMP
+    smoothing: Optional[str] = None  # None、SMOOTHING_MOVING_AVERAGE 或 SMOOTHING_MEDIAN
+    smoothing_window: int = 5  # 平滑視窗點數（奇數）
+    release_ratio: float = 0.5  # 遲滯：結束門檻為閾值的此比例（跳變法不使用）
+    min_duration: int = 1  # 最短啟動長度（檔案數），較短的區間視為雜訊
+    multi_segment: bool = False  # 一次實驗中可有多個啟動區間
+
+
+DEFAULT_ACTIVATION = ActivationConfig()
+
+
+def pad_series(series: Sequence[Sequence[float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Stack series of different lengths into a NaN-padded matrix; returns (matrix, lengths)."""
+    lengths = np.array([len(values) for values in series], dtype=np.int64)
+    matrix = np.full((len(series), max(int(lengths.max(initial=0)), 2)), np.nan)
+    for row, values in enumerate(series):
+        matrix[row, :len(values)] = values
+    return matrix, lengths
+
+
+def smooth_series(matrix: np.ndarray, lengths: np.ndarray, method: Optional[str], window: int) -> np.ndarray:
+    """
+    Smooth every row of a padded series matrix.
+
+    The padding is filled with each row's last value before filtering, so the
+    end of a short series is treated like the end of the longest one, and set
+    back to NaN afterwards.
+    """
+    window = smoothing_span(method, window, matrix.shape[1])
+    if window == 1:
+        return matrix
+    inside = np.arange(matrix.shape[1]) < lengths[:, None]
+    last = matrix[np.arange(len(matrix)), np.maximum(lengths - 1, 0)]
+    filled = np.where(inside, matrix, last[:, None])
+    if method == SMOOTHING_MOVING_AVERAGE:
+        smoothed = moving_average(filled, window)
+    elif method == SMOOTHING_MEDIAN:
+        half = window // 2
+        padded = np.pad(filled, ((0, 0), (half, half)), mode='edge')
+        smoothed = np.median(np.lib.stride_tricks.sliding_window_view(padded, window, axis=1), axis=2)
+    else:
+        raise ValueError(f"Unknown smoothing method: {method}")
+    return np.where(inside, smoothed, np.nan)
+
+
+def smoothing_span(method: Optional[str], window: int, length: int) -> int:
+    """Number of samples a smoothing filter averages over (1 without smoothing), as used by ``smooth_series``."""
+    if method is None or window <= 1:
+        return 1
+    return min(int(window) | 1, length | 1)
+
+
+def state_segments(on: np.ndarray, off: np.ndarray, lengths: np.ndarray,
+                   min_duration: int) -> List[List[Tuple[int, Optional[int]]]]:
+    """
+    Segments of every row from the samples that switch the state on or off.
+
+    Between switching samples the previous state is kept (on wins where a
+    sample switches both ways). The state of every sample is found at once
+    by forward-filling the switching samples.
+
+    Returns:
+        Per row, the (start index, end index) of each segment at least
+        ``min_duration`` samples long; the end is None for a segment still on
+        at the end of the series
+    """
+    decided = on | off
+    # 向前填補：每個位置沿用最近一次切換時的狀態，開頭之前為關閉
+    columns = np.arange(on.shape[1])
+    last_decided = np.maximum.accumulate(np.where(decided, columns, -1), axis=1)
+    state = np.where(last_decided >= 0, np.take_along_axis(on, np.maximum(last_decided, 0), axis=1), False)
+
+    edges = np.diff(np.pad(state.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    start_rows, start_cols = np.nonzero(edges == 1)
+    _, end_cols = np.nonzero(edges == -1)
+    segments: List[List[Tuple[int, Optional[int]]]] = [[] for _ in range(len(on))]
+    for row, start, end in zip(start_rows.tolist(), start_cols.tolist(), end_cols.tolist()):
+        if end - start < min_duration:
+            continue
+        segments[row].append((start, end if end < lengths[row] else None))
+    return segments
+
+
+def jump_segments(matrix: np.ndarray, lengths: np.ndarray, threshold: float, min_duration: int,
+                  span: int = 1) -> List[List[Tuple[int, Optional[int]]]]:
+    """
+    Plasma-on segments of every row from jumps between neighbouring samples.
+
+    A segment starts after a rise above ``threshold`` and ends after the next
+    drop below ``-threshold``. The first segment is the original jump window.
+
+    Args:
+        span: Samples averaged by the moving-average smoothing; the
+            difference of neighbouring averages is scaled by it, so it is the
+            change across the window and a step is compared with
+            ``threshold`` as it is without smoothing
+
+    Returns:
+        Per row, the (start index, end index) of each segment at least
+        ``min_duration`` samples long; the end is None for a segment still on
+        at the end of the series
+    """
+    diff = np.diff(matrix, axis=1) * span  # 補值的 NaN 比較結果為 False
+    # 跳變發生在第 j 與 j+1 點之間，狀態從第 j+1 點起改變
+    rise = np.pad(diff > threshold, ((0, 0), (1, 0)))
+    fall = np.pad(diff < -threshold, ((0, 0), (1, 0)))
+    return state_segments(rise, fall, lengths, min_duration)
+
+
+def hysteresis_segments(matrix: np.ndarray, lengths: np.ndarray, threshold: float, release_ratio: float,
+                        min_duration: int) -> List[List[Tuple[int, Optional[int]]]]:
+    """
+    Plasma-on segments of every row with two-level (hysteresis) thresholds.
+
+    A segment starts where the intensity rises above the row's baseline (its
+    minimum) plus ``threshold`` and ends where it falls below the baseline
+    plus ``threshold * release_ratio``; between the two levels the previous
+    state is kept, so noise around one level cannot toggle the state.
+
+    Returns:
+        Per row, the (start index, end index) of each segment at least
+        ``min_duration`` samples long; the end is None for a segment still on
+        at the end of the series
+    """
+    with np.errstate(invalid='ignore'):
+        baseline = np.min(np.where(np.isnan(matrix), np.inf, matrix), axis=1, keepdims=True)
+        on = matrix > baseline + threshold
+        off = ~(matrix > baseline + threshold * release_ratio)  # NaN 補值視為關閉
+    return state_segments(on, off, lengths, min_duration)
+
+
+class ActivationDetector:
+    """
+    Detects the activation (plasma-on) windows of many intensity series at once.
+
+    All series are padded into one matrix, smoothed and thresholded with
+    whole-matrix numpy operations; only the final segment lists are built
+    per series.
+    """
+
+    def __init__(self, config: Optional[ActivationConfig] = None):
+        """
+        Initialize the detector.
+
+        Args:
+            config: Detection settings (default: the original jump detection)
+        """
+        self.config = config or DEFAULT_ACTIVATION
+
+    def _indices(self, series: Sequence[Sequence[float]], threshold: float) -> List[List[Tuple[int, Optional[int]]]]:
+        config = self.config
+        matrix, lengths = pad_series(series)
+        matrix = smooth_series(matrix, lengths, config.smoothing, config.smoothing_window)
+        if config.method == ACTIVATION_JUMP:
+            # 移動平均會把跳變攤平在視窗內，相鄰差值乘上視窗點數後才與閾值比較
+            span = (smoothing_span(config.smoothing, config.smoothing_window, matrix.shape[1])
+                    if config.smoothing == SMOOTHING_MOVING_AVERAGE else 1)
+            return jump_segments(matrix, lengths, threshold, config.min_duration, span)
+        if config.method == ACTIVATION_HYSTERESIS:
+            return hysteresis_segments(matrix, lengths, threshold, config.release_ratio, config.min_duration)
+        raise ValueError(f"Unknown activation method: {config.method}")
+
+    def segments(self, series: Sequence[Sequence[float]], threshold: float,
+                 start_indices: Sequence[int]) -> List[List[Tuple[int, int]]]:
+        """
+        Completed activation segments of every series.
+
+        Only the first segment is kept unless ``multi_segment`` is set, and a
+        segment without an end is dropped.
+
+        Returns:
+            Per series, the (activation time, end time) file indices of each segment
+        """
+        if not series:
+            return []
+        result = []
+        for found, start_index in zip(self._indices(series, threshold), start_indices):
+            if not self.config.multi_segment:
+                found = found[:1]
+            result.append([(start + start_index, end + start_index) for start, end in found if end is not None])
+        return result
+
+    def windows(self, series: Sequence[Sequence[float]], threshold: float,
+                start_indices: Sequence[int]) -> List[Window]:
+        """
+        Overall activation window of every series.
+
+        Returns:
+            (activation time, end time) per series: the first segment, or from
+            the first start to the last end with ``multi_segment``; None where
+            not found
+        """
+        if not series:
+            return []
+        windows = []
+        for found, start_index in zip(self._indices(series, threshold), start_indices):
+            if self.config.multi_segment:
+                found = [segment for segment in found if segment[1] is not None] or found[:1]
+            if not found:
+                windows.append((None, None))
+                continue
+            end = found[-1][1] if self.config.multi_segment else found[0][1]
+            windows.append((found[0][0] + start_index, end + start_index if end is not None else None))
+        return windows
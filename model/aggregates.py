@@ -0,0 +1,154 @@
+import copy
+import numpy as np
+
+
+class SpectralAggregates:
+    """
+    Running per-wavelength aggregates over a stream of spectra.
+
+    Spectra are folded in chunk by chunk (``update``), so only the aggregates
+    are kept in memory: per-wavelength count, minimum, maximum, the file id of
+    the first minimum/maximum, and the sums needed for mean and std. This is
+    everything the significant-difference, peak and envelope computations
+    need, independent of how many files the run has.
+    """
+
+    def __init__(self, wavelengths: np.ndarray = None):
+        """
+        Initialize empty aggregates.
+
+        Args:
+            wavelengths: Sorted wavelength grid; extended automatically when
+                spectra with additional wavelengths are folded in
+        """
+        self.wavelengths = np.empty(0) if wavelengths is None else np.asarray(wavelengths, dtype=float)
+        n = len(self.wavelengths)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.minimum = np.full(n, np.inf)
+        self.maximum = np.full(n, -np.inf)
+        self.argmin = np.full(n, -1, dtype=np.int64)
+        self.argmax = np.full(n, -1, dtype=np.int64)
+        self.total = np.zeros(n)
+        self.total_sq = np.zeros(n)
+        self.file_count = 0
+
+    def __len__(self) -> int:
+        return len(self.wavelengths)
+
+    @property
+    def present(self) -> np.ndarray:
+        """Boolean mask of wavelengths measured in at least one spectrum."""
+        return self.count > 0
+
+    @property
+    def range(self) -> np.ndarray:
+        """Per-wavelength ``maximum - minimum``."""
+        return self.maximum - self.minimum
+
+    @property
+    def mean(self) -> np.ndarray:
+        """Per-wavelength mean intensity."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.total / self.count
+
+    @property
+    def std(self) -> np.ndarray:
+        """Per-wavelength population standard deviation (same as ``np.std``)."""
+        mean = self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(np.maximum(self.total_sq / self.count - mean * mean, 0.0))
+
+    def masked(self, threshold: float) -> 'SpectralAggregates':
+        """
+        Return a view with every measurement below ``threshold`` treated as 0.
+
+        The raw aggregates are left untouched, so the threshold can be changed
+        without re-reading the files. Since masking maps values below the
+        threshold to 0, the masked maximum is the raw maximum where it reaches
+        the threshold and 0 elsewhere (likewise for the minimum).
+
+        Args:
+            threshold: Intensity threshold
+
+        Returns:
+            Shallow copy sharing all arrays except minimum/maximum
+        """
+        view = copy.copy(self)
+        view.maximum = np.where(self.maximum < threshold, 0.0, self.maximum)
+        view.minimum = np.where(self.minimum < threshold, 0.0, self.minimum)
+        return view
+
+    def _align(self, wavelengths: np.ndarray) -> np.ndarray:
+        """Return the grid columns of ``wavelengths``, extending the grid if needed."""
+        if np.array_equal(wavelengths, self.wavelengths):
+            return np.arange(len(self.wavelengths))
+        grid = np.union1d(self.wavelengths, wavelengths)
+        if len(grid) != len(self.wavelengths):
+            old_cols = np.searchsorted(grid, self.wavelengths)
+            for name, fill in (('count', 0), ('minimum', np.inf), ('maximum', -np.inf),
+                               ('argmin', -1), ('argmax', -1), ('total', 0.0), ('total_sq', 0.0)):
+                old = getattr(self, name)
+                new = np.full(len(grid), fill, dtype=old.dtype)
+                new[old_cols] = old
+                setattr(self, name, new)
+            self.wavelengths = grid
+        return np.searchsorted(self.wavelengths, wavelengths)
+
+    def _fold(self, cols, count, minimum, argmin, maximum, argmax, total, total_sq):
+        # 只有嚴格更大/更小時才取代，保留檔案順序中第一個出現的極值
+        lower = minimum < self.minimum[cols]
+        self.minimum[cols] = np.where(lower, minimum, self.minimum[cols])
+        self.argmin[cols] = np.where(lower, argmin, self.argmin[cols])
+        higher = maximum > self.maximum[cols]
+        self.maximum[cols] = np.where(higher, maximum, self.maximum[cols])
+        self.argmax[cols] = np.where(higher, argmax, self.argmax[cols])
+        self.count[cols] += count
+        self.total[cols] += total
+        self.total_sq[cols] += total_sq
+
+    def update(self, file_ids: np.ndarray, wavelengths: np.ndarray, block: np.ndarray) -> None:
+        """
+        Fold a chunk of spectra into the aggregates.
+
+        Args:
+            file_ids: File id of every row of ``block``, in file order
+            wavelengths: Sorted wavelengths of the columns of ``block``
+            block: Intensity matrix (files x wavelengths), NaN where a file
+                has no value for a wavelength
+        """
+        if len(file_ids) == 0:
+            return
+        file_ids = np.asarray(file_ids)
+        cols = self._align(np.asarray(wavelengths, dtype=float))
+        missing = np.isnan(block)
+        if missing.any():
+            present = ~missing
+            count = present.sum(axis=0)
+            low = np.where(present, block, np.inf)
+            high = np.where(present, block, -np.inf)
+            values = np.where(present, block, 0.0)
+        else:
+            count = np.full(block.shape[1], block.shape[0], dtype=np.int64)
+            low = high = values = block
+        argmin = low.argmin(axis=0)
+        argmax = high.argmax(axis=0)
+        columns = np.arange(block.shape[1])
+        self._fold(cols, count,
+                   low[argmin, columns], file_ids[argmin],
+                   high[argmax, columns], file_ids[argmax],
+                   values.sum(axis=0), np.square(values).sum(axis=0))
+        self.file_count += len(file_ids)
+
+    def merge(self, other: 'SpectralAggregates') -> None:
+        """
+        Fold another set of aggregates (covering later files) into this one.
+
+        Args:
+            other: Aggregates whose file ids come after the files of ``self``
+        """
+        if len(other) == 0:
+            return
+        cols = self._align(other.wavelengths)
+        self._fold(cols, other.count, other.minimum, other.argmin,
+                   other.maximum, other.argmax, other.total, other.total_sq)
+        self.file_count += other.file_count
@@ -1,10 +1,24 @@
 import os
-from typing import List, Dict, Tuple, Optional, Callable
+from typing import Collection, List, Dict, Tuple, Optional, Callable, Union, TYPE_CHECKING
 import logging
+from collections import deque
 from dataclasses import dataclass
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from model.file_table import FileTable
+from model.aggregates import SpectralAggregates
+from model.preprocessing import PreprocessConfig, SpectrumPreprocessor
+from model.spectrum_format import FormatRegistry
+from model.activation import ActivationConfig, ActivationDetector
+from model.threshold_sweep import DEFAULT_SWEEP_POINTS, ThresholdSweep, sweep_thresholds
+from model.quality import (QUALITY_UNREADABLE, FlaggedSpectrum, QualityConfig, flag_run_checks, flag_spectra,
+                           run_scores)
+from model.robust_stats import DEFAULT_TRIM, ROBUST_COLUMNS, robust_section_statistics
+from model.ranking import (DEFAULT_TOP_K, MARKED_PEAKS, RANK_BY_MAXIMUM, RANK_BY_RANGE, RankedBand,
+                           spaced_top_k, top_k)
+
+# pandas 與 matplotlib 載入較慢，只在匯出與繪圖時才載入
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Configure logging
 logging.basicConfig(
@@ -13,6 +27,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 分塊處理時每個區塊的檔案數，限制記憶體用量與執行長度無關
+DEFAULT_CHUNK_SIZE = 256
+
+# 穩定度分析的譜線：單一波長，或 (下限, 上限) 波長範圍（範圍內強度加總）
+Line = Union[float, Tuple[float, float]]
+
 @dataclass
 class SpectralData:
     """Data class for storing spectral measurement data."""
@@ -31,6 +51,18 @@ class OESAnalyzer:
         """Initialize the OES Analyzer."""
         self._all_data: Dict[float, List[float]] = {}
         self.selected_files = []  # 初始化 selected_files 屬性
+        self.file_table = FileTable()  # file id -> 路徑、序號、修改時間
+        self.aggregates: Optional[SpectralAggregates] = None
+        self.intensity_threshold: Optional[float] = None  # 低強度過濾閾值（不修改原始數據）
+        self._chunk_aggregates: Dict[tuple, tuple] = {}  # (起始位置, 前處理, 品質檢查, 區塊檔案簽章) -> (區塊統計量, 異常光譜, 品質篩選量)
+        # 部分波長讀取的快取：('file_series', 路徑, 簽章) -> (讀取的波長, {波長: 強度})；
+        # 需提供 get/put 並自行限制記憶體（例如 controller 的 ResultCache），None 表示不快取
+        self.series_cache = None
+        self._preprocessor: Optional[SpectrumPreprocessor] = None  # 暗電流、基線與平滑前處理
+        self.formats = FormatRegistry()  # 每個資料夾偵測一次編碼、分隔符號與小數點
+        self._preprocess_key: Optional[tuple] = None
+        self.quality: Optional[QualityConfig] = None  # 讀取時的光譜品質檢查，None 表示不檢查
+        self.quality_report: List[FlaggedSpectrum] = []  # 最近一次 gather_values 標記的異常光譜
         logger.info("OES Analyzer initialized")
 
     @staticmethod
@@ -60,18 +92,8 @@ class OESAnalyzer:
             List of SpectralData objects containing time points and intensities
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                contents = file.readlines()
-
-            data = []
-            for line in contents:
-                if ';' in line:
-                    try:
-                        time_point, intensity = map(float, line.strip().split(';'))
-                        data.append(SpectralData(time_point, intensity))
-                    except ValueError as e:
-                        logger.warning(f"Skipping invalid line in {file_path}: {e}")
-                        continue
+            waves, intensities = self.formats.parse(file_path)
+            data = [SpectralData(time_point, intensity) for time_point, intensity in zip(waves.tolist(), intensities.tolist())]
 
             logger.debug(f"Successfully read {len(data)} data points from {file_path}")
             return data
@@ -80,132 +102,466 @@ class OESAnalyzer:
             logger.error(f"Error reading file {file_path}: {e}")
             raise
 
-    def read_file_to_data(self, file_names: List[str], base_path: str) -> Dict[float, List[float]]:
+    def read_file_to_data(self, file_names: List[str], base_path: str,
+                          wavelengths: Optional[List[float]] = None) -> Dict[float, List[float]]:
         """
         Read all files and store data.
 
         Args:
             file_names: List of file names to process
             base_path: Base path for the files
+            wavelengths: Only keep these wavelengths (default: keep all). Keeping
+                only the analyzed wavelengths bounds memory for long runs.
 
         Returns:
             Dictionary mapping time points to lists of intensity values
         """
         self._all_data.clear()
+        wanted = frozenset(wavelengths) if wavelengths is not None else None
+        parsed = 0
 
         for file_name in file_names:
             try:
                 file_path = os.path.join(base_path, file_name)
-                data = self.read_data(file_path)
-
-                for spectral_data in data:
-                    if spectral_data.time_point not in self._all_data:
-                        self._all_data[spectral_data.time_point] = []
-                    self._all_data[spectral_data.time_point].append(spectral_data.intensity)
+                if wanted is not None:
+                    # 只保留部分波長時，未變動檔案直接沿用上次讀取的值
+                    key = ('file_series', file_path, self._file_signature(file_path))
+                    cached = self.series_cache.get(key) if self.series_cache is not None else None
+                    if cached is not None and wanted <= cached[0]:
+                        file_values = cached[1]
+                    else:
+                        waves, intensities = self.formats.parse(file_path)
+                        keep = np.isin(waves, list(wanted))
+                        file_values = dict(zip(waves[keep].tolist(), intensities[keep].tolist()))
+                        if self.series_cache is not None:
+                            self.series_cache.put(key, (wanted, file_values))
+                        parsed += 1
+                    for time_point, intensity in file_values.items():
+                        if time_point in wanted:
+                            self._all_data.setdefault(time_point, []).append(intensity)
+                    continue
+
+                waves, intensities = self.formats.parse(file_path)
+                parsed += 1
+
+                for time_point, intensity in zip(waves.tolist(), intensities.tolist()):
+                    if time_point not in self._all_data:
+                        self._all_data[time_point] = []
+                    self._all_data[time_point].append(intensity)
             
             except Exception as e:
                 logger.error(f"Error processing file {file_name}: {e}")
                 continue
 
-        logger.info(f"Processed {len(file_names)} files with {len(self._all_data)} time points")
+        logger.info(f"Processed {len(file_names)} files ({parsed} parsed) with {len(self._all_data)} time points")
         return self._all_data
     
     def set_files(self, file_paths: List[str]):
-        """設置要分析的文件列表"""
+        """設置要分析的文件列表，並清除先前收集的數據"""
         self.selected_files = file_paths
+        self.aggregates = None
+
+    def set_preprocessing(self, config: Optional[PreprocessConfig]) -> None:
+        """
+        Set the preprocessing applied to every chunk of spectra before aggregation.
+
+        Args:
+            config: Preprocessing configuration, or None for raw counts
+        """
+        if config is None or config.is_identity:
+            self._preprocessor = None
+            self._preprocess_key = None
+            return
+        dark_spectrum = self.read_values_by_line(config.dark_frame) if config.dark_frame else None
+        self._preprocessor = SpectrumPreprocessor(config, dark_spectrum)
+        self._preprocess_key = config.cache_key()
+
+    def set_quality(self, config: Optional[QualityConfig]) -> None:
+        """
+        Set the quality checks applied to every chunk of spectra before aggregation.
+
+        Args:
+            config: Check limits, or None to take every readable spectrum as is
+        """
+        self.quality = config
 
     def read_values_by_line(self, file_path: str) -> Dict[float, float]:
-        """讀取單個文件中的value和測量值"""
-        values = {}
+        """讀取單個文件中的value和測量值（格式依資料夾自動偵測）"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                for line in file:
-                    parts = line.strip().split(';')
-                    if len(parts) > 1:
-                        try:
-                            value = float(parts[0])
-                            if value >= 195.0:
-                                values[value] = float(parts[1])
-                        except ValueError:
-                            logger.info(f"Skipping line due to ValueError: {line.strip()}")
+            waves, intensities = self.formats.parse(file_path)
+            keep = waves >= 195.0
+            return dict(zip(waves[keep].tolist(), intensities[keep].tolist()))
         except FileNotFoundError:
             logger.info(f"The file at {file_path} was not found.")
         except Exception as e:
             logger.info(f"An error occurred: {e}")
-        return values
+        return {}
     
-    def gather_values(self) -> Dict:
-        """收集所有文件的數據"""
-        self.all_values = {}
-        for file_path in self.selected_files:
+    @staticmethod
+    def stack_spectra(spectra: List[Dict[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Stack per-file {wavelength: intensity} dicts into one intensity matrix.
+
+        Args:
+            spectra: One dict per file, as returned by read_values_by_line
+
+        Returns:
+            Tuple of the sorted wavelengths and the (files x wavelengths)
+            intensity matrix, NaN where a file has no value for a wavelength
+        """
+        keys = list(spectra[0])
+        if all(len(values) == len(keys) and list(values) == keys for values in spectra):
+            # 常見情況：所有檔案的波長格點相同
+            wavelengths = np.asarray(keys, dtype=float)
+            block = np.array([list(values.values()) for values in spectra], dtype=float)
+            order = np.argsort(wavelengths, kind='stable')
+            return wavelengths[order], block[:, order]
+
+        wavelengths = np.unique(np.concatenate([np.fromiter(values, dtype=float, count=len(values)) for values in spectra]))
+        block = np.full((len(spectra), len(wavelengths)), np.nan)
+        for row, values in enumerate(spectra):
+            cols = np.searchsorted(wavelengths, np.fromiter(values, dtype=float, count=len(values)))
+            block[row, cols] = np.fromiter(values.values(), dtype=float, count=len(values))
+        return wavelengths, block
+
+    @staticmethod
+    def _file_signature(file_path: str) -> Tuple[int, int]:
+        """回傳檔案的 (大小, 修改時間 ns)，檔案不存在時為 (-1, -1)"""
+        try:
+            stat = os.stat(file_path)
+            return stat.st_size, stat.st_mtime_ns
+        except OSError:
+            return -1, -1
+
+    def read_chunk(self, file_paths: List[str], first_file_id: int = 0,
+                   report: Optional[List[FlaggedSpectrum]] = None,
+                   screened: Optional[list] = None,
+                   excluded: Collection[int] = ()) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Read one chunk of files into an intensity matrix.
+
+        With quality checks set (``set_quality``) every spectrum is screened
+        on its raw counts with the per-file checks; flagged spectra are
+        dropped when the checks exclude. The missing-wavelength and
+        total-intensity checks compare a file with the rest of the run and
+        are done by the caller over the whole run.
+
+        Args:
+            file_paths: Files of the chunk, in time order
+            first_file_id: File id of the first file; file ids are consecutive
+            report: Receives the spectra that failed the per-file checks
+            screened: Receives (file ids, paths, measures) of the screened spectra
+            excluded: File ids to drop as well (failures of the whole-run checks)
+
+        Returns:
+            Tuple of (file ids, sorted wavelengths, intensity matrix), or None
+            if no file of the chunk contains valid data
+        """
+        file_ids = []
+        spectra = []
+        for offset, file_path in enumerate(file_paths):
             file_values = self.read_values_by_line(file_path)
             if not file_values:
                 logger.info(f"No valid data found in {file_path}")
+                if self.quality is not None and report is not None:
+                    report.append(FlaggedSpectrum(first_file_id + offset, file_path,
+                                                  (QUALITY_UNREADABLE,), excluded=True))
                 continue
-            for value, measurement in file_values.items():
-                if value not in self.all_values:
-                    self.all_values[value] = []
-                self.all_values[value].append((os.path.basename(file_path), measurement))
-        # logger.info(self.all_values)
-        return self.all_values
-
-    def find_peak_points(self, data: Dict[float, List[Tuple[str, float]]]) -> List[dict]:
-        """找出每個波段的最高點"""
+            file_ids.append(first_file_id + offset)
+            spectra.append(file_values)
+        if not spectra:
+            return None
+        wavelengths, block = self.stack_spectra(spectra)
+        if self.quality is not None:
+            # 品質檢查使用原始強度（前處理前），飽和值才有意義
+            paths = [file_paths[i - first_file_id] for i in file_ids]
+            keep, flagged, measures = flag_spectra(file_ids, paths, block, self.quality)
+            if report is not None:
+                report.extend(flagged)
+            if screened is not None:
+                screened.append((np.asarray(file_ids, dtype=np.int64), paths, measures))
+            if excluded:
+                keep &= ~np.isin(file_ids, list(excluded))
+            if not keep.all():
+                file_ids = [file_id for file_id, kept in zip(file_ids, keep) if kept]
+                block = block[keep]
+                if not file_ids:
+                    return None
+        if self._preprocessor is not None:
+            block = self._preprocessor.apply(wavelengths, block)
+        return np.asarray(file_ids, dtype=np.int64), wavelengths, block
+
+    @staticmethod
+    def _join_screened(screened: list) -> Tuple[np.ndarray, List[str], Dict[str, np.ndarray]]:
+        """Concatenate the (file ids, paths, measures) of several chunks."""
+        if not screened:
+            return np.empty(0, dtype=np.int64), [], {'total': np.empty(0), 'count': np.empty(0),
+                                                     'saturated_fraction': np.empty(0)}
+        file_ids = np.concatenate([ids for ids, _, _ in screened])
+        paths = [path for _, chunk_paths, _ in screened for path in chunk_paths]
+        measures = {name: np.concatenate([chunk[name] for _, _, chunk in screened]) for name in screened[0][2]}
+        return file_ids, paths, measures
+
+    def iter_spectra_chunks(self, file_paths: List[str], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Read files in fixed-size chunks.
+
+        When the quality checks exclude, the whole-run checks are applied as
+        well. The total-intensity z-score needs the neighbouring files, so
+        the chunks are read ahead until ``neighbour_window`` usable totals
+        follow the current chunk, and the previous ``neighbour_window`` usable
+        totals are kept; the scores are the same as over the whole run at
+        once. Missing wavelengths are counted against the fullest spectrum
+        read so far (read-ahead included).
+
+        Args:
+            file_paths: Files to read, in time order; the file id of a file is
+                its position in this list
+            chunk_size: Number of files per chunk
+
+        Yields:
+            Tuples of (file ids, sorted wavelengths, intensity matrix) per chunk
+        """
+        if self.quality is None or not self.quality.exclude:
+            for start in range(0, len(file_paths), chunk_size):
+                chunk = self.read_chunk(file_paths[start:start + chunk_size], start)
+                if chunk is not None:
+                    yield chunk
+            return
+
+        window = self.quality.neighbour_window | 1
+        starts = iter(range(0, len(file_paths), chunk_size))
+        pending = deque()  # 已讀取、尚未輸出的 (區塊, 篩選結果)
+        before = np.empty(0)  # 目前區塊之前的可用總強度（最多 window 個）
+        full_count = 0.0  # 目前讀到波長最多的光譜
+
+        def read_next() -> bool:
+            nonlocal full_count
+            start = next(starts, None)
+            if start is None:
+                return False
+            screened = []
+            chunk = self.read_chunk(file_paths[start:start + chunk_size], start, screened=screened)
+            screened = self._join_screened(screened)
+            full_count = max(full_count, float(screened[2]['count'].max(initial=0)))
+            pending.append((chunk, screened))
+            return True
+
+        def usable_after() -> np.ndarray:
+            totals = np.concatenate([measures['total'] for _, (_, _, measures) in list(pending)[1:]] or [np.empty(0)])
+            return totals[~np.isnan(totals)]
+
+        more = read_next()
+        while pending:
+            # 讀到目前區塊之後至少有 window 個可用總強度，或已讀完
+            while more and len(usable_after()) < window:
+                more = read_next()
+            after = usable_after()[:window]
+            chunk, (file_ids, paths, measures) = pending.popleft()
+            totals = measures['total']
+            context = {'total': np.concatenate([before, totals, after]),
+                       'count': np.concatenate([np.zeros(len(before)), measures['count'], np.zeros(len(after))])}
+            scores = {name: values[len(before):len(before) + len(totals)]
+                      for name, values in run_scores(context, self.quality, full_count).items()}
+            before = np.concatenate([before, totals[~np.isnan(totals)]])[-window:]
+            if chunk is None:
+                continue
+            _, failed = flag_run_checks(file_ids, paths, measures, scores, [], self.quality)
+            if failed:
+                keep = ~np.isin(chunk[0], failed)
+                if not keep.any():
+                    continue
+                chunk = (chunk[0][keep], chunk[1], chunk[2][keep])
+            yield chunk
+
+    def gather_values(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> SpectralAggregates:
+        """
+        收集所有文件的數據，分塊讀取並只保留每個波段的累計統計量。
+
+        每個區塊的統計量會依檔案簽章（大小、修改時間）與前處理設定保留，重新分析時
+        只讀取含有新增或變動檔案的區塊，其餘區塊直接合併，成本與變動量成正比。
+        設定品質檢查時（set_quality），未通過的光譜記錄於 quality_report，並可排除於統計量之外。
+        缺少波長與總強度異常在所有區塊讀完後以整個實驗判斷，結果與分塊大小無關；排除時只重新
+        讀取含有這些光譜的區塊。
+        """
+        self.file_table = FileTable()
+        signatures = []
+        for file_path in self.selected_files:
+            signature = self._file_signature(file_path)
+            signatures.append(signature)
+            self.file_table.add(file_path, max(signature[1], 0) / 1e9)
+
+        previous = self._chunk_aggregates
+        self._chunk_aggregates = {}
+        self.aggregates = SpectralAggregates()
+        self.quality_report = []
+        parsed = 0
+        partials = []
+        flagged = []
+        screened = []
+        for start in range(0, len(self.selected_files), chunk_size):
+            chunk_files = self.selected_files[start:start + chunk_size]
+            key = (start, self._preprocess_key, self.quality, tuple(zip(chunk_files, signatures[start:start + chunk_size])))
+            cached = previous.get(key)
+            if cached is None:
+                partial = SpectralAggregates()
+                chunk_flagged = []
+                chunk_screened = []
+                chunk = self.read_chunk(chunk_files, start, chunk_flagged, chunk_screened)
+                if chunk is not None:
+                    partial.update(*chunk)
+                parsed += len(chunk_files)
+            else:
+                partial, chunk_flagged, chunk_screened = cached
+            self._chunk_aggregates[key] = (partial, chunk_flagged, chunk_screened)
+            partials.append((key, partial))
+            flagged.extend(chunk_flagged)
+            screened.extend(chunk_screened)
+
+        if self.quality is not None:
+            file_ids, paths, measures = self._join_screened(screened)
+            self.quality_report, failed = flag_run_checks(
+                file_ids, paths, measures, run_scores(measures, self.quality), flagged, self.quality)
+            if failed and self.quality.exclude:
+                # 含有未通過整體檢查光譜的區塊重新讀取，不納入這些光譜
+                for index, (key, partial) in enumerate(partials):
+                    start = key[0]
+                    chunk_failed = tuple(file_id for file_id in failed if start <= file_id < start + chunk_size)
+                    if not chunk_failed:
+                        continue
+                    excluded_key = key + (chunk_failed,)
+                    cached = previous.get(excluded_key)
+                    if cached is None:
+                        partial = SpectralAggregates()
+                        chunk_files = self.selected_files[start:start + chunk_size]
+                        chunk = self.read_chunk(chunk_files, start, excluded=chunk_failed)
+                        if chunk is not None:
+                            partial.update(*chunk)
+                        parsed += len(chunk_files)
+                        cached = (partial, [], [])
+                    self._chunk_aggregates[excluded_key] = cached
+                    partials[index] = (key, cached[0])
+        for _, partial in partials:
+            self.aggregates.merge(partial)
+        if self.quality_report:
+            excluded = sum(flag.excluded for flag in self.quality_report)
+            logger.warning(f"{len(self.quality_report)} spectra failed the quality checks ({excluded} excluded)")
+        logger.info(f"Gathered {self.aggregates.file_count} files ({parsed} parsed) with {len(self.aggregates)} wavelengths")
+        return self.aggregates
+
+    def find_peak_points(self, data: SpectralAggregates, limit: Optional[int] = None,
+                         min_distance: Optional[float] = None, mask: Optional[np.ndarray] = None) -> List[dict]:
+        """
+        找出每個波段的最高點，按最大值由大到小排序。
+
+        指定 limit 時只選出前 limit 強的波段（argpartition，不排序全部波段）；
+        指定 min_distance 時跳過與已選波段距離不超過 min_distance 的波段，
+        結果與全波段圖標註峰值的規則相同。
+        """
+        keep = data.present if mask is None else data.present & mask
+        limit = len(data) if limit is None else limit
+        if min_distance is None:
+            selected = top_k(data.maximum, limit, keep)
+        else:
+            selected = spaced_top_k(data.wavelengths, data.maximum, limit, min_distance, keep)
         peak_points = []
-        for value, measurements in data.items():
-            measurements_only = [m[1] for m in measurements]
-            max_value = max(measurements_only)
-            max_index = measurements_only.index(max_value)
-            file_name = measurements[max_index][0]
-            
+        for value, max_value, file_id in zip(data.wavelengths[selected].tolist(),
+                                             data.maximum[selected].tolist(),
+                                             data.argmax[selected].tolist()):
             peak_points.append({
                 '波段': value,
                 '最大值': max_value,
-                '檔案名': file_name,
-                '時間點': file_name.split('S')[-1].split('.')[0]
+                '檔案名': self.file_table.name(file_id),
+                '時間點': self.file_table.time_point(file_id)
             })
-        # logger.info(peak_points)
-        # 按最大值排序
-        return sorted(peak_points, key=lambda x: x['最大值'], reverse=True)
+        return peak_points
+
+    def rank_bands(self, k: int = DEFAULT_TOP_K, by: str = RANK_BY_MAXIMUM, run: str = '') -> List[RankedBand]:
+        """
+        Top ``k`` wavebands of the gathered data.
+
+        Args:
+            k: Number of wavebands
+            by: RANK_BY_MAXIMUM (largest intensity) or RANK_BY_RANGE (largest max - min)
+            run: Run label stored in every band, for merging rankings of several runs
+
+        Returns:
+            Ranked bands, largest value first
+        """
+        data = self.aggregates
+        if by == RANK_BY_MAXIMUM:
+            scores = data.maximum
+        elif by == RANK_BY_RANGE:
+            scores = np.abs(data.range)
+        else:
+            raise ValueError(f"Unknown ranking: {by}")
+        selected = top_k(scores, k, data.present)
+        return [RankedBand(wavelength, value, self.file_table.name(file_id), self.file_table.time_point(file_id), run)
+                for wavelength, value, file_id in zip(data.wavelengths[selected].tolist(),
+                                                      scores[selected].tolist(),
+                                                      data.argmax[selected].tolist())]
     
+    def _differences(self, mask: np.ndarray, threshold: float) -> List[Tuple[float, float, float, int]]:
+        """回傳遮罩內差值超過閾值的 (波段, 最小值, 最大值, 最大值檔案 id)"""
+        data = self.aggregates
+        selected = np.flatnonzero(mask & data.present & (np.abs(data.range) > threshold))
+        return list(zip(data.wavelengths[selected].tolist(),
+                        data.minimum[selected].tolist(),
+                        data.maximum[selected].tolist(),
+                        data.argmax[selected].tolist()))
+
     def find_specific_wavebands_differences(self, wavebands: List[float], threshold: float = 200) -> Dict:
         """分析特定波段的差異"""
         specific_differences = {}
-        for value, measurements in self.all_values.items():
-            # logger.info(value,measurements)
-            if value in wavebands:
-                measurements_only = [m[1] for m in measurements]
-                min_measurement = min(measurements_only)
-                max_measurement = max(measurements_only)
-                if abs(max_measurement - min_measurement) > threshold:
-                    largest_diff = max(measurements, key=lambda x: abs(x[1] - min_measurement))
-                    filename = largest_diff[0]
-                    file_second = filename.split('S')[-1].split('.')[0]
-                    specific_differences[value] = (min_measurement, max_measurement, largest_diff, file_second)
-            
+        mask = np.isin(self.aggregates.wavelengths, wavebands)
+        for value, min_measurement, max_measurement, file_id in self._differences(mask, threshold):
+            # 與最小值差距最大的測量值即為最大值
+            largest_diff = (file_id, max_measurement)
+            file_second = self.file_table.time_point(file_id)
+            specific_differences[value] = (min_measurement, max_measurement, largest_diff, file_second)
         return specific_differences
 
+    def threshold_sweep(self, wavebands: List[float], thresholds: Optional[List[float]] = None,
+                        points: int = DEFAULT_SWEEP_POINTS) -> ThresholdSweep:
+        """
+        Number of significant wavebands for a dense grid of thresholds.
+
+        Args:
+            wavebands: Specific wavebands counted separately
+            thresholds: Thresholds to evaluate (default: ``points`` values up to the largest difference)
+            points: Grid size when ``thresholds`` is not given
+
+        Returns:
+            ThresholdSweep with the band counts of every threshold
+        """
+        data = self.aggregates
+        ranges = np.where(data.present, data.range, np.nan)
+        return sweep_thresholds(ranges, thresholds, points, np.isin(data.wavelengths, wavebands))
+
     def find_significant_differences(self, threshold: float = 200) -> Dict:
         """分析所有波段的顯著差異"""
         significant_differences = {}
-        for value, measurements in self.all_values.items():
-            measurements_only = [m[1] for m in measurements]
-            min_measurement = min(measurements_only)
-            max_measurement = max(measurements_only)
-            if abs(max_measurement - min_measurement) > threshold:
-                largest_diff = max(measurements, key=lambda x: abs(x[1] - min_measurement))
-                significant_differences[value] = (min_measurement, max_measurement, largest_diff)
+        mask = np.ones(len(self.aggregates), dtype=bool)
+        for value, min_measurement, max_measurement, file_id in self._differences(mask, threshold):
+            significant_differences[value] = (min_measurement, max_measurement, (file_id, max_measurement))
         return significant_differences
 
-    def allSpectrum_plot(self, data1, skip_range_nm, output_directory, file_name, intensity_threshold=None):
-        """繪製全波段圖形並標記出最高波段"""
+    def allSpectrum_plot(self, data1, skip_range_nm, output_directory, file_name, intensity_threshold=None, peaks=None):
+        """
+        繪製全波段圖形並標記出最高波段。
+
+        使用獨立的 Figure 物件而非 pyplot 全域狀態，可在背景執行緒中繪製；
+        傳入已計算的 peaks 時不再重新計算峰值。
+        """
+        from matplotlib.figure import Figure
         try:
             # 過濾低於指定強度的波型
+            keep = data1.present.copy()
             if intensity_threshold is not None:
-                data1 = {k: v for k, v in data1.items() if any(m[1] > intensity_threshold for m in v)}
+                keep &= data1.maximum > intensity_threshold
             
             # 找出每個數據集的最大值點
-            peaks1 = self.find_peak_points(data1)
+            peaks1 = peaks if peaks is not None else self.find_peak_points(data1, MARKED_PEAKS, skip_range_nm, keep)
 
             # 如果啟用了濾波，過濾掉低於閾值的峰值
             if intensity_threshold is not None:
@@ -219,25 +575,26 @@ class OESAnalyzer:
             max_peak1 = peaks1[0]  # 已經按最大值排序，所以第一個就是最大的
             sorted_peaks = sorted(peaks1, key=lambda x: x['最大值'], reverse=True)
 
-            # 準備數據
-            wavelengths1 = sorted(data1.keys())
-            y1 = [max(m[1] for m in data1[w]) for w in wavelengths1]
+            # 準備數據（波長格點已排序）
+            wavelengths1 = data1.wavelengths[keep]
+            y1 = data1.maximum[keep]
         
             # 創建圖表
-            plt.figure(figsize=(10, 6))
+            fig = Figure(figsize=(10, 6))
+            ax = fig.add_subplot(111)
 
             # 繪製線條
-            plt.plot(wavelengths1, y1, color='red', label='Highest_data', linewidth=1)
+            ax.plot(wavelengths1, y1, color='red', label='Highest_data', linewidth=1)
 
             marked_peaks = []
             for peak in sorted_peaks:
-                if len(marked_peaks) >= 3:
+                if len(marked_peaks) >= MARKED_PEAKS:
                     break
                 # 檢查是否需要跳過範圍
                 if not any(abs(peak['波段'] - marked_peak['波段']) <= skip_range_nm for marked_peak in marked_peaks):
                     # 只標註高於閾值的波段
                     if intensity_threshold is None or peak['最大值'] > intensity_threshold:
-                        plt.annotate(
+                        ax.annotate(
                             f'intensity: {peak["最大值"]:.1f}',
                             xy=(peak['波段'], peak['最大值']),
                             xytext=(-20, -20), textcoords='offset points',
@@ -249,15 +606,15 @@ class OESAnalyzer:
             # 標題只顯示高於閾值的前三強
             peak_values = [f"{peak['波段']:.1f}nm" for peak in marked_peaks]
             title_text = f'ALL_Spectrum & Higher Peaks\nTop 3 Peaks: {", ".join(peak_values)}'
-            plt.title(title_text)
+            ax.set_title(title_text)
 
             # 設置X軸刻度，從195nm到1100nm，每100nm一個標示
             x_ticks = list(range(195, 1101, 100))
-            plt.xticks(x_ticks, [f'{x}nm' for x in x_ticks], rotation=75)
+            ax.set_xticks(x_ticks, [f'{x}nm' for x in x_ticks], rotation=75)
             
             # 設置Y軸刻度
             # 獲取當前Y軸的範圍
-            y_min, y_max = plt.ylim()
+            y_min, y_max = ax.get_ylim()
             # 計算Y軸刻度的範圍（向上取整到最接近的500的倍數）
             y_max = ((int(y_max) + 499) // 500) * 500
             y_min = (int(y_min) // 500) * 500
@@ -268,21 +625,20 @@ class OESAnalyzer:
             minor_ticks = list(range(y_min, y_max + 100, 100))
             
             # 設置主刻度和標籤
-            plt.yticks(major_ticks, [f'{x}' for x in major_ticks])
+            ax.set_yticks(major_ticks, [f'{x}' for x in major_ticks])
             # 設置次刻度（不顯示標籤）
-            plt.yticks(minor_ticks, minor=True)
+            ax.set_yticks(minor_ticks, minor=True)
             
             # 設置圖表屬性
-            plt.xlabel('Wavelength(nm)')
-            plt.ylabel('Intensity(Cts)')
+            ax.set_xlabel('Wavelength(nm)')
+            ax.set_ylabel('Intensity(Cts)')
             
             # 建構檔案名稱
             output_file_name = f"{file_name}_allspectrum_highestPeaks.png"
 
             # 保存圖表
             output_path = os.path.join(output_directory, output_file_name)
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            plt.close()
+            fig.savefig(output_path, dpi=300, bbox_inches='tight')
         
             logger.info(f"已生成最大值比較圖：{output_path}")
             return output_path
@@ -338,69 +694,166 @@ class OESAnalyzer:
 
         return sectioned_data
 
+    @staticmethod
+    def add_robust_statistics(sectioned_by_line: Dict[str, Dict[str, Dict[str, float]]],
+                              wave_data_by_line: Dict[str, List[float]], section: int,
+                              trim: float = DEFAULT_TRIM) -> None:
+        """
+        Add the median, MAD, IQR and trimmed mean to sectioned data of several lines.
+
+        The statistics of every section of every line are computed together
+        (see ``robust_section_statistics``) and stored next to the mean and std,
+        so outlier spectra can be told apart from a real drift.
+
+        Args:
+            sectioned_by_line: Line label -> sectioned data (see ``analyze_sections``), updated in place
+            wave_data_by_line: Line label -> the wave data the sections were computed from
+            section: Number of sections
+            trim: Fraction cut off at each end for the trimmed mean
+        """
+        robust = robust_section_statistics(wave_data_by_line, section, trim)
+        for label, sections in robust.items():
+            for section_name, stats in sections.items():
+                sectioned_by_line[label][section_name].update(stats)
+
+    def build_difference_sheets(self, wavebands: List[float], thresholds: List[float]) -> Tuple[Dict[str, Optional[List[dict]]], Dict[str, Optional[List[dict]]]]:
+        """
+        Compute the rows of the difference workbooks, one sheet per threshold.
+
+        Args:
+            wavebands: Specific wavebands for the specific-waveband workbook
+            thresholds: Difference thresholds, one sheet each
+
+        Returns:
+            Tuple of (all-waveband sheets, specific-waveband sheets); a sheet is
+            None when no waveband exceeds its threshold. The all-waveband sheets
+            end with an '異常光譜' sheet when spectra failed the quality checks.
+        """
+        sheets = {}
+        specific_sheets = {}
+        for threshold in thresholds:
+            sheet_name = f"threshold_{threshold}"
+            specific_differences = self.find_specific_wavebands_differences(wavebands, threshold)
+            specific_sheets[sheet_name] = [{
+                '波段': value,
+                '最小值': min_measurement,
+                '最大值': max_measurement,
+                '差值': max_measurement - min_measurement
+            } for value, (min_measurement, max_measurement, largest_diff, _) in sorted(specific_differences.items())] or None
+
+            significant_differences = self.find_significant_differences(threshold)
+            sheets[sheet_name] = [{
+                '波段': value,
+                '最小值': min_measurement,
+                '最大值': max_measurement,
+                '差值': max_measurement - min_measurement
+            } for value, (min_measurement, max_measurement, largest_diff) in sorted(significant_differences.items())] or None
+        if self.quality_report:
+            # 列出品質檢查標記（或排除）的光譜
+            sheets['異常光譜'] = [flag.row(self.file_table.name(flag.file_id)) for flag in self.quality_report]
+        return sheets, specific_sheets
+
+    @staticmethod
+    def write_difference_excel(excel_name: str, sheets: Dict[str, Optional[List[dict]]]) -> str:
+        """將差異分析結果寫入 Excel，每個閾值一個工作表"""
+        import pandas as pd
+        with pd.ExcelWriter(excel_name) as writer:
+            for sheet_name, rows in sheets.items():
+                if rows:
+                    pd.DataFrame(rows).to_excel(writer, sheet_name=sheet_name, index=False)
+                else:
+                    # Add a default sheet if no data is available
+                    pd.DataFrame({'Message': ['No data available for this threshold']}).to_excel(writer, sheet_name=sheet_name, index=False)
+        return excel_name
+
+    @staticmethod
+    def difference_excel_names(base_name: str, output_directory: str) -> Tuple[str, str]:
+        """回傳 (全部解離波段, 特定波段解離情況) 的 Excel 路徑"""
+        return (os.path.join(output_directory, f"{base_name}_全部解離波段.xlsx"),
+                os.path.join(output_directory, f"{base_name}_特定波段解離情況.xlsx"))
+
     def OES_analyze_and_export(self, wavebands: List[float], thresholds: List[float], 
                            base_name, skip_range_nm: float, output_directory: str) -> Tuple[str, str]:
-        """執行分析並導出結果"""
-        self.gather_values()
+        """執行分析並導出結果，若已收集過目前檔案的數據則直接沿用"""
+        if self.aggregates is None:
+            self.gather_values()
         # 使用傳遞的 output_directory
         os.makedirs(output_directory, exist_ok=True)
+        sheets, specific_sheets = self.build_difference_sheets(wavebands, thresholds)
+        excel_name, specific_excel_name = self.difference_excel_names(base_name, output_directory)
         # 處理特定波段數據
-        specific_excel_name = os.path.join(output_directory, f"{base_name}_特定波段解離情況.xlsx")
-        # logger.info(specific_excel_name)
-        with pd.ExcelWriter(specific_excel_name) as specific_writer:
-            for threshold in thresholds:
-                specific_differences = self.find_specific_wavebands_differences(wavebands, threshold)
-                if specific_differences:
-                    specific_data = []
-                    for value, (min_measurement, max_measurement, largest_diff, _) in sorted(specific_differences.items()):
-                        specific_data.append({
-                            '波段': value,
-                            '最小值': min_measurement,
-                            '最大值': max_measurement,
-                            '差值': max_measurement - min_measurement
-                        })
-                    specific_df = pd.DataFrame(specific_data)
-                    specific_df.to_excel(specific_writer, sheet_name=f"threshold_{threshold}", index=False)
-                else:
-                    # Add a default sheet if no data is available
-                    pd.DataFrame({'Message': ['No data available for this threshold']}).to_excel(specific_writer, sheet_name=f"threshold_{threshold}", index=False)
-
+        self.write_difference_excel(specific_excel_name, specific_sheets)
         # 處理所有波段數據
-        excel_name = os.path.join(output_directory, f"{base_name}_全部解離波段.xlsx")
-        with pd.ExcelWriter(excel_name) as writer:
-            for threshold in thresholds:
-                significant_differences = self.find_significant_differences(threshold)
-                if significant_differences:
-                    data = []
-                    for value, (min_measurement, max_measurement, largest_diff) in sorted(significant_differences.items()):
-                        data.append({
-                            '波段': value,
-                            '最小值': min_measurement,
-                            '最大值': max_measurement,
-                            '差值': max_measurement - min_measurement
-                        })
-                    df = pd.DataFrame(data)
-                    df.to_excel(writer, sheet_name=f"threshold_{threshold}", index=False)
-                else:
-                    # Add a default sheet if no data is available
-                    pd.DataFrame({'Message': ['No data available for this threshold']}).to_excel(writer, sheet_name=f"threshold_{threshold}", index=False)
-
+        self.write_difference_excel(excel_name, sheets)
         return excel_name, specific_excel_name
 
-    def filter_low_intensity(self, threshold: float):
-        """將低於指定強度的波段設置為0"""
-        if not self.all_values:
-            print("all_values is empty")
-            return
-        
-        for value, measurements in self.all_values.items():
-            # print(f"Processing value: {value}, measurements: {measurements}")
-            for i, (file_name, intensity) in enumerate(measurements):
-                # print(f"File: {file_name}, Intensity: {intensity}")
-                if intensity < threshold:
-                    self.all_values[value][i] = (file_name, 0.0)
+    def filter_low_intensity(self, threshold: Optional[float]):
+        """設定低強度過濾閾值，低於閾值的強度視為0；None 表示不過濾。原始數據保持不變"""
+        self.intensity_threshold = threshold
+
+    def filtered_values(self) -> Optional[SpectralAggregates]:
+        """回傳套用低強度過濾後的累計統計量（遮罩檢視）"""
+        if self.aggregates is None or not len(self.aggregates):
+            logger.warning("aggregates is empty")
+            return self.aggregates
+        if self.intensity_threshold is None:
+            return self.aggregates
+        return self.aggregates.masked(self.intensity_threshold)
 
-    def prepare_results_dataframe(self, sectioned_data: Dict[str, Dict[str, float]]) -> pd.DataFrame:
+    @staticmethod
+    def line_label(line: Line) -> str:
+        """譜線的顯示名稱，例如 '657.0' 或 '775.0-780.0'"""
+        if isinstance(line, tuple):
+            return f"{float(line[0])}-{float(line[1])}"
+        return f"{float(line)}"
+
+    def line_wavelengths(self, line: Line, data: Optional[Dict[float, List[float]]] = None) -> List[float]:
+        """Wavelengths of ``data`` (default: the loaded data) that make up a line."""
+        data = self._all_data if data is None else data
+        if isinstance(line, tuple):
+            low, high = line
+            return sorted(wave for wave in data if low <= wave <= high)
+        return [line] if line in data else []
+
+    def line_series(self, line: Line, data: Optional[Dict[float, List[float]]] = None) -> Optional[List[float]]:
+        """
+        Intensity time series of a line.
+
+        Args:
+            line: A wavelength, or a (low, high) range whose intensities are summed
+            data: Wavelength -> time series mapping (default: the loaded data)
+
+        Returns:
+            The time series, or None if the line has no data
+        """
+        data = self._all_data if data is None else data
+        waves = self.line_wavelengths(line, data)
+        if not waves:
+            return None
+        if len(waves) == 1:
+            return data[waves[0]]
+        length = min(len(data[wave]) for wave in waves)
+        return np.sum([data[wave][:length] for wave in waves], axis=0).tolist()
+
+    def prepare_lines_dataframe(self, sectioned_by_line: Dict[str, Dict[str, Dict[str, float]]]) -> 'pd.DataFrame':
+        """
+        Prepare one combined results DataFrame for several lines.
+
+        Args:
+            sectioned_by_line: Line label -> sectioned data (see ``analyze_sections``)
+
+        Returns:
+            DataFrame with a '波長' column followed by the usual result columns
+        """
+        import pandas as pd
+        frames = []
+        for label, sectioned_data in sectioned_by_line.items():
+            frame = self.prepare_results_dataframe(sectioned_data)
+            frame.insert(0, '波長', label)
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True)
+
+    def prepare_results_dataframe(self, sectioned_data: Dict[str, Dict[str, float]]) -> 'pd.DataFrame':
         """
         Prepare results DataFrame from sectioned data.
 
@@ -410,6 +863,10 @@ class OESAnalyzer:
         Returns:
             DataFrame containing formatted results
         """
+        import pandas as pd
+        # 啟用穩健統計時（見 add_robust_statistics）欄位接在穩定度之後
+        robust = [column for column in ROBUST_COLUMNS
+                  if all(column in stats for stats in sectioned_data.values())] if sectioned_data else []
         results = []
         for section_name, stats in sectioned_data.items():
             results.append([
@@ -418,9 +875,9 @@ class OESAnalyzer:
                 stats['std'],
                 stats['變異數'],
                 stats['穩定度']
-            ])
+            ] + [stats[column] for column in robust])
 
-        return pd.DataFrame(results, columns=['區段', '平均值', '標準差', '變異數', '穩定度'])
+        return pd.DataFrame(results, columns=['區段', '平均值', '標準差', '變異數', '穩定度'] + robust)
 
     def detect_activate_time(self, max_wave: float, threshold: float, start_index: int) -> Tuple[Optional[int], Optional[int]]:
         """
@@ -437,22 +894,47 @@ class OESAnalyzer:
         if max_wave not in self._all_data:
             logger.error(f"Wave length {max_wave} not found in data")
             return None, None
+        return self.detect_activation(self._all_data[max_wave], threshold, start_index)
 
-        time_series = self._all_data[max_wave]
-        activated = False
-        activate_time = None
-        end_time = None
-        
-        for i in range(len(time_series) - 1):
-            diff = time_series[i + 1] - time_series[i]
-            
-            if not activated and diff > threshold:
-                activate_time = i + 1 + start_index
-                activated = True
-                logger.debug(f"Activation detected at index {activate_time}")
-            elif activated and diff < -threshold:
-                end_time = i + 1 + start_index
-                logger.debug(f"Deactivation detected at index {end_time}")
-                break
-                
-        return activate_time, end_time
\ No newline at end of file
+    @staticmethod
+    def detect_activation(time_series: List[float], threshold: float, start_index: int,
+                          config: Optional[ActivationConfig] = None) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Find activation time points in an intensity time series.
+
+        Args:
+            time_series: Intensity of one line per file, in file order
+            threshold: Threshold for activation detection
+            start_index: File index of the first element
+            config: Detection settings (default: first jump above ``threshold``)
+
+        Returns:
+            Tuple of activation start and end times
+        """
+        return ActivationDetector(config).windows([time_series], threshold, [start_index])[0]
+
+    @staticmethod
+    def detect_activation_batch(series: List[List[float]], threshold: float, start_indices: List[int],
+                                config: Optional[ActivationConfig] = None) -> List[Tuple[Optional[int], Optional[int]]]:
+        """
+        Find the activation time points of many time series at once.
+
+        The series are padded into one matrix, so every series is smoothed and
+        thresholded with a single vectorized pass (see ``ActivationDetector``).
+
+        Args:
+            series: Intensity time series, one per run (lengths may differ)
+            threshold: Threshold for activation detection
+            start_indices: File index of the first element of every series
+            config: Detection settings (default: first jump above ``threshold``)
+
+        Returns:
+            (activation time, end time) of every series; None where not found
+        """
+        return ActivationDetector(config).windows(series, threshold, start_indices)
+
+    @staticmethod
+    def detect_activation_segments(time_series: List[float], threshold: float, start_index: int,
+                                   config: Optional[ActivationConfig] = None) -> List[Tuple[int, int]]:
+        """所有完整的啟動區間 (啟動時間, 結束時間)；未設定多區段時最多一個"""
+        return ActivationDetector(config).segments([time_series], threshold, [start_index])[0]
\ No newline at end of file
@@ -0,0 +1,253 @@
+import os
+import time
+import sqlite3
+import logging
+from contextlib import closing, contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, List, Dict, Tuple, Optional, Callable
+from dataclasses import dataclass
+from model.discovery import SPECTRUM_FILE_PATTERN, RunInfo, group_runs
+from model.spectrum_format import detect_format, parse_spectrum
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.oes_analyzer', 'archive_index.sqlite')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    folder TEXT NOT NULL,
+    base_name TEXT NOT NULL,
+    root TEXT NOT NULL,
+    start_index INTEGER NOT NULL,
+    end_index INTEGER NOT NULL,
+    file_count INTEGER NOT NULL,
+    gap_count INTEGER NOT NULL,
+    wavelength_min REAL,
+    wavelength_max REAL,
+    total_bytes INTEGER NOT NULL,
+    folder_mtime_ns INTEGER NOT NULL,
+    indexed_at REAL NOT NULL,
+    PRIMARY KEY (folder, base_name)
+);
+CREATE INDEX IF NOT EXISTS runs_root ON runs (root);
+"""
+
+
+def _escape_like(text: str) -> str:
+    """Escape the LIKE wildcards of ``text`` (used with ``ESCAPE '\\'``)."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _below(root: str) -> Tuple[str, List[str]]:
+    """SQL condition and parameters selecting the folders at or below ``root``."""
+    prefix = root.rstrip(os.sep) + os.sep
+    return "(folder = ? OR folder LIKE ? ESCAPE '\\')", [root, _escape_like(prefix) + '%']
+
+
+@dataclass
+class ArchiveRun:
+    """Data class for one OES run recorded in the archive catalog."""
+    folder: str
+    base_name: str
+    start_index: int
+    end_index: int
+    file_count: int
+    gap_count: int
+    wavelength_min: Optional[float]
+    wavelength_max: Optional[float]
+    total_bytes: int
+
+
+def read_wavelength_range(file_path: str) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Read the wavelength range of one spectrum file.
+
+    Args:
+        file_path: Path to the spectrum file
+
+    Returns:
+        Tuple of the smallest and largest wavelength, (None, None) if unreadable
+    """
+    try:
+        file_format = detect_format(file_path)
+        if file_format is None:
+            return None, None
+        waves, _ = parse_spectrum(file_path, file_format)
+    except OSError as e:
+        logger.warning(f"Could not read {file_path}: {e}")
+        return None, None
+    if not len(waves):
+        return None, None
+    return float(waves.min()), float(waves.max())
+
+
+class ArchiveIndexer:
+    """
+    Recursive indexer that records every OES run below a root directory in SQLite.
+
+    Directories are scanned in parallel (one ``os.scandir`` per directory on a
+    thread pool, which suits network shares). Folders whose modification time
+    is unchanged since the last indexing are skipped, so re-indexing an archive
+    only costs the directory walk. Queries read the catalog only and never
+    touch the file system. Runs are keyed by folder, so indexing a root
+    nested in (or containing) an indexed root updates the same rows. The
+    catalog file is only created when a root is first indexed.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_INDEX_PATH, max_workers: int = 8):
+        """
+        Initialize the indexer.
+
+        Args:
+            db_path: Path to the SQLite catalog file
+            max_workers: Number of directories scanned concurrently
+        """
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self._ready = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection in one transaction, creating the catalog on first use."""
+        if not self._ready:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        # 每次操作建立連線，讓背景索引執行緒與 GUI 執行緒各自使用自己的連線；用畢即關閉
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            if not self._ready:
+                conn.executescript(_SCHEMA)
+                self._ready = True
+            with conn:
+                yield conn
+
+    @staticmethod
+    def _scan_directory(folder: str) -> Tuple[List[str], int, Dict[str, List[Tuple[int, int, str]]]]:
+        """List one directory: return its subdirectories, mtime and spectrum files per base name."""
+        subfolders = []
+        files: Dict[str, List[Tuple[int, int, str]]] = {}
+        try:
+            mtime_ns = os.stat(folder).st_mtime_ns
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subfolders.append(entry.path)
+                        continue
+                    match = SPECTRUM_FILE_PATTERN.match(entry.name)
+                    if match is not None:
+                        files.setdefault(match.group('base'), []).append(
+                            (int(match.group('index')), entry.stat().st_size, entry.path))
+        except OSError as e:
+            logger.warning(f"Skipping unreadable folder {folder}: {e}")
+            return [], 0, {}
+        return subfolders, mtime_ns, files
+
+    def _known_mtimes(self, root: str) -> Dict[str, int]:
+        condition, params = _below(root)
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT DISTINCT folder, folder_mtime_ns FROM runs WHERE {condition}", params)
+            return {folder: mtime_ns for folder, mtime_ns in rows}
+
+    def _runs_of_folder(self, folder: str, files: Dict[str, List[Tuple[int, int, str]]]) -> List[Tuple[RunInfo, int, Optional[float], Optional[float]]]:
+        runs = group_runs({base: [i for i, _, _ in entries] for base, entries in files.items()})
+        results = []
+        for run in runs:
+            entries = files[run.base_name]
+            total_bytes = sum(size for _, size, _ in entries)
+            first_file = min(entries)[2]
+            wave_min, wave_max = read_wavelength_range(first_file)
+            results.append((run, total_bytes, wave_min, wave_max))
+        return results
+
+    def index(self, root: str, progress_callback: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Walk a root directory in parallel and record every run found in the catalog.
+
+        Args:
+            root: Archive root directory
+            progress_callback: Called with (scanned folders, discovered folders)
+
+        Returns:
+            Number of runs in the catalog below the root after indexing
+        """
+        root = os.path.abspath(root)
+        known = self._known_mtimes(root)
+        run_folders = set()
+        updates = []  # (folder, mtime_ns, future of the folder's runs)
+        scanned = 0
+        discovered = 1
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {executor.submit(self._scan_directory, root): root}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    folder = pending.pop(future)
+                    subfolders, mtime_ns, files = future.result()
+                    scanned += 1
+                    for subfolder in subfolders:
+                        pending[executor.submit(self._scan_directory, subfolder)] = subfolder
+                    discovered += len(subfolders)
+                    if files:
+                        run_folders.add(folder)
+                        # 只有新的或內容有變動的資料夾才需要讀取波長範圍
+                        if known.get(folder) != mtime_ns:
+                            updates.append((folder, mtime_ns, executor.submit(self._runs_of_folder, folder, files)))
+                    if progress_callback:
+                        progress_callback(scanned, discovered)
+
+            now = time.time()
+            with self._connect() as conn:
+                for folder, mtime_ns, future in updates:
+                    conn.execute("DELETE FROM runs WHERE folder = ?", (folder,))
+                    for run, total_bytes, wave_min, wave_max in future.result():
+                        conn.execute(
+                            "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (folder, run.base_name, root, run.start_index, run.end_index,
+                             run.count, len(run.gaps), wave_min, wave_max, total_bytes,
+                             mtime_ns, now))
+                # 移除已不存在或已無光譜檔的資料夾
+                for folder in set(known) - run_folders:
+                    conn.execute("DELETE FROM runs WHERE folder = ?", (folder,))
+                condition, params = _below(root)
+                count = conn.execute(f"SELECT COUNT(*) FROM runs WHERE {condition}", params).fetchone()[0]
+
+        logger.info(f"Indexed {scanned} folders below {root}: {count} runs in catalog")
+        return count
+
+    def query(self, text: str = "", min_files: int = 0, root: Optional[str] = None,
+              wavelength: Optional[float] = None, limit: int = 5000) -> List[ArchiveRun]:
+        """
+        Query the catalog.
+
+        Args:
+            text: Substring matched against folder path and base name (no wildcards)
+            min_files: Minimum number of spectrum files in the run
+            root: Restrict to runs in folders below this root
+            wavelength: Only runs whose wavelength range covers this value
+            limit: Maximum number of rows returned
+
+        Returns:
+            List of ArchiveRun sorted by folder path
+        """
+        clauses = ["file_count >= ?"]
+        params: list = [min_files]
+        if text:
+            pattern = f"%{_escape_like(text)}%"
+            clauses.append("(folder LIKE ? ESCAPE '\\' OR base_name LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        if root:
+            condition, root_params = _below(os.path.abspath(root))
+            clauses.append(condition)
+            params += root_params
+        if wavelength is not None:
+            clauses.append("wavelength_min <= ? AND wavelength_max >= ?")
+            params += [wavelength, wavelength]
+        sql = (
+            "SELECT folder, base_name, start_index, end_index, file_count, gap_count, "
+            "wavelength_min, wavelength_max, total_bytes FROM runs WHERE "
+            + " AND ".join(clauses) + " ORDER BY folder, base_name LIMIT ?"
+        )
+        params.append(limit)
+        if not self._ready and not os.path.exists(self.db_path):
+            return []  # 尚未索引過任何根目錄，不建立空的目錄檔
+        with self._connect() as conn:
+            return [ArchiveRun(*row) for row in conn.execute(sql, params)]
@@ -0,0 +1,292 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TYPE_CHECKING
+import numpy as np
+
+# pandas 只在輸出表格時才載入
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 積分方式
+INTEGRATE_SUM = 'sum'  # 視窗內強度加總（與範圍譜線的加總相同）
+INTEGRATE_TRAPEZOID = 'trapezoid'  # 梯形積分（counts·nm），不受波長間距影響
+
+# 積分視窗：(下限, 上限) 波長，兩端皆包含
+Band = Tuple[float, float]
+
+
+def parse_band(text: str) -> Band:
+    """
+    Parse one integration window: "656±1" (or "656+-1"), "655-657", or a single wavelength.
+
+    Raises:
+        ValueError: If the text is not a number, a center±half-width or a low-high range
+    """
+    text = text.strip().replace('+-', '±')
+    if '±' in text:
+        center, half_width = (float(part) for part in text.split('±', 1))
+        return center - abs(half_width), center + abs(half_width)
+    if '-' in text.lstrip('-'):
+        low, high = (float(part) for part in text.rsplit('-', 1))
+        return min(low, high), max(low, high)
+    wave = float(text)
+    return wave, wave
+
+
+def band_label(band: Band) -> str:
+    """積分視窗的顯示名稱，格式與範圍譜線相同，例如 '655.0-657.0'"""
+    return f"{float(band[0])}-{float(band[1])}"
+
+
+@dataclass(frozen=True)
+class BandRatio:
+    """Data class describing the ratio of two integrated bands (e.g. Hα / Ar)."""
+    numerator: Band
+    denominator: Band
+
+    @property
+    def label(self) -> str:
+        return f"{band_label(self.numerator)}/{band_label(self.denominator)}"
+
+
+def parse_bands(text: str) -> Tuple[List[Band], List[BandRatio]]:
+    """
+    Parse a comma separated list of windows and ratios, e.g. "656±1, 750.4±0.5, 656±1/750.4±0.5".
+
+    Returns:
+        Tuple of the windows (in order, without duplicates, including the
+        windows of every ratio) and the ratios
+
+    Raises:
+        ValueError: If an entry cannot be parsed
+    """
+    bands: List[Band] = []
+    ratios: List[BandRatio] = []
+    for entry in text.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if '/' in entry:
+            numerator, denominator = entry.split('/', 1)
+            ratio = BandRatio(parse_band(numerator), parse_band(denominator))
+            ratios.append(ratio)
+            entry_bands = [ratio.numerator, ratio.denominator]
+        else:
+            entry_bands = [parse_band(entry)]
+        bands.extend(band for band in entry_bands if band not in bands)
+    return bands, ratios
+
+
+class BandIntegrator:
+    """
+    Integrate many wavelength windows over many spectra at once.
+
+    The index range of every window on a wavelength grid is found once with
+    ``np.searchsorted``. Integrating a block of spectra is then one
+    cumulative sum along the wavelength axis (over the span covered by the
+    windows), and every window is the difference of two of its columns, so
+    the cost does not grow with the width or overlap of the windows. When
+    the block has missing values a second cumulative sum counts them, so a
+    window with any missing wavelength is NaN instead of silently low.
+    """
+
+    def __init__(self, wavelengths: np.ndarray, bands: Sequence[Band], method: str = INTEGRATE_SUM):
+        """
+        Precompute the index range of every window.
+
+        Args:
+            wavelengths: Sorted wavelength grid of the spectra
+            bands: (low, high) windows
+            method: ``INTEGRATE_SUM`` or ``INTEGRATE_TRAPEZOID``
+        """
+        if method not in (INTEGRATE_SUM, INTEGRATE_TRAPEZOID):
+            raise ValueError(f"Unknown integration method: {method}")
+        self.wavelengths = np.asarray(wavelengths, dtype=float)
+        self.method = method
+        lows = np.array([band[0] for band in bands], dtype=float)
+        highs = np.array([band[1] for band in bands], dtype=float)
+        # 視窗內的波長為 start..stop-1
+        self.start = np.searchsorted(self.wavelengths, lows, side='left')
+        self.stop = np.searchsorted(self.wavelengths, highs, side='right')
+        self.empty = self.stop <= self.start
+        self._spacing = np.diff(self.wavelengths)
+
+    def matches(self, wavelengths: np.ndarray) -> bool:
+        """True if the index ranges apply to ``wavelengths``."""
+        return len(wavelengths) == len(self.wavelengths) and np.array_equal(wavelengths, self.wavelengths)
+
+    @staticmethod
+    def _cumulative(values: np.ndarray) -> np.ndarray:
+        """Cumulative sum along the rows with a leading zero column."""
+        cumulative = np.zeros((values.shape[0], values.shape[1] + 1))
+        np.cumsum(values, axis=1, out=cumulative[:, 1:])
+        return cumulative
+
+    def integrate(self, block: np.ndarray) -> np.ndarray:
+        """
+        Integral of every window for every spectrum.
+
+        Args:
+            block: Intensity matrix (spectra x wavelengths) on this grid, NaN where missing
+
+        Returns:
+            Matrix (spectra x windows); NaN where a window has no wavelength or a missing value
+        """
+        integrals = np.full((block.shape[0], len(self.start)), np.nan)
+        if self.empty.all():
+            return integrals
+        # 只對視窗涵蓋的波長範圍做累積和
+        low = int(self.start[~self.empty].min())
+        high = int(self.stop[~self.empty].max())
+        block = block[:, low:high]
+        start, stop = self.start - low, self.stop - low
+        missing = np.isnan(block)
+        has_missing = missing.any()
+        values = np.where(missing, 0.0, block) if has_missing else block
+        if self.method == INTEGRATE_TRAPEZOID:
+            # 第 j 個梯形介於波長 j 與 j+1，視窗內的梯形為 start..stop-2；只有一點的視窗積分為 0
+            terms = 0.5 * (values[:, 1:] + values[:, :-1]) * self._spacing[low:high - 1]
+            first, last = start, np.maximum(stop - 1, start)
+        else:
+            terms = values
+            first, last = start, stop
+        used = ~self.empty
+        cumulative = self._cumulative(terms)
+        window_integrals = cumulative[:, last[used]] - cumulative[:, first[used]]
+        if has_missing:
+            gaps = self._cumulative(missing.astype(np.float64))
+            window_integrals[(gaps[:, stop[used]] - gaps[:, start[used]]) > 0] = np.nan
+        integrals[:, used] = window_integrals
+        return integrals
+
+
+@dataclass
+class BandSeries:
+    """Data class holding the integrated band and ratio time series of one run."""
+    times: np.ndarray  # 每個檔案的時間點（檔案序號）
+    bands: List[Band]
+    ratios: List[BandRatio]
+    integrals: np.ndarray  # 檔案 x 視窗，沒有數據的檔案為 NaN
+    method: str = INTEGRATE_SUM
+
+    @property
+    def labels(self) -> List[str]:
+        """Column labels: every window, then every ratio."""
+        return [band_label(band) for band in self.bands] + [ratio.label for ratio in self.ratios]
+
+    def ratio_values(self) -> np.ndarray:
+        """Ratio time series (files x ratios); NaN where the denominator is 0 or missing."""
+        numerators = self.integrals[:, [self.bands.index(ratio.numerator) for ratio in self.ratios]]
+        denominators = self.integrals[:, [self.bands.index(ratio.denominator) for ratio in self.ratios]]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratios = numerators / denominators
+        ratios[~np.isfinite(ratios)] = np.nan
+        return ratios
+
+    def values(self) -> np.ndarray:
+        """All series (files x labels), in the order of ``labels``."""
+        return np.hstack([self.integrals, self.ratio_values()])
+
+    def series(self) -> Dict[str, np.ndarray]:
+        """Label -> time series."""
+        return dict(zip(self.labels, self.values().T))
+
+    def table(self) -> 'pd.DataFrame':
+        """Time series table, one row per file."""
+        import pandas as pd
+        table = pd.DataFrame(self.values(), columns=self.labels)
+        table.insert(0, '時間點', self.times)
+        return table
+
+
+def integrate_run(chunks: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]], times: np.ndarray,
+                  bands: Sequence[Band], ratios: Sequence[BandRatio] = (), method: str = INTEGRATE_SUM,
+                  progress_callback: Optional[Callable[[int, int], None]] = None) -> BandSeries:
+    """
+    Integrate every window over every spectrum of a run.
+
+    The index ranges are computed for the first chunk's grid and reused for
+    every chunk on the same grid, so each chunk costs two cumulative sums.
+
+    Args:
+        chunks: (file ids, sorted wavelengths, intensity matrix) per chunk,
+            as yielded by ``OESAnalyzer.iter_spectra_chunks``
+        times: Time point (file sequence) of every file id
+        bands: Windows to integrate
+        ratios: Ratios of two windows; their windows are added if missing
+        method: ``INTEGRATE_SUM`` or ``INTEGRATE_TRAPEZOID``
+        progress_callback: Called with (files read, total files) after each chunk
+
+    Returns:
+        The time series of the run
+    """
+    bands = list(bands)
+    for ratio in ratios:
+        bands.extend(band for band in (ratio.numerator, ratio.denominator) if band not in bands)
+    if not bands:
+        raise ValueError("No integration window given")
+    times = np.asarray(times)
+    integrals = np.full((len(times), len(bands)), np.nan)
+    integrator = None
+    for file_ids, wavelengths, block in chunks:
+        if integrator is None or not integrator.matches(wavelengths):
+            integrator = BandIntegrator(wavelengths, bands, method)
+        integrals[file_ids] = integrator.integrate(block)
+        if progress_callback:
+            progress_callback(int(file_ids[-1]) + 1, len(times))
+    empty = [band_label(band) for band, column in zip(bands, integrals.T) if np.isnan(column).all()]
+    if empty:
+        logger.warning(f"No data in window(s): {', '.join(empty)}")
+    return BandSeries(times, bands, list(ratios), integrals, method)
+
+
+def render_band_plot(series: BandSeries, output_path: str, title: str = '') -> str:
+    """
+    Draw the integrated intensity of every window over time, with the ratios
+    on a second axis below.
+
+    Returns:
+        The output path
+    """
+    from matplotlib.figure import Figure
+    values = series.series()
+    fig = Figure(figsize=(10, 8 if series.ratios else 6))
+    ax = fig.add_subplot(211 if series.ratios else 111)
+    for band in series.bands:
+        label = band_label(band)
+        ax.plot(series.times, values[label], linewidth=1, label=f'{label}nm')
+    unit = 'Cts·nm' if series.method == INTEGRATE_TRAPEZOID else 'Cts'
+    ax.set_title(f'{title}\nIntegrated band intensity' if title else 'Integrated band intensity')
+    ax.set_ylabel(f'Integrated intensity ({unit})')
+    ax.grid(True)
+    ax.legend()
+    if series.ratios:
+        ratio_ax = fig.add_subplot(212, sharex=ax)
+        for ratio in series.ratios:
+            ratio_ax.plot(series.times, values[ratio.label], linewidth=1, label=ratio.label)
+        ratio_ax.set_ylabel('Ratio')
+        ratio_ax.grid(True)
+        ratio_ax.legend()
+        ratio_ax.set_xlabel('Time point')
+    else:
+        ax.set_xlabel('Time point')
+    fig.savefig(output_path, dpi=300, bbox_inches='tight')
+    return output_path
+
+
+def write_band_excel(series: BandSeries, excel_name: str, stability: Optional['pd.DataFrame'] = None) -> str:
+    """將積分強度與比值時間序列寫入 Excel；有穩定度結果時另存一個工作表"""
+    import pandas as pd
+    with pd.ExcelWriter(excel_name) as writer:
+        series.table().to_excel(writer, sheet_name='積分強度', index=False)
+        if stability is not None:
+            stability.to_excel(writer, sheet_name='穩定度', index=False)
+        pd.DataFrame({
+            '名稱': [band_label(band) for band in series.bands] + [ratio.label for ratio in series.ratios],
+            '下限': [band[0] for band in series.bands] + [np.nan] * len(series.ratios),
+            '上限': [band[1] for band in series.bands] + [np.nan] * len(series.ratios),
+            '積分方式': [series.method] * len(series.labels),
+        }).to_excel(writer, sheet_name='視窗設定', index=False)
+    return excel_name
@@ -0,0 +1,219 @@
+import os
+import re
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from model.discovery import RunInfo
+
+logger = logging.getLogger(__name__)
+
+SPECTRUM_PLOT = 'spectrum'
+INTENSITY_PLOT = 'intensity'
+
+# 強度圖取波長時的容許誤差（nm），與互動式強度圖相同
+WAVE_TOLERANCE = 0.1
+
+
+@dataclass(frozen=True)
+class PlotJob:
+    """Data class describing one figure of a batch (picklable, sent to worker processes)."""
+    kind: str  # SPECTRUM_PLOT 或 INTENSITY_PLOT
+    file_paths: Tuple[str, ...]
+    output_directory: str
+    name: str  # 輸出檔名前綴：<資料夾>_<base_name>
+    skip_range_nm: float = 10.0
+    intensity_threshold: Optional[float] = None
+    detect_wave: Optional[float] = None
+
+    @property
+    def output_path(self) -> str:
+        """Deterministic output path of the figure."""
+        if self.kind == SPECTRUM_PLOT:
+            # 與 OESAnalyzer.allSpectrum_plot 的命名一致
+            return os.path.join(self.output_directory, f"{self.name}_allspectrum_highestPeaks.png")
+        return os.path.join(self.output_directory, f"{self.name}_intensity_plot_{self.detect_wave}nm.png")
+
+
+def render_intensity_plot(times: Sequence[int], intensities: Sequence[float], detect_wave: float, output_path: str) -> str:
+    """
+    Draw the intensity of one wavelength over time and save it as PNG.
+
+    Args:
+        times: Time points (file sequence numbers)
+        intensities: Intensity at every time point
+        detect_wave: Wavelength shown in the title
+        output_path: PNG file to write
+
+    Returns:
+        The output path
+    """
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+    ax.plot(times, intensities, 'b-', linewidth=2)
+    ax.set_title(f'{detect_wave}nm intensity change')
+    ax.set_xlabel('Time point')
+    ax.set_ylabel('Intensity (a.u.)')
+    ax.grid(True)
+    fig.savefig(output_path, dpi=300, bbox_inches='tight')
+    return output_path
+
+
+def intensity_series(file_paths: Sequence[str], detect_wave: float, formats=None,
+                     tolerance: float = WAVE_TOLERANCE) -> np.ndarray:
+    """
+    Intensity of one wavelength in every file.
+
+    In every file the first wavelength (in file order) within ``tolerance``
+    of ``detect_wave`` is taken, so a wavelength typed in the GUI matches a
+    grid that is not on round values.
+
+    Args:
+        file_paths: Files to read, in time order
+        detect_wave: Wavelength to read
+        formats: Per-folder file format cache (default: a new one)
+        tolerance: Maximum distance between ``detect_wave`` and the file's wavelength (nm)
+
+    Returns:
+        Intensity of every file, NaN where a file is unreadable or has no such wavelength
+    """
+    from model.spectrum_format import FormatRegistry
+    formats = formats if formats is not None else FormatRegistry()
+    intensities = np.full(len(file_paths), np.nan)
+    for row, file_path in enumerate(file_paths):
+        try:
+            waves, values = formats.parse(file_path)
+        except Exception as e:
+            logger.error(f"Error processing file {file_path}: {e}")
+            continue
+        matches = np.flatnonzero(np.abs(waves - detect_wave) < tolerance)
+        if len(matches):
+            intensities[row] = values[matches[0]]
+    return intensities
+
+
+def render_job(job: PlotJob) -> Optional[str]:
+    """
+    Render one plot job (runs inside a worker process).
+
+    Returns:
+        Path of the written figure, or None if the run had no data to plot
+    """
+    if job.kind == SPECTRUM_PLOT:
+        from model.analyzer import OESAnalyzer
+        analyzer = OESAnalyzer()
+        analyzer.set_files(list(job.file_paths))
+        analyzer.gather_values()
+        analyzer.filter_low_intensity(job.intensity_threshold)
+        data = analyzer.filtered_values()
+        if data is None:
+            return None
+        from model.ranking import MARKED_PEAKS
+        peaks = analyzer.find_peak_points(data, MARKED_PEAKS, job.skip_range_nm)
+        return analyzer.allSpectrum_plot(data, job.skip_range_nm, job.output_directory, job.name, peaks=peaks)
+
+    from model.file_table import FileTable
+    intensities = intensity_series(job.file_paths, job.detect_wave)
+    times = np.array([FileTable.parse_sequence(os.path.basename(path)) for path in job.file_paths])
+    valid = ~np.isnan(intensities)
+    if not valid.any():
+        logger.warning(f"No data at {job.detect_wave}nm for {job.name}")
+        return None
+    return render_intensity_plot(times[valid], intensities[valid], job.detect_wave, job.output_path)
+
+
+class BatchRenderer:
+    """
+    Renders the plots of many runs in parallel.
+
+    Every figure is an independent job rendered with a standalone Agg figure
+    in a worker process, so plots of different runs never share pyplot state
+    and a batch uses every core. Output names are derived from the folder and
+    run name only (``<folder>_<base_name>_...png``); names that would collide
+    get a ``_2``, ``_3``... suffix in job order, so the same batch always
+    produces the same files.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """
+        Initialize the renderer.
+
+        Args:
+            max_workers: Number of worker processes (default: number of CPUs)
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    @staticmethod
+    def _safe_name(text: str) -> str:
+        return re.sub(r'[\\/:*?"<>|\s]+', '_', text).strip('_') or 'run'
+
+    def plan(self, runs: List[Tuple[str, RunInfo]], output_directory: str, spectrum: bool = True,
+             detect_waves: Sequence[float] = (), skip_range_nm: float = 10.0,
+             intensity_threshold: Optional[float] = None) -> List[PlotJob]:
+        """
+        Build the plot jobs for a list of runs.
+
+        Args:
+            runs: (folder path, run) pairs
+            output_directory: Directory receiving all figures
+            spectrum: Render the all-spectrum peak plot of every run
+            detect_waves: Wavelengths to render an intensity-over-time plot for
+            skip_range_nm: Minimum distance between marked peaks
+            intensity_threshold: Low intensity filter of the spectrum plots
+
+        Returns:
+            Plot jobs in a deterministic order
+        """
+        jobs = []
+        used = {}
+        for folder_path, run in runs:
+            name = self._safe_name(f"{os.path.basename(os.path.normpath(folder_path))}_{run.base_name}")
+            used[name] = used.get(name, 0) + 1
+            if used[name] > 1:
+                name = f"{name}_{used[name]}"
+            file_paths = tuple(run.file_paths(folder_path))
+            if spectrum:
+                jobs.append(PlotJob(SPECTRUM_PLOT, file_paths, output_directory, name,
+                                    skip_range_nm=skip_range_nm, intensity_threshold=intensity_threshold))
+            for detect_wave in detect_waves:
+                jobs.append(PlotJob(INTENSITY_PLOT, file_paths, output_directory, name,
+                                    detect_wave=float(detect_wave)))
+        return jobs
+
+    def render(self, jobs: List[PlotJob],
+               progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[PlotJob, Optional[str]]:
+        """
+        Render the jobs on a process pool.
+
+        Args:
+            jobs: Plot jobs (see ``plan``)
+            progress_callback: Called with (finished jobs, total jobs) after each job
+
+        Returns:
+            Mapping of every job to its figure path, None for failed or empty jobs
+        """
+        results: Dict[PlotJob, Optional[str]] = {}
+        if not jobs:
+            return results
+        for directory in {job.output_directory for job in jobs}:
+            os.makedirs(directory, exist_ok=True)
+
+        # 使用 spawn 啟動子行程，避免在 GUI (多執行緒) 行程中 fork
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(jobs)), mp_context=context) as executor:
+            futures = {executor.submit(render_job, job): job for job in jobs}
+            for done, future in enumerate(as_completed(futures), 1):
+                job = futures[future]
+                try:
+                    results[job] = future.result()
+                except Exception as e:
+                    logger.error(f"Rendering {job.output_path} failed: {e}")
+                    results[job] = None
+                if progress_callback:
+                    progress_callback(done, len(jobs))
+        logger.info(f"Rendered {sum(path is not None for path in results.values())}/{len(jobs)} figures")
+        return results
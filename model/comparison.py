@@ -0,0 +1,165 @@
+import logging
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+import numpy as np
+
+from model.robust_stats import ROBUST_COLUMNS
+
+# pandas 只在建立比較表時才載入
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TOTAL_SECTION = '總區段'
+RESULT_COLUMNS = ['區段', '平均值', '標準差', '變異數', '穩定度']
+
+# 修正 z 分數 (0.6745 * 偏差 / MAD) 超過此值的實驗視為離群
+DEFAULT_OUTLIER_Z = 3.5
+# 實驗數少於此值時不判定離群（中位數與 MAD 不具代表性）
+MIN_OUTLIER_EXPERIMENTS = 5
+
+
+class ExperimentComparison:
+    """
+    Cross-experiment comparison of stability results.
+
+    The section tables of all experiments are stacked once into flat arrays;
+    every statistic is then computed per (line, experiment) cell with numpy
+    scatter operations and per line along the experiment axis, so the cost
+    does not depend on iterating DataFrame rows. The same object feeds the
+    error-bar chart and the Excel export.
+    """
+
+    def __init__(self, results: Dict[str, Optional['pd.DataFrame']], order: Optional[List[str]] = None,
+                 outlier_z: float = DEFAULT_OUTLIER_Z):
+        """
+        Stack the results of all experiments.
+
+        Args:
+            results: Experiment (folder) -> section results DataFrame, with an
+                optional '波長' column when several lines were analyzed
+            order: Experiment order; experiment i is labelled ``Exp.{i+1}``
+                (default: the order of ``results``)
+            outlier_z: Modified z-score above which an experiment is an outlier
+        """
+        import pandas as pd
+        self.outlier_z = outlier_z
+        self.labels: List[str] = []
+        frames = []
+        for idx, key in enumerate(order if order is not None else list(results)):
+            df = results.get(key)
+            if df is None or df.empty:
+                continue
+            frame = df if '波長' in df.columns else df.assign(波長='')
+            frames.append(frame.assign(實驗=f"Exp.{idx+1}", _position=len(self.labels)))
+            self.labels.append(f"Exp.{idx+1}")
+        # 穩健統計欄位只在所有實驗都有時保留
+        robust = [column for column in ROBUST_COLUMNS if frames and all(column in frame for frame in frames)]
+        columns = ['實驗', '波長'] + RESULT_COLUMNS + robust
+        self.table = pd.concat(frames, ignore_index=True)[columns + ['_position']] if frames else pd.DataFrame(columns=columns + ['_position'])
+        self.has_lines = bool((self.table['波長'] != '').any())
+
+        line_codes, self.lines = pd.factorize(self.table['波長'], sort=False)
+        positions = self.table['_position'].to_numpy(dtype=np.int64)
+        stability = self.table['穩定度'].to_numpy(dtype=float)
+        mean = self.table['平均值'].to_numpy(dtype=float)
+        is_total = self.table['區段'].to_numpy() == TOTAL_SECTION
+
+        shape = (len(self.lines), len(self.labels))
+        cells = line_codes * len(self.labels) + positions
+        self.minimum = np.full(shape[0] * shape[1], np.inf)
+        self.maximum = np.full(shape[0] * shape[1], -np.inf)
+        np.minimum.at(self.minimum, cells, stability)
+        np.maximum.at(self.maximum, cells, stability)
+        self.minimum = self.minimum.reshape(shape)
+        self.maximum = self.maximum.reshape(shape)
+        # 每個 (譜線, 實驗) 的總區段穩定度與平均強度，缺值為 NaN
+        self.total = np.full(shape[0] * shape[1], np.nan)
+        self.total[cells[is_total]] = stability[is_total]
+        self.total = self.total.reshape(shape)
+        self.intensity = np.full(shape[0] * shape[1], np.nan)
+        self.intensity[cells[is_total]] = mean[is_total]
+        self.intensity = self.intensity.reshape(shape)
+        self.present = ~np.isnan(self.total)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @staticmethod
+    def _drift(values: np.ndarray) -> np.ndarray:
+        """Least-squares slope of every row against the experiment position, ignoring NaN."""
+        weights = ~np.isnan(values)
+        x = np.broadcast_to(np.arange(values.shape[1], dtype=float), values.shape)
+        y = np.where(weights, values, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            count = weights.sum(axis=1)
+            x_mean = (x * weights).sum(axis=1) / count
+            y_mean = y.sum(axis=1) / count
+            dx = np.where(weights, x - x_mean[:, None], 0.0)
+            return (dx * (y - y_mean[:, None]) * weights).sum(axis=1) / (dx * dx).sum(axis=1)
+
+    def outliers(self) -> np.ndarray:
+        """Boolean (lines x experiments) mask of outlier experiments by total stability."""
+        if not self.total.size:
+            return np.zeros(self.total.shape, dtype=bool)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            median = np.nanmedian(self.total, axis=1, keepdims=True)
+            deviation = np.abs(self.total - median)
+            scale = np.nanmedian(deviation, axis=1, keepdims=True) / 0.6745
+            # 超過半數實驗相同時 MAD 為 0，改用平均絕對偏差估計尺度
+            scale = np.where(scale > 0, scale, 1.253314 * np.nanmean(deviation, axis=1, keepdims=True))
+            z = deviation / scale
+        enough = self.present.sum(axis=1, keepdims=True) >= MIN_OUTLIER_EXPERIMENTS
+        return enough & (np.nan_to_num(z, nan=0.0) > self.outlier_z)
+
+    def error_bars(self) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Error-bar data of every line.
+
+        Returns:
+            Line label -> (experiment positions, total stability, lower error,
+            upper error), where the errors span the lowest and highest section
+        """
+        bars = {}
+        for row, line in enumerate(self.lines):
+            positions = np.flatnonzero(self.present[row])
+            total = self.total[row, positions]
+            bars[line] = (positions, total,
+                          total - self.minimum[row, positions],
+                          self.maximum[row, positions] - total)
+        return bars
+
+    def results_table(self) -> 'pd.DataFrame':
+        """All section results, one row per (experiment, line, section)."""
+        table = self.table.drop(columns='_position')
+        return table if self.has_lines else table.drop(columns='波長')
+
+    def summary(self) -> 'pd.DataFrame':
+        """
+        Cross-experiment statistics of every line.
+
+        Returns:
+            DataFrame with the mean, spread and range of the total stability,
+            the run-to-run drift of stability and intensity, and the outlier
+            experiments
+        """
+        import pandas as pd
+        columns = ['波長', '實驗數', '平均穩定度', '穩定度標準差', '最低穩定度', '最高穩定度',
+                   '穩定度漂移(每次實驗)', '強度漂移(%/每次實驗)', '離群實驗']
+        if not self.total.size:
+            return pd.DataFrame(columns=columns if self.has_lines else columns[1:])
+        outliers = self.outliers()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            intensity_mean = np.nanmean(self.intensity, axis=1)
+            summary = pd.DataFrame(dict(zip(columns, [
+                list(self.lines),
+                self.present.sum(axis=1),
+                np.nanmean(self.total, axis=1),
+                np.nanstd(self.total, axis=1),
+                np.nanmin(self.total, axis=1),
+                np.nanmax(self.total, axis=1),
+                self._drift(self.total),
+                self._drift(self.intensity) / intensity_mean * 100,
+                [", ".join(self.labels[i] for i in np.flatnonzero(row)) for row in outliers],
+            ])))
+        return summary if self.has_lines else summary.drop(columns='波長')
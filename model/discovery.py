@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import time
+import logging
+from contextlib import contextmanager
+from typing import Iterator, List, Dict, Optional
+from dataclasses import dataclass, field, asdict
+
+logger = logging.getLogger(__name__)
+
+# 光譜檔名格式：<base_name>_S<序號>.txt
+SPECTRUM_FILE_PATTERN = re.compile(r'^(?P<base>.+)_S(?P<index>\d+)\.txt$', re.IGNORECASE)
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.expanduser('~'), '.oes_analyzer', 'run_catalog.json')
+# 目錄中保留的資料夾數，超過時刪除最久以前掃描的
+MAX_CATALOG_FOLDERS = 500
+
+
+@dataclass
+class RunInfo:
+    """Data class describing one acquisition run (base name + ``_S####`` range) in a folder."""
+    base_name: str
+    start_index: int
+    end_index: int
+    count: int
+    gaps: List[int] = field(default_factory=list)
+    duplicates: List[int] = field(default_factory=list)
+    file_names: List[str] = field(default_factory=list)  # 掃描到的檔名，依序號排列（與 sequences 對應）
+
+    @property
+    def is_complete(self) -> bool:
+        """True if the run has no missing and no duplicated indices."""
+        return not self.gaps and not self.duplicates
+
+    @property
+    def sequences(self) -> List[int]:
+        """File indices present in the run, in order."""
+        gaps = set(self.gaps)
+        return [i for i in range(self.start_index, self.end_index + 1) if i not in gaps]
+
+    def file_paths(self, folder_path: str) -> List[str]:
+        """
+        Paths of the run's files in ``folder_path``, in index order.
+
+        The discovered file names are used as found (any zero padding or
+        extension case); names are only rebuilt as ``_S####.txt`` for a
+        run without them.
+        """
+        if self.file_names:
+            return [os.path.join(folder_path, name) for name in self.file_names]
+        return [os.path.join(folder_path, f"{self.base_name}_S{str(i).zfill(4)}.txt") for i in self.sequences]
+
+
+def group_runs(indices: Dict[str, List[int]], names: Optional[Dict[str, Dict[int, str]]] = None) -> List[RunInfo]:
+    """
+    Build RunInfo entries from the file indices found for each base name.
+
+    Args:
+        indices: Mapping of base name to the (unsorted) file indices found
+        names: Mapping of base name to the file name of every index, if known
+
+    Returns:
+        List of RunInfo, the run with the most files first
+    """
+    runs = []
+    for base_name, run_indices in indices.items():
+        run_indices = sorted(run_indices)
+        unique = sorted(set(run_indices))
+        duplicates = sorted({i for prev, i in zip(run_indices, run_indices[1:]) if prev == i})
+        present = set(unique)
+        gaps = [i for i in range(unique[0], unique[-1] + 1) if i not in present]
+        file_names = [names[base_name][i] for i in unique] if names is not None else []
+        runs.append(RunInfo(base_name, unique[0], unique[-1], len(run_indices), gaps, duplicates, file_names))
+
+    runs.sort(key=lambda run: (-run.count, run.base_name))
+    return runs
+
+
+class RunDiscovery:
+    """
+    Discovery service for the spectrum runs stored in a folder.
+
+    A folder is listed once with ``os.scandir``; every base name and its index
+    range is detected in that single pass. Results are kept in a run catalog
+    keyed by the folder's modification time and persisted to disk, so scanning
+    an unchanged folder again (e.g. on every browse or analysis click) does
+    not touch the directory listing. Folders that no longer exist are dropped
+    when the catalog is loaded, and only the ``max_folders`` most recently
+    scanned folders are kept.
+    """
+
+    def __init__(self, catalog_path: Optional[str] = DEFAULT_CATALOG_PATH, max_folders: int = MAX_CATALOG_FOLDERS):
+        """
+        Initialize the discovery service.
+
+        Args:
+            catalog_path: JSON file used to persist the run catalog, or None
+                to keep the catalog in memory only
+            max_folders: Number of folders kept in the catalog
+        """
+        self.catalog_path = catalog_path
+        self.max_folders = max_folders
+        self._catalog: Dict[str, dict] = self._load_catalog()
+        self._batch_depth = 0
+        self._dirty = False
+
+    def _load_catalog(self) -> Dict[str, dict]:
+        if not self.catalog_path or not os.path.exists(self.catalog_path):
+            return {}
+        try:
+            with open(self.catalog_path, 'r', encoding='utf-8') as file:
+                catalog = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable run catalog {self.catalog_path}: {e}")
+            return {}
+        # 啟動時清除已不存在的資料夾（只在載入時檢查一次）
+        existing = {folder: entry for folder, entry in catalog.items() if os.path.isdir(folder)}
+        if len(existing) < len(catalog):
+            logger.info(f"Dropped {len(catalog) - len(existing)} missing folders from the run catalog")
+        return existing
+
+    def _prune_catalog(self) -> None:
+        """只保留最近掃描的 max_folders 個資料夾"""
+        if len(self._catalog) <= self.max_folders:
+            return
+        recent = sorted(self._catalog, key=lambda folder: self._catalog[folder].get('scanned_at', 0.0), reverse=True)
+        for folder in recent[self.max_folders:]:
+            del self._catalog[folder]
+
+    def _save_catalog(self) -> None:
+        if not self.catalog_path:
+            return
+        self._prune_catalog()
+        self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+            tmp_path = self.catalog_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self._catalog, file, ensure_ascii=False)
+            os.replace(tmp_path, self.catalog_path)
+        except OSError as e:
+            logger.warning(f"Could not persist run catalog {self.catalog_path}: {e}")
+
+    @contextmanager
+    def batch(self) -> Iterator['RunDiscovery']:
+        """Scan many folders and write the catalog once at the end instead of after every folder."""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._dirty:
+                self._save_catalog()
+
+    @staticmethod
+    def scan_entries(folder_path: str) -> List[RunInfo]:
+        """
+        List a folder once and group its spectrum files into runs.
+
+        Args:
+            folder_path: Folder containing the spectrum files
+
+        Returns:
+            List of RunInfo, the run with the most files first
+        """
+        indices: Dict[str, List[int]] = {}
+        names: Dict[str, Dict[int, str]] = {}
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                match = SPECTRUM_FILE_PATTERN.match(entry.name)
+                if match is None or not entry.is_file():
+                    continue
+                index = int(match.group('index'))
+                indices.setdefault(match.group('base'), []).append(index)
+                # 重複序號（例如 _S1 與 _S0001）取排序最前的檔名，結果與列出順序無關
+                run_names = names.setdefault(match.group('base'), {})
+                run_names[index] = min(run_names.get(index, entry.name), entry.name)
+        return group_runs(indices, names)
+
+    def scan(self, folder_path: str, use_cache: bool = True) -> List[RunInfo]:
+        """
+        Return all runs of a folder, using the catalog if the folder is unchanged.
+
+        Args:
+            folder_path: Folder containing the spectrum files
+            use_cache: Set to False to force a fresh directory listing
+
+        Returns:
+            List of RunInfo, the run with the most files first
+        """
+        key = os.path.abspath(folder_path)
+        mtime_ns = os.stat(key).st_mtime_ns
+        cached = self._catalog.get(key)
+        # 舊版目錄沒有記錄檔名，重新掃描
+        if (use_cache and cached is not None and cached.get('mtime_ns') == mtime_ns
+                and all('file_names' in run for run in cached['runs'])):
+            return [RunInfo(**run) for run in cached['runs']]
+
+        runs = self.scan_entries(key)
+        for run in runs:
+            if run.gaps:
+                logger.warning(f"{run.base_name}: {len(run.gaps)} missing indices in {key}")
+            if run.duplicates:
+                logger.warning(f"{run.base_name}: duplicated indices {run.duplicates} in {key}")
+        self._catalog[key] = {'mtime_ns': mtime_ns, 'scanned_at': time.time(), 'runs': [asdict(run) for run in runs]}
+        self._dirty = True
+        if not self._batch_depth:
+            self._save_catalog()
+        return runs
+
+    def primary_run(self, folder_path: str) -> Optional[RunInfo]:
+        """Return the run with the most files in a folder, or None if there is none."""
+        runs = self.scan(folder_path)
+        return runs[0] if runs else None
@@ -0,0 +1,168 @@
+import logging
+from typing import List, Optional, Sequence, Tuple, TYPE_CHECKING
+import numpy as np
+
+from model.aggregates import SpectralAggregates
+from model.ranking import MARKED_PEAKS, spaced_top_k
+
+# pandas 只在輸出表格時才載入
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 各實驗最大值包絡線的百分位數
+DEFAULT_PERCENTILES = (10.0, 50.0, 90.0)
+
+
+class BatchEnvelope:
+    """
+    Per-wavelength envelope of many runs, built one run at a time.
+
+    Every run is added as its ``SpectralAggregates``, so only one run's
+    spectra are ever in memory. Over all spectra of all runs the minimum,
+    maximum and mean are kept as merged aggregates; in addition the maximum
+    envelope of every run is kept (runs x wavelengths), from which the
+    percentiles across runs and the run holding each maximum are reduced
+    with one vectorized call. A line that is high in a few runs only (a
+    contamination line) stands out as a maximum far above the median.
+    """
+
+    def __init__(self):
+        """Initialize an empty envelope."""
+        self.totals = SpectralAggregates()
+        self.runs: List[str] = []
+        self._run_maxima: List[Tuple[np.ndarray, np.ndarray]] = []  # 每個實驗有值的 (波長, 最大值)
+
+    def __len__(self) -> int:
+        return len(self.runs)
+
+    def add(self, label: str, aggregates: SpectralAggregates) -> None:
+        """
+        Fold the aggregates of one run into the envelope.
+
+        Args:
+            label: Name of the run
+            aggregates: Aggregates of all spectra of the run
+        """
+        present = aggregates.present
+        if not present.any():
+            logger.warning(f"Run {label} has no data, skipped")
+            return
+        self.totals.merge(aggregates)
+        self.runs.append(label)
+        self._run_maxima.append((aggregates.wavelengths[present], aggregates.maximum[present]))
+
+    @property
+    def wavelengths(self) -> np.ndarray:
+        return self.totals.wavelengths
+
+    @property
+    def maximum(self) -> np.ndarray:
+        """Largest intensity of every wavelength over all spectra of all runs."""
+        return self.totals.maximum
+
+    @property
+    def minimum(self) -> np.ndarray:
+        return self.totals.minimum
+
+    @property
+    def mean(self) -> np.ndarray:
+        """Mean intensity of every wavelength over all spectra of all runs."""
+        return self.totals.mean
+
+    def run_maxima(self) -> np.ndarray:
+        """Maximum envelope of every run on the common wavelength grid (runs x wavelengths, NaN where absent)."""
+        matrix = np.full((len(self.runs), len(self.wavelengths)), np.nan)
+        for row, (wavelengths, maximum) in enumerate(self._run_maxima):
+            matrix[row, np.searchsorted(self.wavelengths, wavelengths)] = maximum
+        return matrix
+
+    def percentiles(self, percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> np.ndarray:
+        """Percentiles of the run maxima of every wavelength (percentiles x wavelengths)."""
+        matrix = self.run_maxima()
+        with np.errstate(invalid='ignore'):
+            return np.nanpercentile(matrix, percentiles, axis=0)
+
+    def max_runs(self) -> List[str]:
+        """Run holding the maximum of every wavelength."""
+        matrix = self.run_maxima()
+        matrix[np.isnan(matrix)] = -np.inf
+        return [self.runs[row] for row in np.argmax(matrix, axis=0).tolist()]
+
+    def peaks(self, skip_range_nm: float, count: int = MARKED_PEAKS) -> List[dict]:
+        """Strongest envelope peaks more than ``skip_range_nm`` apart, with the run holding each."""
+        selected = spaced_top_k(self.wavelengths, self.maximum, count, skip_range_nm, self.totals.present)
+        runs = self.max_runs()
+        return [{'波段': float(self.wavelengths[index]), '最大值': float(self.maximum[index]), '實驗': runs[index]}
+                for index in selected.tolist()]
+
+    def table(self, percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> 'pd.DataFrame':
+        """Envelope summary, one row per wavelength."""
+        import pandas as pd
+        present = self.totals.present
+        columns = {
+            '波段': self.wavelengths[present],
+            '最大值': self.maximum[present],
+            '最小值': self.minimum[present],
+            '平均值': self.mean[present],
+        }
+        for q, values in zip(percentiles, self.percentiles(percentiles)):
+            columns[f'P{q:g}'] = values[present]
+        columns['最大值實驗'] = np.asarray(self.max_runs(), dtype=object)[present]
+        return pd.DataFrame(columns)
+
+
+def render_envelope_plot(envelope: BatchEnvelope, output_path: str, skip_range_nm: float,
+                         percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> str:
+    """
+    Overlay the envelope of all runs: the maximum, the mean and the band
+    between the lowest and highest percentile of the run maxima; the
+    strongest peaks are marked like in the single-run spectrum plot.
+
+    Returns:
+        The output path
+    """
+    from matplotlib.figure import Figure
+    present = envelope.totals.present
+    wavelengths = envelope.wavelengths[present]
+    spread = envelope.percentiles(percentiles)[:, present]
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+    ax.fill_between(wavelengths, spread[0], spread[-1], color='orange', alpha=0.3,
+                    label=f'P{percentiles[0]:g}-P{percentiles[-1]:g} of run maxima')
+    ax.plot(wavelengths, envelope.maximum[present], color='red', linewidth=1, label='Maximum')
+    ax.plot(wavelengths, envelope.mean[present], color='blue', linewidth=1, label='Mean')
+
+    peaks = envelope.peaks(skip_range_nm)
+    for peak in peaks:
+        ax.annotate(
+            f'intensity: {peak["最大值"]:.1f}\n{peak["實驗"]}',
+            xy=(peak['波段'], peak['最大值']),
+            xytext=(-20, -20), textcoords='offset points',
+            arrowprops=dict(arrowstyle='->', lw=1.5, linestyle='dashed'),
+            color='red'
+        )
+    peak_values = [f"{peak['波段']:.1f}nm" for peak in peaks]
+    ax.set_title(f'Envelope of {len(envelope)} runs\nTop {len(peaks)} Peaks: {", ".join(peak_values)}')
+    ax.set_xlabel('Wavelength(nm)')
+    ax.set_ylabel('Intensity(Cts)')
+    ax.legend()
+    fig.savefig(output_path, dpi=300, bbox_inches='tight')
+    return output_path
+
+
+def write_envelope_excel(envelope: BatchEnvelope, excel_name: str, skip_range_nm: float,
+                         csv_name: Optional[str] = None) -> str:
+    """將包絡線、峰值與實驗列表寫入 Excel；指定 csv_name 時另存包絡線 CSV"""
+    import pandas as pd
+    table = envelope.table()
+    with pd.ExcelWriter(excel_name) as writer:
+        table.to_excel(writer, sheet_name='包絡線', index=False)
+        pd.DataFrame(envelope.peaks(skip_range_nm), columns=['波段', '最大值', '實驗']).to_excel(
+            writer, sheet_name='峰值', index=False)
+        pd.DataFrame({'實驗': envelope.runs}).to_excel(writer, sheet_name='實驗列表', index=False)
+    if csv_name:
+        table.to_csv(csv_name, index=False, encoding='utf-8-sig')
+    return excel_name
@@ -0,0 +1,105 @@
+import logging
+from typing import List, Optional
+import numpy as np
+from model.spectrum_format import FormatRegistry, SpectrumFormat
+
+logger = logging.getLogger(__name__)
+
+
+class WavebandExtractor:
+    """
+    Extractor that pulls a few wavebands out of many spectrum files.
+
+    The requested wavebands are resolved to line numbers once, from the first
+    file. Every other file is then only split into lines and the few matching
+    lines are parsed, instead of parsing every data point of every file. A
+    file whose layout differs (the wavelength on the cached line does not
+    match) is resolved again, so mixed layouts still give correct values.
+    While a waveband has not been found, every file is resolved, so a
+    waveband missing from the first file is read from the files that have it.
+    """
+
+    def __init__(self, wavebands: List[float], formats: Optional[FormatRegistry] = None):
+        """
+        Initialize the extractor.
+
+        Args:
+            wavebands: Wavelengths to extract (exact values as written in the files)
+            formats: Per-folder file format cache (default: a new one)
+        """
+        self.wavebands = [float(waveband) for waveband in wavebands]
+        self.formats = formats if formats is not None else FormatRegistry()
+        self._line_numbers: Optional[List[Optional[int]]] = None
+
+    @staticmethod
+    def _fields(line: str, file_format: SpectrumFormat) -> List[str]:
+        parts = line.split() if file_format.delimiter == ' ' else line.split(file_format.delimiter)
+        if file_format.decimal != '.':
+            parts = [part.replace(file_format.decimal, '.') for part in parts[:2]]
+        return parts
+
+    def _resolve(self, lines: List[str], file_format: SpectrumFormat) -> List[Optional[int]]:
+        """Find the line number of every waveband, None if a waveband is absent."""
+        pattern = file_format.pattern()
+        positions = {}
+        for line_number, line in enumerate(lines):
+            if not pattern.match(line):
+                continue
+            wave = float(self._fields(line, file_format)[0])
+            positions.setdefault(wave, line_number)
+        return [positions.get(waveband) for waveband in self.wavebands]
+
+    def _read_lines(self, lines: List[str], line_numbers: List[Optional[int]],
+                    file_format: SpectrumFormat) -> Optional[np.ndarray]:
+        """Parse the cached lines; return None if the layout does not match."""
+        pattern = file_format.pattern()
+        values = np.full(len(self.wavebands), np.nan)
+        for column, (waveband, line_number) in enumerate(zip(self.wavebands, line_numbers)):
+            if line_number is None:
+                continue
+            if line_number >= len(lines) or not pattern.match(lines[line_number]):
+                return None
+            parts = self._fields(lines[line_number], file_format)
+            if float(parts[0]) != waveband:
+                return None
+            values[column] = float(parts[1])
+        return values
+
+    def extract_file(self, file_path: str) -> np.ndarray:
+        """
+        Extract the wavebands from one file.
+
+        Args:
+            file_path: Path to the spectrum file
+
+        Returns:
+            Intensity of every waveband, NaN where the file has no such waveband
+        """
+        file_format = self.formats.format_for(file_path)
+        with open(file_path, 'r', encoding=file_format.encoding, errors='replace') as file:
+            lines = file.read().splitlines()
+        if self._line_numbers is not None and None not in self._line_numbers:
+            values = self._read_lines(lines, self._line_numbers, file_format)
+            if values is not None:
+                return values
+        # 第一個檔案、版面不同，或仍有波段未找到時，以此檔案重新對應行號
+        self._line_numbers = self._resolve(lines, file_format)
+        return self._read_lines(lines, self._line_numbers, file_format)
+
+    def extract(self, file_paths: List[str]) -> np.ndarray:
+        """
+        Extract the wavebands from many files.
+
+        Args:
+            file_paths: Files to read, in time order
+
+        Returns:
+            Intensity matrix (files x wavebands), NaN for unreadable files
+        """
+        matrix = np.full((len(file_paths), len(self.wavebands)), np.nan)
+        for row, file_path in enumerate(file_paths):
+            try:
+                matrix[row] = self.extract_file(file_path)
+            except Exception as e:
+                logger.error(f"Error processing file {file_path}: {e}")
+        return matrix
@@ -0,0 +1,99 @@
+import os
+from typing import List, Optional
+from dataclasses import dataclass
+import numpy as np
+
+
+@dataclass
+class FileRecord:
+    """Data class for storing the metadata of one spectrum file."""
+    file_id: int
+    path: str
+    sequence: int
+    mtime: float
+
+
+class FileTable:
+    """
+    Index table of the spectrum files of one analysis.
+
+    Every file is assigned an integer file id (its row in the table), so the
+    data model only stores ids instead of repeating file names for every
+    wavelength. Sequence numbers (the ``_S####`` suffix) are parsed once when
+    the file is registered and kept in an array, so time-index lookups are
+    plain array indexing.
+    """
+
+    def __init__(self):
+        """Initialize an empty file table."""
+        self._paths: List[str] = []
+        self._sequences: List[int] = []
+        self._mtimes: List[float] = []
+        self._sequence_array: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    @staticmethod
+    def parse_sequence(file_name: str) -> int:
+        """
+        Parse the sequence number from a file name like ``base_S0012.txt``.
+
+        Args:
+            file_name: File name or path
+
+        Returns:
+            Sequence number, or -1 if the name has no ``_S####`` suffix
+        """
+        stem = os.path.splitext(os.path.basename(file_name))[0]
+        if '_S' not in stem:
+            return -1
+        try:
+            return int(stem.rsplit('_S', 1)[-1])
+        except ValueError:
+            return -1
+
+    def add(self, file_path: str, mtime: Optional[float] = None) -> int:
+        """
+        Register a file and return its file id.
+
+        Args:
+            file_path: Path to the spectrum file
+            mtime: Modification time, read from the file system if omitted
+
+        Returns:
+            Integer file id of the registered file
+        """
+        if mtime is None:
+            try:
+                mtime = os.path.getmtime(file_path)
+            except OSError:
+                mtime = 0.0
+        self._paths.append(file_path)
+        self._sequences.append(self.parse_sequence(file_path))
+        self._mtimes.append(mtime)
+        self._sequence_array = None
+        return len(self._paths) - 1
+
+    def record(self, file_id: int) -> FileRecord:
+        """Return the full metadata record of a file id."""
+        return FileRecord(file_id, self._paths[file_id], self._sequences[file_id], self._mtimes[file_id])
+
+    def path(self, file_id: int) -> str:
+        """Return the path of a file id."""
+        return self._paths[file_id]
+
+    def name(self, file_id: int) -> str:
+        """Return the file name (without directory) of a file id."""
+        return os.path.basename(self._paths[file_id])
+
+    @property
+    def sequences(self) -> np.ndarray:
+        """Sequence numbers of all files, indexed by file id."""
+        if self._sequence_array is None:
+            self._sequence_array = np.asarray(self._sequences, dtype=np.int64)
+        return self._sequence_array
+
+    def time_point(self, file_id: int) -> str:
+        """Return the zero padded time point label (``'0012'``) of a file id."""
+        return str(self._sequences[file_id]).zfill(4)
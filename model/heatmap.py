@@ -0,0 +1,305 @@
+import os
+import shutil
+import logging
+import weakref
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEATMAP_DIR = os.path.join(os.path.expanduser('~'), '.oes_analyzer', 'heatmaps')
+
+# 每個圖塊的大小（列 x 行），顯示時以圖塊為單位讀取與快取
+TILE_SIZE = 256
+# 記憶體中保留的圖塊數（float32 時每塊 256 KB）
+DEFAULT_TILE_CACHE = 256
+# 磁碟上熱圖的總大小上限 (bytes)，超過時刪除最久未使用的；10,000 x 3,600 的一次實驗約 190 MB
+DEFAULT_MAX_HEATMAP_BYTES = 2 * 1024 ** 3
+# 建立較粗層級時每次處理的列數，限制記憶體用量
+_BUILD_ROWS = 4096
+
+
+def _halve(block: np.ndarray) -> np.ndarray:
+    """
+    Halve a block along both axes, keeping the maximum of every 2 x 2 cell.
+
+    The maximum (not the mean) is kept so narrow emission lines and short
+    bursts stay visible in the coarse levels; NaN is ignored.
+    """
+    rows, cols = block.shape
+    if rows % 2:
+        block = np.vstack([block, np.full((1, cols), np.nan, dtype=block.dtype)])
+    if cols % 2:
+        block = np.hstack([block, np.full((block.shape[0], 1), np.nan, dtype=block.dtype)])
+    with np.errstate(invalid='ignore'):
+        block = np.fmax(block[0::2], block[1::2])
+        return np.fmax(block[:, 0::2], block[:, 1::2])
+
+
+def _write_pyramid(directory: str, base: np.ndarray) -> int:
+    """
+    Write the coarser levels below ``base`` into ``directory``.
+
+    The level memmaps are local to this function, so none is left open when
+    it returns.
+
+    Returns:
+        Number of levels including ``base``
+    """
+    levels = [base]
+    while max(levels[-1].shape) > TILE_SIZE:
+        previous = levels[-1]
+        shape = ((previous.shape[0] + 1) // 2, (previous.shape[1] + 1) // 2)
+        level = np.lib.format.open_memmap(os.path.join(directory, f'level_{len(levels)}.npy'), mode='w+',
+                                          dtype=np.float32, shape=shape)
+        for start in range(0, previous.shape[0], _BUILD_ROWS):
+            level[start // 2:(start + _BUILD_ROWS + 1) // 2] = _halve(np.asarray(previous[start:start + _BUILD_ROWS]))
+        levels.append(level)
+    for level in levels:
+        level.flush()
+    return len(levels)
+
+
+def _directory_size(directory: str) -> int:
+    """Total size of the files directly in a directory."""
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+# 目前開啟中的熱圖；其目錄的檔案仍被 memmap 使用，清理快取時跳過
+_open_heatmaps: 'weakref.WeakSet[SpectralHeatmap]' = weakref.WeakSet()
+
+
+class SpectralHeatmap:
+    """
+    Multi-resolution (time x wavelength) intensity image of one run, stored on disk.
+
+    Level 0 holds every file and wavelength; each further level halves both
+    axes until the image fits in one tile. Every level is a ``.npy`` file that
+    is memory-mapped, so opening a heatmap reads nothing, and ``region`` only
+    reads the tiles of the level whose resolution matches the requested
+    output size. Tiles are kept in an in-memory LRU cache, so panning and
+    zooming over a 10,000 x 3,600 run reads each tile once.
+    """
+
+    def __init__(self, directory: str, max_cached_tiles: int = DEFAULT_TILE_CACHE):
+        """
+        Open a heatmap written by ``build``.
+
+        Args:
+            directory: Heatmap directory
+            max_cached_tiles: Number of tiles kept in memory
+        """
+        self.directory = directory
+        meta = np.load(os.path.join(directory, 'meta.npz'))
+        self.wavelengths = meta['wavelengths']
+        self.times = meta['times']
+        self.levels = [np.load(os.path.join(directory, f'level_{level}.npy'), mmap_mode='r')
+                       for level in range(int(meta['level_count']))]
+        self.max_cached_tiles = max_cached_tiles
+        self._tiles: 'OrderedDict[Tuple[int, int, int], np.ndarray]' = OrderedDict()
+        _open_heatmaps.add(self)
+
+    def close(self) -> None:
+        """Release the memory maps so the directory can be removed (needed on Windows)."""
+        self.levels = []
+        self._tiles.clear()
+        _open_heatmaps.discard(self)
+
+    @property
+    def is_open(self) -> bool:
+        """False after ``close``."""
+        return bool(self.levels)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """(files, wavelengths) of the full-resolution level."""
+        return self.levels[0].shape
+
+    @property
+    def extent(self) -> Tuple[float, float, float, float]:
+        """(first wavelength, last wavelength, first time, last time) of the whole run."""
+        return (float(self.wavelengths[0]), float(self.wavelengths[-1]),
+                float(self.times[0]), float(self.times[-1]))
+
+    def color_limits(self, low: float = 1.0, high: float = 99.0) -> Tuple[float, float]:
+        """Intensity percentiles of the coarsest level, for a color scale shared by every zoom."""
+        overview = np.asarray(self.levels[-1])
+        if np.isnan(overview).all():
+            return 0.0, 1.0
+        vmin, vmax = np.nanpercentile(overview, [low, high])
+        return float(vmin), float(vmax if vmax > vmin else vmin + 1.0)
+
+    @classmethod
+    def build(cls, directory: str, chunks: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]],
+              times: np.ndarray, progress_callback: Optional[Callable[[int, int], None]] = None) -> 'SpectralHeatmap':
+        """
+        Write the pyramid of a run from its spectra chunks.
+
+        The wavelength grid is taken from the first chunk; values of other
+        chunks are placed on it by exact wavelength. Files without data stay NaN.
+
+        Args:
+            directory: Heatmap directory to create (replaced atomically)
+            chunks: (file ids, sorted wavelengths, intensity matrix) per chunk,
+                as yielded by ``OESAnalyzer.iter_spectra_chunks``
+            times: Time point (file sequence) of every file id
+            progress_callback: Called with (files written, total files) after each chunk
+
+        Returns:
+            The opened heatmap
+
+        Raises:
+            ValueError: If no chunk contains data
+        """
+        times = np.asarray(times)
+        building = f"{directory}.building"
+        shutil.rmtree(building, ignore_errors=True)
+        os.makedirs(building)
+        base = None
+        wavelengths = None
+        try:
+            for file_ids, chunk_wavelengths, block in chunks:
+                if base is None:
+                    wavelengths = chunk_wavelengths
+                    base = np.lib.format.open_memmap(os.path.join(building, 'level_0.npy'), mode='w+',
+                                                     dtype=np.float32, shape=(len(times), len(wavelengths)))
+                    base[:] = np.nan
+                if len(chunk_wavelengths) == len(wavelengths) and np.array_equal(chunk_wavelengths, wavelengths):
+                    base[file_ids] = block
+                else:
+                    cols = np.clip(np.searchsorted(wavelengths, chunk_wavelengths), 0, len(wavelengths) - 1)
+                    on_grid = wavelengths[cols] == chunk_wavelengths
+                    rows = np.full((len(file_ids), len(wavelengths)), np.nan, dtype=np.float32)
+                    rows[:, cols[on_grid]] = block[:, on_grid]
+                    base[file_ids] = rows
+                if progress_callback:
+                    progress_callback(int(file_ids[-1]) + 1, len(times))
+            if base is None:
+                raise ValueError("No spectrum data to draw")
+            level_count = _write_pyramid(building, base)
+            np.savez(os.path.join(building, 'meta.npz'), wavelengths=wavelengths, times=times,
+                     level_count=level_count)
+        except BaseException:
+            base = None
+            shutil.rmtree(building, ignore_errors=True)
+            raise
+        # 改名前釋放最後一個 memmap；Windows 上開啟中的檔案無法改名或刪除
+        base = None
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(building, directory)
+        logger.info(f"Built heatmap {directory} ({len(times)} x {len(wavelengths)})")
+        return cls(directory)
+
+    @classmethod
+    def open_or_build(cls, cache_root: str, key: str, read_chunks: Callable[[], Iterable],
+                      times: np.ndarray, progress_callback: Optional[Callable[[int, int], None]] = None,
+                      max_bytes: int = DEFAULT_MAX_HEATMAP_BYTES) -> 'SpectralHeatmap':
+        """
+        Open the cached heatmap of ``key``, building it first if needed.
+
+        Args:
+            cache_root: Directory holding one subdirectory per heatmap
+            key: Identity of the input (file fingerprint and preprocessing)
+            read_chunks: Returns the spectra chunks (only called when building)
+            times: Time point of every file
+            progress_callback: See ``build``
+            max_bytes: Total size of the heatmaps kept in ``cache_root``
+
+        Returns:
+            The opened heatmap
+        """
+        directory = os.path.join(cache_root, key)
+        if os.path.exists(os.path.join(directory, 'meta.npz')):
+            try:
+                heatmap = cls(directory)
+                os.utime(directory)  # 記錄最近使用時間，供清理時排序
+                logger.info(f"Reusing cached heatmap {directory}")
+                return heatmap
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Cached heatmap {directory} is unreadable, rebuilding: {e}")
+        os.makedirs(cache_root, exist_ok=True)
+        heatmap = cls.build(directory, read_chunks(), times, progress_callback)
+        cls._prune(cache_root, max_bytes, keep=directory)
+        return heatmap
+
+    @staticmethod
+    def _prune(cache_root: str, max_bytes: int, keep: str) -> None:
+        """刪除最久未使用的熱圖，直到總大小不超過 max_bytes；開啟中的熱圖不刪除"""
+        in_use = {os.path.abspath(heatmap.directory) for heatmap in _open_heatmaps}
+        in_use.add(os.path.abspath(keep))
+        entries = [entry for entry in os.scandir(cache_root) if entry.is_dir() and not entry.name.endswith('.building')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        total = 0
+        for entry in entries:
+            size = _directory_size(entry.path)
+            if total + size > max_bytes and os.path.abspath(entry.path) not in in_use:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            total += size
+
+    def _tile(self, level: int, row: int, col: int) -> np.ndarray:
+        key = (level, row, col)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+        data = self.levels[level]
+        tile = np.array(data[row * TILE_SIZE:(row + 1) * TILE_SIZE, col * TILE_SIZE:(col + 1) * TILE_SIZE])
+        self._tiles[key] = tile
+        if len(self._tiles) > self.max_cached_tiles:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def region(self, time_range: Tuple[float, float], wave_range: Tuple[float, float],
+               max_rows: int, max_cols: int) -> Tuple[np.ndarray, Tuple[float, float, float, float]]:
+        """
+        Image of a time x wavelength window at the resolution of the output.
+
+        The coarsest level that still has at least ``max_rows`` x ``max_cols``
+        pixels over the window is used (level 0 when zoomed in far enough).
+
+        Args:
+            time_range: (first, last) time point of the window
+            wave_range: (first, last) wavelength of the window
+            max_rows: Output height in pixels
+            max_cols: Output width in pixels
+
+        Returns:
+            Tuple of the image (time rows x wavelength columns) and its extent
+            (first wavelength, last wavelength, first time, last time)
+        """
+        n_rows, n_cols = self.shape
+        row0 = int(np.clip(np.searchsorted(self.times, min(time_range), side='right') - 1, 0, n_rows - 1))
+        row1 = int(np.clip(np.searchsorted(self.times, max(time_range), side='left') + 1, row0 + 1, n_rows))
+        col0 = int(np.clip(np.searchsorted(self.wavelengths, min(wave_range), side='right') - 1, 0, n_cols - 1))
+        col1 = int(np.clip(np.searchsorted(self.wavelengths, max(wave_range), side='left') + 1, col0 + 1, n_cols))
+
+        level = 0
+        while (level + 1 < len(self.levels)
+               and (row1 - row0) >> (level + 1) >= max(max_rows, 1)
+               and (col1 - col0) >> (level + 1) >= max(max_cols, 1)):
+            level += 1
+        scale = 1 << level
+        data = self.levels[level]
+        r0, c0 = row0 // scale, col0 // scale
+        r1 = min(-(-row1 // scale), data.shape[0])
+        c1 = min(-(-col1 // scale), data.shape[1])
+
+        image = np.empty((r1 - r0, c1 - c0), dtype=np.float32)
+        for tile_row in range(r0 // TILE_SIZE, (r1 - 1) // TILE_SIZE + 1):
+            for tile_col in range(c0 // TILE_SIZE, (c1 - 1) // TILE_SIZE + 1):
+                tile = self._tile(level, tile_row, tile_col)
+                top, left = tile_row * TILE_SIZE, tile_col * TILE_SIZE
+                row_start, row_end = max(r0, top), min(r1, top + tile.shape[0])
+                col_start, col_end = max(c0, left), min(c1, left + tile.shape[1])
+                image[row_start - r0:row_end - r0, col_start - c0:col_end - c0] = \
+                    tile[row_start - top:row_end - top, col_start - left:col_end - left]
+
+        # 像素邊界換算回原始的波長與時間
+        first_col, last_col = c0 * scale, min(c1 * scale, n_cols) - 1
+        first_row, last_row = r0 * scale, min(r1 * scale, n_rows) - 1
+        extent = (float(self.wavelengths[first_col]), float(self.wavelengths[last_col]),
+                  float(self.times[first_row]), float(self.times[last_row]))
+        return image, extent
@@ -0,0 +1,197 @@
+import os
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASELINE_ROLLING_MIN = 'rolling_min'
+BASELINE_POLYNOMIAL = 'polynomial'
+SMOOTHING_SAVGOL = 'savgol'
+SMOOTHING_MOVING_AVERAGE = 'moving_average'
+
+# 多項式基線的迭代次數（每次把高於擬合的點壓回擬合值，逐步排除譜峰）
+POLYNOMIAL_ITERATIONS = 20
+
+
+@dataclass(frozen=True)
+class PreprocessConfig:
+    """Data class describing the optional preprocessing applied to every spectrum."""
+    dark_frame: Optional[str] = None  # 暗電流光譜檔，逐波長扣除
+    baseline: Optional[str] = None  # None、BASELINE_ROLLING_MIN 或 BASELINE_POLYNOMIAL
+    baseline_window: int = 101  # 滾動最小值的視窗點數
+    baseline_degree: int = 3  # 多項式基線的階數
+    smoothing: Optional[str] = None  # None、SMOOTHING_SAVGOL 或 SMOOTHING_MOVING_AVERAGE
+    smoothing_window: int = 7  # 平滑視窗點數（奇數）
+    savgol_order: int = 2  # Savitzky-Golay 多項式階數
+
+    @property
+    def is_identity(self) -> bool:
+        """True if the configuration leaves the spectra unchanged."""
+        return self.dark_frame is None and self.baseline is None and self.smoothing is None
+
+    def cache_key(self) -> Optional[tuple]:
+        """Key identifying the preprocessing result, including the dark frame's size and mtime."""
+        if self.is_identity:
+            return None
+        dark_signature = None
+        if self.dark_frame is not None:
+            try:
+                stat = os.stat(self.dark_frame)
+                dark_signature = (self.dark_frame, stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                dark_signature = (self.dark_frame, -1, -1)
+        return (dark_signature, self.baseline, self.baseline_window, self.baseline_degree,
+                self.smoothing, self.smoothing_window, self.savgol_order)
+
+
+def _odd_window(window: int, length: int) -> int:
+    """Clamp a window to an odd size no larger than the spectrum."""
+    window = max(1, min(int(window), length))
+    return window if window % 2 else window - 1
+
+
+def _convolve_rows(block: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """Apply a symmetric-length kernel along every row, padding the edges with the edge value."""
+    half = len(kernel) // 2
+    padded = np.pad(block, ((0, 0), (half, half)), mode='edge')
+    width = block.shape[1]
+    result = np.zeros_like(block)
+    # 每個係數一次處理整個矩陣，迴圈次數只與視窗大小有關
+    for offset, weight in enumerate(kernel):
+        result += weight * padded[:, offset:offset + width]
+    return result
+
+
+def moving_average(block: np.ndarray, window: int) -> np.ndarray:
+    """Centered moving average along every row (cumulative sums, cost independent of the window)."""
+    half = window // 2
+    padded = np.pad(block, ((0, 0), (half + 1, half)), mode='edge')
+    padded[:, 0] = 0.0
+    cumulative = np.cumsum(padded, axis=1)
+    return (cumulative[:, window:] - cumulative[:, :-window]) / window
+
+
+def savgol_kernel(window: int, order: int) -> np.ndarray:
+    """Savitzky-Golay smoothing coefficients (least-squares polynomial value at the window center)."""
+    half = window // 2
+    x = np.arange(-half, half + 1, dtype=float)
+    vander = np.vander(x, min(order, window - 1) + 1, increasing=True)
+    return np.linalg.pinv(vander)[0]
+
+
+def rolling_min_baseline(block: np.ndarray, window: int) -> np.ndarray:
+    """Rolling minimum along every row, smoothed with a moving average of the same window."""
+    window = _odd_window(window, block.shape[1])
+    half = window // 2
+    padded = np.pad(block, ((0, 0), (half, half)), mode='edge')
+    rows, length = padded.shape
+    # van Herk / Gil-Werman：分段前綴與後綴最小值，成本與視窗大小無關
+    segments = -(-length // window)
+    shaped = np.pad(padded, ((0, 0), (0, segments * window - length)), mode='edge').reshape(rows, segments, window)
+    prefix = np.minimum.accumulate(shaped, axis=2).reshape(rows, -1)
+    suffix = np.minimum.accumulate(shaped[:, :, ::-1], axis=2)[:, :, ::-1].reshape(rows, -1)
+    width = block.shape[1]
+    minimum = np.minimum(suffix[:, :width], prefix[:, window - 1:window - 1 + width])
+    return moving_average(minimum, window)
+
+
+def polynomial_baseline(wavelengths: np.ndarray, block: np.ndarray, degree: int,
+                        iterations: int = POLYNOMIAL_ITERATIONS) -> np.ndarray:
+    """
+    Iterative polynomial baseline of every row.
+
+    The least-squares projection is shared by all spectra, so every
+    iteration is a single matrix product over the whole block.
+    """
+    x = (wavelengths - wavelengths.mean()) / (np.ptp(wavelengths) or 1.0)
+    vander = np.vander(x, degree + 1, increasing=True)
+    solve = np.linalg.pinv(vander).T  # (wavelengths x 係數)
+    fitted = block
+    for _ in range(iterations):
+        baseline = (fitted @ solve) @ vander.T
+        fitted = np.minimum(fitted, baseline)
+    return (fitted @ solve) @ vander.T
+
+
+class SpectrumPreprocessor:
+    """
+    Applies dark-frame subtraction, baseline removal and smoothing to a block of spectra.
+
+    Every step works along the wavelength axis of the whole (files x
+    wavelengths) matrix at once. Missing values (NaN) are interpolated for
+    the filters and restored afterwards.
+    """
+
+    def __init__(self, config: PreprocessConfig, dark_spectrum: Optional[Dict[float, float]] = None):
+        """
+        Initialize the preprocessor.
+
+        Args:
+            config: Preprocessing configuration
+            dark_spectrum: Wavelength -> intensity of the dark frame, required
+                when ``config.dark_frame`` is set
+        """
+        self.config = config
+        self._dark = None
+        if config.dark_frame is not None:
+            if not dark_spectrum:
+                raise ValueError(f"Dark frame {config.dark_frame} contains no data")
+            waves = np.array(sorted(dark_spectrum))
+            self._dark = (waves, np.array([dark_spectrum[wave] for wave in waves]))
+
+    @staticmethod
+    def _fill_missing(wavelengths: np.ndarray, block: np.ndarray) -> np.ndarray:
+        missing = np.isnan(block)
+        if not missing.any():
+            return block
+        filled = block.copy()
+        for row in np.flatnonzero(missing.any(axis=1)):
+            present = ~missing[row]
+            if present.any():
+                filled[row, missing[row]] = np.interp(wavelengths[missing[row]], wavelengths[present], block[row, present])
+            else:
+                filled[row] = 0.0
+        return filled
+
+    def apply(self, wavelengths: np.ndarray, block: np.ndarray) -> np.ndarray:
+        """
+        Preprocess a block of spectra.
+
+        Args:
+            wavelengths: Sorted wavelengths of the columns
+            block: Intensity matrix (files x wavelengths), NaN for missing values
+
+        Returns:
+            Preprocessed matrix with the same shape and missing values
+        """
+        config = self.config
+        if config.is_identity or block.size == 0:
+            return block
+        missing = np.isnan(block)
+        result = self._fill_missing(wavelengths, block.astype(float))
+
+        if self._dark is not None:
+            result = result - np.interp(wavelengths, *self._dark)
+
+        if config.baseline == BASELINE_ROLLING_MIN:
+            result = result - rolling_min_baseline(result, config.baseline_window)
+        elif config.baseline == BASELINE_POLYNOMIAL:
+            result = result - polynomial_baseline(wavelengths, result, config.baseline_degree)
+        elif config.baseline is not None:
+            raise ValueError(f"Unknown baseline method: {config.baseline}")
+
+        if config.smoothing is not None:
+            window = _odd_window(config.smoothing_window, result.shape[1])
+            if config.smoothing == SMOOTHING_SAVGOL:
+                kernel = savgol_kernel(window, config.savgol_order)
+                result = _convolve_rows(result, kernel)
+            elif config.smoothing == SMOOTHING_MOVING_AVERAGE:
+                result = moving_average(result, window)
+            else:
+                raise ValueError(f"Unknown smoothing method: {config.smoothing}")
+
+        if missing.any():
+            result[missing] = np.nan
+        return result
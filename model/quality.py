@@ -0,0 +1,203 @@
+import logging
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 異常原因
+QUALITY_UNREADABLE = '無法讀取'  # 檔案損毀或沒有任何數據列
+QUALITY_BLANK = '空白'  # 所有波長強度相同（例如全為 0）
+QUALITY_MISSING = '缺少波長'  # 缺少的波長比例過高（檔案截斷）
+QUALITY_SATURATED = '飽和'  # 達到飽和值的波長比例過高
+QUALITY_OUTLIER = '總強度異常'  # 總強度與前後光譜相差過大（電弧、快門異常）
+
+QUALITY_COLUMNS = ['檔案名', '原因', '總強度', 'z 分數', '飽和比例', '缺少比例', '已排除']
+
+
+@dataclass(frozen=True)
+class QualityConfig:
+    """Data class describing the quality checks applied to every spectrum during ingestion."""
+    saturation_level: Optional[float] = None  # 偵測器飽和值（counts），None 表示不檢查飽和
+    max_saturated_fraction: float = 0.01  # 飽和波長比例上限
+    max_missing_fraction: float = 0.05  # 缺少波長比例上限
+    neighbour_window: int = 11  # 計算前後光譜總強度中位數的視窗（檔案數，奇數）
+    z_threshold: float = 8.0  # 總強度修正 z 分數上限
+    exclude: bool = False  # True 時異常光譜不納入分析，False 時只標記
+
+
+@dataclass
+class FlaggedSpectrum:
+    """Data class holding one spectrum that failed a quality check."""
+    file_id: int
+    path: str
+    reasons: Tuple[str, ...]
+    total: float = np.nan
+    z_score: float = np.nan
+    saturated_fraction: float = np.nan
+    missing_fraction: float = np.nan
+    excluded: bool = False
+
+    def row(self, name: str) -> Dict[str, object]:
+        """Row of the quality sheet."""
+        return dict(zip(QUALITY_COLUMNS, [name, '、'.join(self.reasons), self.total, self.z_score,
+                                          self.saturated_fraction, self.missing_fraction,
+                                          '是' if self.excluded else '否']))
+
+
+def neighbour_z_scores(totals: np.ndarray, window: int) -> np.ndarray:
+    """
+    Modified z-score of every value against the median of its neighbours.
+
+    The median and the median absolute deviation are taken over a centered
+    window, all windows at once; near the ends the window is shifted inwards
+    instead of padded, so repeated edge values cannot shrink the MAD. Where
+    the MAD is 0 the mean absolute deviation is used instead, as in the
+    cross-experiment outlier check.
+    """
+    if len(totals) < 3:
+        return np.zeros(len(totals))
+    window = min(int(window) | 1, len(totals) if len(totals) % 2 else len(totals) - 1)
+    starts = np.clip(np.arange(len(totals)) - window // 2, 0, len(totals) - window)
+    windows = np.lib.stride_tricks.sliding_window_view(totals, window)[starts]
+    median = np.median(windows, axis=1)
+    deviation = np.abs(windows - median[:, None])
+    scale = np.median(deviation, axis=1) / 0.6745
+    scale = np.where(scale > 0, scale, 1.253314 * deviation.mean(axis=1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.abs(totals - median) / scale
+    return np.nan_to_num(z, nan=0.0, posinf=0.0)
+
+
+def screen_spectra(block: np.ndarray, config: QualityConfig) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """
+    Per-file quality checks of every spectrum (row) of an intensity matrix in one vectorized pass.
+
+    The missing-wavelength and total-intensity checks compare a spectrum
+    with the rest of the run and are done by ``run_scores`` once the whole
+    run is screened, so they do not depend on how the files were chunked.
+
+    Args:
+        block: Raw intensity matrix (files x wavelengths), NaN where a file has no value
+        config: Check limits
+
+    Returns:
+        Tuple of (reason -> boolean row mask, measure name -> value per row);
+        measures are 'total' (NaN for blank spectra, which take no part in
+        the outlier check), 'count' (wavelengths with a value) and
+        'saturated_fraction'
+    """
+    missing = np.isnan(block)
+    count = (~missing).sum(axis=1)
+    values = np.where(missing, 0.0, block)
+    totals = values.sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        spread = np.where(missing, -np.inf, block).max(axis=1) - np.where(missing, np.inf, block).min(axis=1)
+    if config.saturation_level is not None:
+        saturated_fraction = (values >= config.saturation_level).sum(axis=1) / np.maximum(count, 1)
+    else:
+        saturated_fraction = np.zeros(len(block))
+
+    blank = ~(spread > 0)
+    reasons = {
+        QUALITY_BLANK: blank,
+        QUALITY_SATURATED: saturated_fraction > config.max_saturated_fraction,
+    }
+    # 空白光譜不參與鄰近中位數，避免連續的空白檔案互相掩護
+    measures = {'total': np.where(blank, np.nan, totals), 'count': count.astype(float),
+                'saturated_fraction': saturated_fraction}
+    return reasons, measures
+
+
+def flag_spectra(file_ids: List[int], paths: List[str], block: np.ndarray,
+                 config: QualityConfig) -> Tuple[np.ndarray, List[FlaggedSpectrum], Dict[str, np.ndarray]]:
+    """
+    Screen a chunk of spectra with the per-file checks.
+
+    Args:
+        file_ids: File id of every row
+        paths: Path of every row
+        block: Raw intensity matrix of the chunk
+        config: Check limits
+
+    Returns:
+        Tuple of the mask of rows to keep, the flagged spectra and the
+        measures of every row (input of ``run_scores``)
+    """
+    reasons, measures = screen_spectra(block, config)
+    bad = np.zeros(len(block), dtype=bool)
+    for mask in reasons.values():
+        bad |= mask
+    flagged = []
+    for row in np.flatnonzero(bad).tolist():
+        flagged.append(FlaggedSpectrum(
+            int(file_ids[row]), paths[row],
+            tuple(reason for reason, mask in reasons.items() if mask[row]),
+            float(np.nan_to_num(measures['total'][row])), np.nan,
+            float(measures['saturated_fraction'][row]), np.nan, config.exclude))
+    keep = ~bad if config.exclude else np.ones(len(block), dtype=bool)
+    return keep, flagged, measures
+
+
+def run_scores(measures: Dict[str, np.ndarray], config: QualityConfig,
+               full_count: Optional[float] = None) -> Dict[str, np.ndarray]:
+    """
+    Missing fraction and neighbour z-score of every screened spectrum of a run.
+
+    Args:
+        measures: Measures of consecutive spectra (see ``screen_spectra``)
+        config: Check limits
+        full_count: Wavelength count of a complete spectrum (default: the
+            largest count in ``measures``)
+
+    Returns:
+        Dict with 'missing_fraction' and 'z_score' per spectrum; blank
+        spectra score 0
+    """
+    totals = measures['total']
+    count = measures['count']
+    if full_count is None:
+        full_count = float(count.max(initial=0))
+    z_scores = np.zeros(len(totals))
+    usable = ~np.isnan(totals)
+    z_scores[usable] = neighbour_z_scores(totals[usable], config.neighbour_window)
+    return {'missing_fraction': 1.0 - count / max(full_count, 1.0), 'z_score': z_scores}
+
+
+def flag_run_checks(file_ids: np.ndarray, paths: List[str], measures: Dict[str, np.ndarray],
+                    scores: Dict[str, np.ndarray], flagged: List[FlaggedSpectrum],
+                    config: QualityConfig) -> Tuple[List[FlaggedSpectrum], List[int]]:
+    """
+    Add the missing-wavelength and total-intensity failures to the spectra flagged by the per-file checks.
+
+    Args:
+        file_ids: File id of every screened spectrum
+        paths: Path of every screened spectrum
+        measures: Measures of every screened spectrum (see ``screen_spectra``)
+        scores: Scores of every screened spectrum (see ``run_scores``), computed
+            over the whole run so they do not depend on how it was read
+        flagged: Spectra flagged by the per-file checks
+        config: Check limits
+
+    Returns:
+        Tuple of all flagged spectra in file order and the file ids of the
+        spectra that failed only these checks (still in the data)
+    """
+    by_id = {flag.file_id: flag for flag in flagged}
+    newly_flagged = []
+    for row, file_id in enumerate(np.asarray(file_ids).tolist()):
+        missing_fraction = float(scores['missing_fraction'][row])
+        z_score = float(scores['z_score'][row])
+        reasons = tuple(reason for reason, failed in ((QUALITY_MISSING, missing_fraction > config.max_missing_fraction),
+                                                      (QUALITY_OUTLIER, z_score > config.z_threshold)) if failed)
+        flag = by_id.get(file_id)
+        if flag is not None:
+            # 不修改傳入的物件（可能保存在區塊快取中）
+            by_id[file_id] = replace(flag, reasons=flag.reasons + reasons, z_score=z_score,
+                                     missing_fraction=missing_fraction)
+        elif reasons:
+            by_id[file_id] = FlaggedSpectrum(
+                file_id, paths[row], reasons, float(measures['total'][row]), z_score,
+                float(measures['saturated_fraction'][row]), missing_fraction, config.exclude)
+            newly_flagged.append(file_id)
+    return [by_id[file_id] for file_id in sorted(by_id)], newly_flagged
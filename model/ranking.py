@@ -0,0 +1,150 @@
+import heapq
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, TYPE_CHECKING
+import numpy as np
+
+# pandas 只在輸出表格時才載入
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 排名依據
+RANK_BY_MAXIMUM = 'maximum'  # 每個波段的最大強度
+RANK_BY_RANGE = 'range'  # 每個波段的最大值 - 最小值（與顯著差異分析相同）
+
+# 預設輸出的前 K 強波段數
+DEFAULT_TOP_K = 20
+# 全波段圖上標註的峰值數
+MARKED_PEAKS = 3
+
+RANKING_COLUMNS = {RANK_BY_MAXIMUM: '最大值', RANK_BY_RANGE: '差值'}
+
+
+def top_k(scores: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Indices of the ``k`` largest scores, largest first.
+
+    Only the candidates are sorted: ``np.argpartition`` finds the k-th largest
+    score in linear time. Equal scores keep index order (the same order as a
+    stable sort of all scores), also at the k-th position.
+
+    Args:
+        scores: Score of every item (NaN is never selected)
+        k: Number of indices to return (fewer if fewer items are valid)
+        mask: Items that may be selected (default: all)
+
+    Returns:
+        Indices into ``scores``
+    """
+    scores = np.asarray(scores, dtype=float)
+    valid = ~np.isnan(scores)
+    if mask is not None:
+        valid &= mask
+    candidates = np.flatnonzero(valid)
+    if k <= 0 or not len(candidates):
+        return np.empty(0, dtype=np.int64)
+    values = scores[candidates]
+    if k < len(candidates):
+        kth = values[np.argpartition(-values, k - 1)[k - 1]]
+        keep = values >= kth
+        candidates, values = candidates[keep], values[keep]
+    order = np.lexsort((candidates, -values))
+    return candidates[order[:k]]
+
+
+def spaced_top_k(positions: np.ndarray, scores: np.ndarray, k: int, min_distance: float,
+                 mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Indices of the ``k`` largest scores that lie more than ``min_distance`` apart.
+
+    Same result as walking all items from the largest score down and skipping
+    any item within ``min_distance`` of an item already taken, but only the
+    top candidates are ranked; the candidate pool grows only when too many of
+    them fall next to each other.
+
+    Args:
+        positions: Position of every item (wavelength)
+        scores: Score of every item
+        k: Number of indices to return
+        min_distance: Items at most this far from a taken item are skipped
+        mask: Items that may be selected (default: all)
+
+    Returns:
+        Indices into ``scores``, largest score first
+    """
+    positions = np.asarray(positions, dtype=float)
+    pool = max(k, 1) * 4
+    while True:
+        candidates = top_k(scores, pool, mask)
+        taken: List[int] = []
+        for index in candidates.tolist():
+            if len(taken) >= k:
+                break
+            if not any(abs(positions[index] - positions[other]) <= min_distance for other in taken):
+                taken.append(index)
+        if len(taken) >= k or len(candidates) < pool:
+            return np.array(taken, dtype=np.int64)
+        pool *= 4
+
+
+@dataclass
+class RankedBand:
+    """Data class holding one waveband of a top-K ranking."""
+    wavelength: float
+    value: float  # 排名依據的數值（最大值或差值）
+    file_name: str  # 最大值所在的檔案
+    time_point: int  # 最大值所在的時間點（檔案序號）
+    run: str = ''  # 合併多個實驗時的來源
+
+    def row(self, rank: int, column: str) -> Dict[str, object]:
+        """Row of the top bands table."""
+        row = {'排名': rank, '波段': self.wavelength, column: self.value,
+               '檔案名': self.file_name, '時間點': self.time_point}
+        if self.run:
+            row['實驗'] = self.run
+        return row
+
+
+def merge_rankings(rankings: Iterable[List[RankedBand]], k: int, distinct: bool = True) -> List[RankedBand]:
+    """
+    Merge the top-K rankings of several runs into one top-K ranking.
+
+    The top K of every run is enough: a band outside a run's top K is beaten
+    by K bands of that run alone. The bands are merged with a heap; with
+    ``distinct`` a waveband appears once, with the value of its strongest run.
+
+    Args:
+        rankings: Ranking of every run, e.g. from ``OESAnalyzer.rank_bands``
+        k: Number of bands to keep
+        distinct: Keep only the best run of each waveband
+
+    Returns:
+        The overall top K, largest value first
+    """
+    bands = (band for ranking in rankings for band in ranking)
+    if distinct:
+        best: Dict[float, RankedBand] = {}
+        for band in bands:
+            if band.wavelength not in best or band.value > best[band.wavelength].value:
+                best[band.wavelength] = band
+        bands = best.values()
+    return heapq.nlargest(k, bands, key=lambda band: band.value)
+
+
+def rankings_table(bands: List[RankedBand], by: str) -> 'pd.DataFrame':
+    """Top bands table, one row per band in rank order."""
+    import pandas as pd
+    column = RANKING_COLUMNS[by]
+    rows = [band.row(rank, column) for rank, band in enumerate(bands, 1)]
+    return pd.DataFrame(rows, columns=['排名', '波段', column, '檔案名', '時間點'] + (['實驗'] if any(b.run for b in bands) else []))
+
+
+def write_rankings_excel(rankings: Dict[str, List[RankedBand]], excel_name: str) -> str:
+    """將前 K 強波段寫入 Excel，每種排名依據一個工作表"""
+    import pandas as pd
+    with pd.ExcelWriter(excel_name) as writer:
+        for by, bands in rankings.items():
+            rankings_table(bands, by).to_excel(writer, sheet_name=RANKING_COLUMNS[by], index=False)
+    return excel_name
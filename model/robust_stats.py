@@ -0,0 +1,126 @@
+import logging
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 穩健統計量的欄位（接在穩定度之後）
+ROBUST_COLUMNS = ['中位數', 'MAD', 'IQR', '截尾平均']
+# 截尾平均兩端各去掉的比例
+DEFAULT_TRIM = 0.1
+
+
+def section_bounds(length: int, section: int) -> List[Tuple[int, int]]:
+    """(start, end) of every section, the last section taking the remainder (same split as ``analyze_sections``)."""
+    section_size = length // section
+    return [(i * section_size, i * section_size + section_size if i < section - 1 else length)
+            for i in range(section)]
+
+
+def _pad(rows: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Stack rows of different lengths, padding with +inf so the padding sorts last."""
+    lengths = np.array([len(row) for row in rows], dtype=np.int64)
+    matrix = np.full((len(rows), max(int(lengths.max(initial=0)), 1)), np.inf)
+    for index, row in enumerate(rows):
+        matrix[index, :len(row)] = row
+    return matrix, lengths
+
+
+def _quantile_ranks(lengths: np.ndarray, q: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Lower rank, upper rank and interpolation weight of quantile ``q`` (numpy's default linear method)."""
+    position = q * np.maximum(lengths - 1, 0)
+    lower = np.floor(position).astype(np.int64)
+    return lower, np.minimum(lower + 1, np.maximum(lengths - 1, 0)), position - lower
+
+
+def _select(matrix: np.ndarray, ranks: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Partition every row so each requested rank holds its order statistic.
+
+    ``np.partition`` takes the same kth list for all rows, so the union of
+    the ranks of every row is passed; only these positions are placed,
+    nothing is fully sorted.
+    """
+    kth = np.unique(np.concatenate([np.ravel(rank) for rank in ranks]))
+    return np.partition(matrix, kth, axis=1)
+
+
+def _quantile(ordered: np.ndarray, lengths: np.ndarray, q: float) -> np.ndarray:
+    lower, upper, weight = _quantile_ranks(lengths, q)
+    rows = np.arange(len(ordered))
+    with np.errstate(invalid='ignore'):  # 空序列只有 inf 補值，結果稍後設為 NaN
+        return ordered[rows, lower] * (1 - weight) + ordered[rows, upper] * weight
+
+
+def robust_statistics(rows: Sequence[Sequence[float]], trim: float = DEFAULT_TRIM) -> Dict[str, np.ndarray]:
+    """
+    Median, MAD, IQR and trimmed mean of many series at once.
+
+    All series are padded into one matrix and every statistic is taken with
+    ``np.partition`` at the needed ranks: one pass for the median, quartiles
+    and trim bounds, one more for the median of the absolute deviations. The
+    trimmed mean is the mean between the two trim ranks, which after the
+    partition hold exactly the values between them.
+
+    Args:
+        rows: Series (e.g. the sections of several lines)
+        trim: Fraction cut off at each end for the trimmed mean
+
+    Returns:
+        Column name (``ROBUST_COLUMNS``) -> one value per series; NaN for
+        empty series
+    """
+    matrix, lengths = _pad([np.asarray(row, dtype=float) for row in rows])
+    valid = lengths > 0
+    safe_lengths = np.maximum(lengths, 1)
+    cut = np.floor(trim * safe_lengths).astype(np.int64)
+    low_cut, high_cut = cut, np.maximum(safe_lengths - cut, cut + 1)
+
+    ranks = [rank for q in (0.25, 0.5, 0.75) for rank in _quantile_ranks(safe_lengths, q)[:2]]
+    ordered = _select(matrix, ranks + [low_cut, np.minimum(high_cut, matrix.shape[1] - 1)])
+    median = _quantile(ordered, safe_lengths, 0.5)
+    iqr = _quantile(ordered, safe_lengths, 0.75) - _quantile(ordered, safe_lengths, 0.25)
+
+    # 截尾平均：分割後 low_cut 到 high_cut 之間恰為去掉兩端後的數值
+    columns = np.arange(matrix.shape[1])
+    kept = (columns >= low_cut[:, None]) & (columns < high_cut[:, None])
+    trimmed_mean = np.where(kept, ordered, 0.0).sum(axis=1) / (high_cut - low_cut)
+
+    with np.errstate(invalid='ignore'):
+        deviation = np.abs(matrix - median[:, None])  # 補值仍為 inf，排在最後
+    mad = _quantile(_select(deviation, _quantile_ranks(safe_lengths, 0.5)[:2]), safe_lengths, 0.5)
+
+    statistics = dict(zip(ROBUST_COLUMNS, (median, mad, iqr, trimmed_mean)))
+    return {name: np.where(valid, values, np.nan) for name, values in statistics.items()}
+
+
+def robust_section_statistics(series: Dict[str, Sequence[float]], section: int,
+                              trim: float = DEFAULT_TRIM) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Robust statistics of every section and of the whole series, for many series in one pass.
+
+    Args:
+        series: Label -> wave data (e.g. one per line)
+        section: Number of sections
+        trim: Fraction cut off at each end for the trimmed mean
+
+    Returns:
+        Label -> section name ('區段1'... and '總區段') -> column -> value,
+        matching the keys of ``OESAnalyzer.analyze_sections``
+    """
+    rows = []
+    keys = []
+    for label, wave_data in series.items():
+        values = np.asarray(wave_data, dtype=float)
+        for index, (start, end) in enumerate(section_bounds(len(values), section)):
+            rows.append(values[start:end])
+            keys.append((label, f'區段{index+1}'))
+        rows.append(values)
+        keys.append((label, '總區段'))
+    if not rows:
+        return {}
+    statistics = robust_statistics(rows, trim)
+    result: Dict[str, Dict[str, Dict[str, float]]] = {label: {} for label in series}
+    for index, (label, section_name) in enumerate(keys):
+        result[label][section_name] = {name: float(values[index]) for name, values in statistics.items()}
+    return result
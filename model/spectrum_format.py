@@ -0,0 +1,197 @@
+import os
+import re
+import codecs
+import logging
+import warnings
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 偵測格式時讀取的檔頭大小 (bytes)
+SNIFF_BYTES = 64 * 1024
+
+# 依序嘗試的編碼；latin-1 可解碼任何位元組，作為最後手段
+CANDIDATE_ENCODINGS = ('utf-8', 'big5', 'cp950', 'latin-1')
+CANDIDATE_DELIMITERS = (';', '\t', ',', ' ')
+
+# 與 float() 相同，nan / inf 也視為數值（讀成 NaN / inf），不丟棄該行
+_NUMBER = r'[-+]?(?:(?:\d+(?:{d}\d*)?|{d}\d+)(?:[eE][-+]?\d+)?|(?i:nan|inf(?:inity)?))'
+
+
+@dataclass(frozen=True)
+class SpectrumFormat:
+    """Data class describing how a spectrum text file is encoded."""
+    encoding: str = 'utf-8'
+    delimiter: str = ';'
+    decimal: str = '.'
+
+    def pattern(self) -> 're.Pattern':
+        """Regex matching a data line; groups are the wavelength and the intensity."""
+        number = _NUMBER.format(d=re.escape(self.decimal))
+        delimiter = r'[ \t]+' if self.delimiter == ' ' else r'[ \t]*' + re.escape(self.delimiter) + r'[ \t]*'
+        return re.compile(rf'^[ \t]*({number}){delimiter}({number})(?:{delimiter}[^\r\n]*)?[ \t]*\r?$', re.MULTILINE)
+
+
+DEFAULT_FORMAT = SpectrumFormat()
+
+
+def _decode_sample(raw: bytes) -> Tuple[str, str]:
+    """Pick the encoding of a file sample; returns (encoding, decoded text)."""
+    for bom, encoding in ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'),
+                          (codecs.BOM_UTF16_BE, 'utf-16')):
+        if raw.startswith(bom):
+            return encoding, raw.decode(encoding, errors='ignore')
+    # 無 BOM 的 UTF-16：ASCII 字元的另一半位元組為 0
+    if raw and raw.count(b'\x00') > len(raw) // 4:
+        encoding = 'utf-16-le' if raw[1:2] == b'\x00' else 'utf-16-be'
+        return encoding, raw.decode(encoding, errors='ignore')
+    for encoding in CANDIDATE_ENCODINGS:
+        try:
+            # 樣本可能截斷在多位元組字元中間，忽略最後幾個位元組
+            return encoding, raw.decode(encoding) if len(raw) < SNIFF_BYTES else raw[:-4].decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return 'latin-1', raw.decode('latin-1')
+
+
+def detect_format(file_path: str) -> Optional[SpectrumFormat]:
+    """
+    Detect encoding, field delimiter and decimal separator of a spectrum file.
+
+    Every combination of candidate delimiter and decimal separator is tried
+    on the file header; the one matching the most data lines wins.
+
+    Args:
+        file_path: A spectrum file representative of its folder
+
+    Returns:
+        Detected format, None if the file holds no data lines
+    """
+    with open(file_path, 'rb') as file:
+        raw = file.read(SNIFF_BYTES)
+    encoding, text = _decode_sample(raw)
+    best, best_count = None, 0
+    for decimal in ('.', ','):
+        for delimiter in CANDIDATE_DELIMITERS:
+            if delimiter == decimal:
+                continue
+            candidate = SpectrumFormat(encoding, delimiter, decimal)
+            count = len(candidate.pattern().findall(text))
+            if count > best_count:
+                best, best_count = candidate, count
+    if best is None:
+        logger.warning(f"No data lines found in {file_path}, cannot detect its format")
+        return None
+    if best != DEFAULT_FORMAT:
+        logger.info(f"Detected spectrum format of {os.path.dirname(file_path)}: {best}")
+    return best
+
+
+def _parse_block(text: str, start: int, file_format: SpectrumFormat) -> Optional[np.ndarray]:
+    """
+    Parse everything from the first data line to the end as one number block.
+
+    Returns:
+        (rows x 2) array, None if the block is not a clean two-column table
+        (footer lines, blank lines or extra columns)
+    """
+    block = text[start:].rstrip()
+    rows = block.count('\n') + 1
+    table = {'\r': ' '}
+    if file_format.delimiter != ' ':
+        table[file_format.delimiter] = ' '
+    if file_format.decimal != '.':
+        table[file_format.decimal] = '.'
+    try:
+        with warnings.catch_warnings():
+            # 遇到非數字時 numpy 只發出警告並提前結束，由下方的數量檢查處理
+            warnings.simplefilter('ignore', DeprecationWarning)
+            values = np.fromstring(block.translate(str.maketrans(table)), sep=' ')
+    except ValueError:
+        return None
+    if values.size != 2 * rows:
+        return None
+    return values.reshape(rows, 2)
+
+
+def parse_spectrum(file_path: str, file_format: SpectrumFormat = DEFAULT_FORMAT) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse every data line of a spectrum file in one pass.
+
+    The header is skipped by locating the first data line; the rest of the
+    file is converted by numpy in a single call. Files with footers, blank
+    lines or extra columns fall back to matching every data line with the
+    line pattern. No exception is raised or caught per line.
+
+    Args:
+        file_path: Path to the spectrum file
+        file_format: Format of the file (see ``detect_format``)
+
+    Returns:
+        Tuple of (wavelengths, intensities) in file order
+
+    Raises:
+        OSError: If the file cannot be read
+    """
+    with open(file_path, 'r', encoding=file_format.encoding, errors='replace', newline='') as file:
+        text = file.read()
+    pattern = file_format.pattern()
+    first = pattern.search(text)
+    if first is None:
+        return np.empty(0), np.empty(0)
+    values = _parse_block(text, first.start(), file_format)
+    if values is None:
+        fields = np.array(pattern.findall(text, first.start()))
+        if file_format.decimal != '.':
+            fields = np.char.replace(fields, file_format.decimal, '.')
+        values = fields.astype(float)
+    return values[:, 0], values[:, 1]
+
+
+class FormatRegistry:
+    """
+    Per-folder cache of detected spectrum formats.
+
+    A folder's files come from one export, so the format is detected on the
+    first file read from a folder and reused for every other file in it.
+    Only a detected format is cached: a file without data lines (e.g. a
+    blank first spectrum) leaves the folder undetected, and a file the
+    cached format reads no rows from is detected on its own.
+    """
+
+    def __init__(self):
+        self._formats: Dict[str, SpectrumFormat] = {}
+
+    def format_for(self, file_path: str) -> SpectrumFormat:
+        """Return the format of the file's folder, detecting it on first use."""
+        folder = os.path.dirname(os.path.abspath(file_path))
+        file_format = self._formats.get(folder)
+        if file_format is None:
+            file_format = detect_format(file_path)
+            if file_format is None:
+                # 偵測不到時不快取，留給資料夾中下一個檔案偵測
+                return DEFAULT_FORMAT
+            self._formats[folder] = file_format
+        return file_format
+
+    def parse(self, file_path: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Parse a file with its folder's format (see ``parse_spectrum``)."""
+        cached = os.path.dirname(os.path.abspath(file_path)) in self._formats
+        file_format = self.format_for(file_path)
+        waves, values = parse_spectrum(file_path, file_format)
+        if not len(waves) and cached:
+            # 資料夾格式讀不到任何數據時，改以此檔案自己偵測的格式讀取
+            detected = detect_format(file_path)
+            if detected is not None and detected != file_format:
+                logger.info(f"{file_path} does not match its folder's format, using {detected}")
+                waves, values = parse_spectrum(file_path, detected)
+        return waves, values
+
+    def forget(self, folder: Optional[str] = None) -> None:
+        """Drop the cached format of a folder (or of all folders) so it is detected again."""
+        if folder is None:
+            self._formats.clear()
+        else:
+            self._formats.pop(os.path.abspath(folder), None)
@@ -0,0 +1,107 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional, Sequence, TYPE_CHECKING
+import numpy as np
+
+# pandas 只在輸出表格時才載入
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 掃描的閾值數量
+DEFAULT_SWEEP_POINTS = 200
+# 摘要表的列數
+SWEEP_TABLE_ROWS = 20
+SWEEP_COLUMNS = ['閾值', '顯著波段數', '特定波段數']
+
+
+@dataclass
+class ThresholdSweep:
+    """Data class holding the number of significant bands at every threshold of a sweep."""
+    thresholds: np.ndarray
+    counts: np.ndarray  # 差值超過閾值的波段數（全部波段）
+    specific_counts: np.ndarray  # 差值超過閾值的特定波段數
+
+    def table(self) -> 'pd.DataFrame':
+        """Full sweep, one row per threshold."""
+        import pandas as pd
+        return pd.DataFrame(dict(zip(SWEEP_COLUMNS, [self.thresholds, self.counts, self.specific_counts])))
+
+    def compact_table(self, rows: int = SWEEP_TABLE_ROWS) -> 'pd.DataFrame':
+        """Sweep reduced to about ``rows`` evenly spaced thresholds (first and last included)."""
+        picked = np.unique(np.linspace(0, len(self.thresholds) - 1, min(rows, len(self.thresholds))).round().astype(int))
+        return self.table().iloc[picked].reset_index(drop=True)
+
+    def threshold_for(self, band_count: int) -> Optional[float]:
+        """Smallest swept threshold leaving at most ``band_count`` significant bands, None if none does."""
+        reached = np.flatnonzero(self.counts <= band_count)
+        return float(self.thresholds[reached[0]]) if len(reached) else None
+
+
+def sweep_thresholds(ranges: np.ndarray, thresholds: Optional[Sequence[float]] = None,
+                     points: int = DEFAULT_SWEEP_POINTS,
+                     specific_mask: Optional[np.ndarray] = None) -> ThresholdSweep:
+    """
+    Count the significant bands for a dense grid of thresholds in one pass.
+
+    The absolute ranges are sorted once; the number of bands above every
+    threshold is then a single ``searchsorted`` over the whole grid, so the
+    cost barely depends on the number of thresholds.
+
+    Args:
+        ranges: Max - min of every wavelength (NaN for absent wavelengths)
+        thresholds: Thresholds to evaluate (default: ``points`` values from 0
+            to the largest range)
+        points: Grid size when ``thresholds`` is not given
+        specific_mask: Wavelengths counted in ``specific_counts``
+
+    Returns:
+        ThresholdSweep with one count per threshold
+    """
+    magnitude = np.abs(np.asarray(ranges, dtype=float))
+    valid = ~np.isnan(magnitude)
+    if thresholds is None:
+        top = float(magnitude[valid].max()) if valid.any() else 0.0
+        thresholds = np.linspace(0.0, top, max(int(points), 2))
+    thresholds = np.asarray(thresholds, dtype=float)
+
+    def count_above(values: np.ndarray) -> np.ndarray:
+        ordered = np.sort(values)
+        # 與 _differences 相同：差值「大於」閾值才算顯著
+        return len(ordered) - np.searchsorted(ordered, thresholds, side='right')
+
+    specific = valid & specific_mask if specific_mask is not None else np.zeros_like(valid)
+    return ThresholdSweep(thresholds, count_above(magnitude[valid]), count_above(magnitude[specific]))
+
+
+def render_sweep_plot(sweep: ThresholdSweep, output_path: str, title: str = '') -> str:
+    """
+    Draw the significant-band count against the threshold and save it as PNG.
+
+    Returns:
+        The output path
+    """
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+    ax.plot(sweep.thresholds, sweep.counts, 'b-', linewidth=2, label='All wavebands')
+    if sweep.specific_counts.any():
+        ax.plot(sweep.thresholds, sweep.specific_counts, 'r--', linewidth=2, label='Specific wavebands')
+    ax.set_yscale('symlog')
+    ax.set_title(title or 'Significant wavebands vs. threshold')
+    ax.set_xlabel('Threshold (a.u.)')
+    ax.set_ylabel('Number of wavebands')
+    ax.grid(True, which='both')
+    ax.legend()
+    fig.savefig(output_path, dpi=300, bbox_inches='tight')
+    return output_path
+
+
+def write_sweep_excel(sweep: ThresholdSweep, excel_name: str) -> str:
+    """將掃描結果寫入 Excel：摘要表與完整曲線各一個工作表"""
+    import pandas as pd
+    with pd.ExcelWriter(excel_name) as writer:
+        sweep.compact_table().to_excel(writer, sheet_name='摘要', index=False)
+        sweep.table().to_excel(writer, sheet_name='掃描曲線', index=False)
+    return excel_name
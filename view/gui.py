@@ -2,22 +2,25 @@ import sys
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QLineEdit, QFileDialog, QSpinBox,
-    QDoubleSpinBox, QTableWidget, QTableWidgetItem, QMessageBox, QMenu,
+    QDoubleSpinBox, QTableView, QMessageBox, QMenu,
     QTextEdit, QGroupBox , QHeaderView,  QCheckBox, QGridLayout, QComboBox,
     QDialog, QListWidget, QSizePolicy, QProgressDialog
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt6.QtGui import QPixmap
 from controller.controller import OESController
-import pandas as pd
+from view.table_model import DataFrameTableModel
+from model.batch_render import render_intensity_plot
+from model.quality import QualityConfig
+from model.band_integration import INTEGRATE_SUM, INTEGRATE_TRAPEZOID
+from model.ranking import DEFAULT_TOP_K, RANK_BY_MAXIMUM, RANK_BY_RANGE
+from model.activation import (ActivationConfig, ACTIVATION_JUMP, ACTIVATION_HYSTERESIS, SMOOTHING_MEDIAN)
+from model.preprocessing import (PreprocessConfig, BASELINE_ROLLING_MIN, BASELINE_POLYNOMIAL,
+                                 SMOOTHING_SAVGOL, SMOOTHING_MOVING_AVERAGE)
 import os
+from datetime import datetime
 from typing import List, Dict
 import logging
-import matplotlib
-matplotlib.use('Qt5Agg')  # 設置 matplotlib 後端
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
 import numpy as np
 # Configure logging
 logging.basicConfig(
@@ -26,15 +29,33 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def create_figure_canvas(figsize):
+    """
+    Create a matplotlib figure embedded in a Qt canvas.
+
+    matplotlib and its Qt backend are imported on first use instead of at
+    startup, so the main window appears before they are loaded.
+    """
+    import matplotlib
+    matplotlib.use('Qt5Agg')  # 設置 matplotlib 後端
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+    from matplotlib.figure import Figure
+    return FigureCanvas(Figure(figsize=figsize))
+
 class OESAnalyzerGUI(QMainWindow):
     """
     Main GUI class for the OES Analyzer application.
     This View interacts with the Controller to display results and handle user input.
     """
 
+    # 背景寫檔完成（由寫檔執行緒發出，於主執行緒處理）
+    export_done = pyqtSignal(object)
+
     def __init__(self):
         super().__init__()
         self.controller = OESController()
+        self._plot_future = None  # 最近一次要求的全波段圖
+        self.export_done.connect(self._on_export_done)
         self.start_index = 0
         self.end_index = 0
         self.analysis_results = {}  # Initialize analysis_results to avoid AttributeError
@@ -43,6 +64,7 @@ class OESAnalyzerGUI(QMainWindow):
         self.start_indices = {}  # 用於存儲每個資料夾的 start_index
         self.end_indices = {}  # 用於存儲每個資料夾的 end_index
         self.selected_folders = []  # 用於存儲選擇的資料夾
+        self.analyzed_spectrum = None  # 最近一次光譜分析的 (保存路徑, base_name, 跳過範圍)
         self.setWindowTitle("OES Analyzer")
 
         # 获取屏幕分辨率
@@ -166,6 +188,16 @@ class OESAnalyzerGUI(QMainWindow):
         wave_layout.addWidget(wave_label)
         wave_layout.addWidget(self.detect_wave_spin)
         params_grid.addLayout(wave_layout)
+
+        # 其他譜線：與檢測波長一併分析，只讀取一次檔案
+        extra_wave_layout = QVBoxLayout()
+        extra_wave_label = QLabel('其他波長:')
+        self.extra_waves = QLineEdit()
+        self.extra_waves.setPlaceholderText("例如 486, 775-780")
+        self.extra_waves.setFixedWidth(160)
+        extra_wave_layout.addWidget(extra_wave_label)
+        extra_wave_layout.addWidget(self.extra_waves)
+        params_grid.addLayout(extra_wave_layout)
         
         # Threshold
         threshold_layout = QVBoxLayout()
@@ -191,6 +223,68 @@ class OESAnalyzerGUI(QMainWindow):
         params_grid.addLayout(section_layout)
         
         layout.addLayout(params_grid)
+
+        # 啟動偵測：跳變（原始方法）或平滑 + 遲滯門檻，可偵測多個啟動區間
+        activation_layout = QHBoxLayout()
+        self.activation_method = QComboBox()
+        self.activation_method.addItem("跳變", ACTIVATION_JUMP)
+        self.activation_method.addItem("遲滯門檻", ACTIVATION_HYSTERESIS)
+        self.activation_smoothing = QComboBox()
+        self.activation_smoothing.addItem("無", None)
+        self.activation_smoothing.addItem("移動平均", SMOOTHING_MOVING_AVERAGE)
+        self.activation_smoothing.addItem("中位數", SMOOTHING_MEDIAN)
+        self.activation_window = QSpinBox()
+        self.activation_window.setRange(3, 51)
+        self.activation_window.setSingleStep(2)
+        self.activation_window.setValue(5)
+        self.release_ratio_spin = QDoubleSpinBox()
+        self.release_ratio_spin.setRange(0.0, 1.0)
+        self.release_ratio_spin.setSingleStep(0.1)
+        self.release_ratio_spin.setValue(0.5)
+        self.min_duration_spin = QSpinBox()
+        self.min_duration_spin.setRange(1, 10000)
+        self.min_duration_spin.setValue(1)
+        self.multi_segment_checkbox = QCheckBox("多個啟動區間")
+        activation_layout.addWidget(QLabel("啟動偵測:"))
+        activation_layout.addWidget(self.activation_method)
+        activation_layout.addWidget(QLabel("平滑:"))
+        activation_layout.addWidget(self.activation_smoothing)
+        activation_layout.addWidget(QLabel("視窗點數:"))
+        activation_layout.addWidget(self.activation_window)
+        activation_layout.addWidget(QLabel("結束門檻比例:"))
+        activation_layout.addWidget(self.release_ratio_spin)
+        activation_layout.addWidget(QLabel("最短長度:"))
+        activation_layout.addWidget(self.min_duration_spin)
+        activation_layout.addWidget(self.multi_segment_checkbox)
+        layout.addLayout(activation_layout)
+        # 結束門檻比例只用於遲滯門檻；跳變法以反向跳變結束
+        self.activation_method.currentIndexChanged.connect(self._update_activation_controls)
+        self._update_activation_controls()
+
+        # 穩健統計：每個區段另外計算中位數、MAD、IQR 與截尾平均，不受異常光譜影響
+        self.robust_checkbox = QCheckBox("穩健統計（中位數、MAD、IQR、截尾平均）")
+        layout.addWidget(self.robust_checkbox)
+
+        # 積分波段：視窗內強度積分與譜線比值（例如 Hα/Ar），第一個視窗用於啟動偵測
+        band_layout = QHBoxLayout()
+        self.band_edit = QLineEdit()
+        self.band_edit.setPlaceholderText("例如 656±1, 750.4±0.5, 656±1/750.4±0.5")
+        self.trapezoid_checkbox = QCheckBox("梯形積分（counts·nm）")
+        # 啟動偵測比較的是第一個視窗的積分強度（多個波長的加總），與單一波長的光譜強度門檻分開設定
+        self.band_threshold_spin = QDoubleSpinBox()
+        self.band_threshold_spin.setRange(0, 1e9)
+        self.band_threshold_spin.setDecimals(0)
+        self.band_threshold_spin.setValue(5000)
+        self.band_threshold_spin.setSuffix(" Cts")
+        self.band_threshold_spin.setFixedWidth(150)
+        self.trapezoid_checkbox.toggled.connect(
+            lambda checked: self.band_threshold_spin.setSuffix(" Cts·nm" if checked else " Cts"))
+        band_layout.addWidget(QLabel("積分波段:"))
+        band_layout.addWidget(self.band_edit)
+        band_layout.addWidget(self.trapezoid_checkbox)
+        band_layout.addWidget(QLabel("積分啟動門檻:"))
+        band_layout.addWidget(self.band_threshold_spin)
+        layout.addLayout(band_layout)
         group.setLayout(layout)
         parent_layout.addWidget(group)
 
@@ -219,16 +313,114 @@ class OESAnalyzerGUI(QMainWindow):
         # 添加過濾強度勾選框
         self.filter_checkbox = QCheckBox("過濾低於指定強度")
         self.intensity_threshold = QLineEdit("1000")  # 默認強度閾值
+        # 過濾為遮罩檢視，切換時直接重繪圖表
+        self.filter_checkbox.toggled.connect(self._apply_intensity_filter)
+        self.intensity_threshold.editingFinished.connect(self._apply_intensity_filter)
         intensity_layout = QHBoxLayout()
         intensity_layout.addWidget(self.filter_checkbox)
         intensity_layout.addWidget(QLabel("想過濾的強度值:"))
         intensity_layout.addWidget(self.intensity_threshold)
         layout.addLayout(intensity_layout)
 
+        # 前處理：暗電流扣除、基線扣除與平滑，避免偏移與雜訊造成假的解離波段
+        preprocess_layout = QHBoxLayout()
+        self.baseline_combo = QComboBox()
+        self.baseline_combo.addItem("無", None)
+        self.baseline_combo.addItem("滾動最小值", BASELINE_ROLLING_MIN)
+        self.baseline_combo.addItem("多項式", BASELINE_POLYNOMIAL)
+        self.smoothing_combo = QComboBox()
+        self.smoothing_combo.addItem("無", None)
+        self.smoothing_combo.addItem("Savitzky-Golay", SMOOTHING_SAVGOL)
+        self.smoothing_combo.addItem("移動平均", SMOOTHING_MOVING_AVERAGE)
+        self.smoothing_window = QSpinBox()
+        self.smoothing_window.setRange(3, 101)
+        self.smoothing_window.setSingleStep(2)
+        self.smoothing_window.setValue(7)
+        preprocess_layout.addWidget(QLabel("基線扣除:"))
+        preprocess_layout.addWidget(self.baseline_combo)
+        preprocess_layout.addWidget(QLabel("平滑:"))
+        preprocess_layout.addWidget(self.smoothing_combo)
+        preprocess_layout.addWidget(QLabel("視窗點數:"))
+        preprocess_layout.addWidget(self.smoothing_window)
+        layout.addLayout(preprocess_layout)
+
+        dark_layout = QHBoxLayout()
+        self.dark_frame_path = QLineEdit()
+        self.dark_frame_path.setPlaceholderText("不扣除暗電流")
+        dark_browse_button = QPushButton("瀏覽")
+        dark_browse_button.clicked.connect(self._browse_dark_frame)
+        dark_layout.addWidget(QLabel("暗電流光譜:"))
+        dark_layout.addWidget(self.dark_frame_path)
+        dark_layout.addWidget(dark_browse_button)
+        layout.addLayout(dark_layout)
+
+        # 品質檢查：讀取時標記損毀、空白、截斷、飽和或總強度異常的光譜，可選擇排除
+        quality_layout = QHBoxLayout()
+        # 預設不啟用，未勾選時讀取流程、快取與輸出與未加入品質檢查前相同
+        self.quality_checkbox = QCheckBox("光譜品質檢查")
+        # 最小值 0 表示不檢查飽和
+        self.saturation_level = QDoubleSpinBox()
+        self.saturation_level.setRange(0, 1e9)
+        self.saturation_level.setDecimals(0)
+        self.saturation_level.setSpecialValueText("不檢查飽和")
+        self.saturation_level.setFixedWidth(125)
+        self.quality_z_spin = QDoubleSpinBox()
+        self.quality_z_spin.setRange(1.0, 1000.0)
+        self.quality_z_spin.setValue(8.0)
+        self.exclude_bad_checkbox = QCheckBox("排除異常光譜")
+        quality_layout.addWidget(self.quality_checkbox)
+        quality_layout.addWidget(QLabel("飽和值:"))
+        quality_layout.addWidget(self.saturation_level)
+        quality_layout.addWidget(QLabel("總強度 z 分數上限:"))
+        quality_layout.addWidget(self.quality_z_spin)
+        quality_layout.addWidget(self.exclude_bad_checkbox)
+        layout.addLayout(quality_layout)
+
         group.setLayout(layout)
         parent_layout.addWidget(group)
         # self.main_layout.addLayout(params_layout)
 
+    def _browse_dark_frame(self):
+        """選擇暗電流光譜檔"""
+        file_path, _ = QFileDialog.getOpenFileName(self, "選擇暗電流光譜", "", "Text Files (*.txt);;All Files (*)")
+        if file_path:
+            self.dark_frame_path.setText(file_path)
+
+    def _update_activation_controls(self):
+        """依啟動偵測方法啟用對應的設定"""
+        self.release_ratio_spin.setEnabled(self.activation_method.currentData() == ACTIVATION_HYSTERESIS)
+
+    def _activation_config(self):
+        """依介面設定建立啟動偵測設定"""
+        return ActivationConfig(
+            method=self.activation_method.currentData(),
+            smoothing=self.activation_smoothing.currentData(),
+            smoothing_window=self.activation_window.value(),
+            release_ratio=self.release_ratio_spin.value(),
+            min_duration=self.min_duration_spin.value(),
+            multi_segment=self.multi_segment_checkbox.isChecked()
+        )
+
+    def _preprocess_config(self):
+        """依介面設定建立前處理設定"""
+        return PreprocessConfig(
+            dark_frame=self.dark_frame_path.text().strip() or None,
+            baseline=self.baseline_combo.currentData(),
+            smoothing=self.smoothing_combo.currentData(),
+            smoothing_window=self.smoothing_window.value()
+        )
+
+    def _quality_config(self):
+        """依介面設定建立光譜品質檢查設定，未啟用時為 None"""
+        if not self.quality_checkbox.isChecked():
+            return None
+        saturation = self.saturation_level.value()
+        return QualityConfig(
+            saturation_level=saturation if saturation > self.saturation_level.minimum() else None,
+            z_threshold=self.quality_z_spin.value(),
+            exclude=self.exclude_bad_checkbox.isChecked()
+        )
+
     def _setup_waveband_settings(self, parent_layout):
         group = QGroupBox("波段設定")
         layout = QVBoxLayout()
@@ -334,6 +526,26 @@ class OESAnalyzerGUI(QMainWindow):
 
         parent_layout.addWidget(analyze_button)
 
+        batch_plot_button = QPushButton("批次繪圖")
+        batch_plot_button.clicked.connect(self._render_batch_plots)
+        parent_layout.addWidget(batch_plot_button)
+
+        heatmap_button = QPushButton("光譜熱圖")
+        heatmap_button.clicked.connect(self._view_heatmap)
+        parent_layout.addWidget(heatmap_button)
+
+        top_bands_button = QPushButton("跨實驗前K強波段")
+        top_bands_button.clicked.connect(self._merge_top_bands)
+        parent_layout.addWidget(top_bands_button)
+
+        envelope_button = QPushButton("跨實驗包絡線")
+        envelope_button.clicked.connect(self._batch_envelope)
+        parent_layout.addWidget(envelope_button)
+
+        band_button = QPushButton("積分強度分析")
+        band_button.clicked.connect(self._analyze_bands)
+        parent_layout.addWidget(band_button)
+
     def _setup_OES_analysis_section(self ,parent_layout):
         """Setup the analysis button section."""
         analyze_button = QPushButton("光譜分析")
@@ -352,6 +564,23 @@ class OESAnalyzerGUI(QMainWindow):
 
         parent_layout.addWidget(analyze_button)
 
+        # 閾值掃描：以上次分析的差值計算各閾值下的顯著波段數，不重新讀取檔案
+        sweep_button = QPushButton("閾值掃描")
+        sweep_button.clicked.connect(self._sweep_thresholds)
+        parent_layout.addWidget(sweep_button)
+
+        # 前 K 強波段：只選出最大值與差值最大的波段，輸出精簡表格
+        top_bands_layout = QHBoxLayout()
+        top_bands_layout.addWidget(QLabel("前 K 強波段:"))
+        self.top_k_spin = QSpinBox()
+        self.top_k_spin.setRange(1, 1000)
+        self.top_k_spin.setValue(DEFAULT_TOP_K)
+        top_bands_layout.addWidget(self.top_k_spin)
+        top_bands_button = QPushButton("輸出前K強波段")
+        top_bands_button.clicked.connect(self._export_top_bands)
+        top_bands_layout.addWidget(top_bands_button)
+        parent_layout.addLayout(top_bands_layout)
+
     def _setup_results_section(self ,parent_layout):
         """Create results display section."""
         # 創建一個水平佈局來放置表格和圖表
@@ -359,9 +588,22 @@ class OESAnalyzerGUI(QMainWindow):
         
         # 左側表格
         table_layout = QVBoxLayout()
-        self.results_table = QTableWidget()
-        self.results_table.setColumnCount(5)
-        self.results_table.setHorizontalHeaderLabels(["區段", "平均值", "標準差", "變異數", "穩定度"])
+        # 篩選列：只顯示任一欄包含關鍵字的列
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel('篩選:'))
+        self.results_filter = QLineEdit()
+        self.results_filter.setPlaceholderText('輸入關鍵字，例如 總區段 或 波長')
+        self.results_filter.textChanged.connect(self._filter_results_table)
+        filter_layout.addWidget(self.results_filter)
+        table_layout.addLayout(filter_layout)
+
+        # 表格由 DataFrameTableModel 提供資料，只格式化畫面上看得到的儲存格
+        self.results_model = DataFrameTableModel(["區段", "平均值", "標準差", "變異數", "穩定度"], self)
+        self.results_table = QTableView()
+        self.results_table.setModel(self.results_model)
+        # 預設不排序，維持區段順序；點擊欄位標題才排序
+        self.results_table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.results_table.setSortingEnabled(True)
         
         # 設置表格大小策略
         self.results_table.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
@@ -401,8 +643,12 @@ class OESAnalyzerGUI(QMainWindow):
         
         # 右側圖表
         plot_layout = QVBoxLayout()
-        self.plot_canvas = FigureCanvas(Figure(figsize=(5, 4)))
-        plot_layout.addWidget(self.plot_canvas)
+        # 圖表畫布在第一次繪圖時才建立，避免啟動時載入 matplotlib
+        self.plot_canvas = None
+        self.plot_placeholder = QWidget()
+        self.plot_placeholder.setMinimumSize(400, 300)
+        self.plot_layout = plot_layout
+        plot_layout.addWidget(self.plot_placeholder)
         
         plot_btn = QPushButton('更新Error Bar圖表')
         plot_btn.clicked.connect(self._update_error_bar_plot)
@@ -415,6 +661,16 @@ class OESAnalyzerGUI(QMainWindow):
         # 將水平佈局添加到父佈局
         parent_layout.addLayout(results_layout)
 
+    def _ensure_plot_canvas(self):
+        """Create the error bar canvas on first use."""
+        if self.plot_canvas is None:
+            self.plot_canvas = create_figure_canvas((5, 4))
+            self.plot_layout.replaceWidget(self.plot_placeholder, self.plot_canvas)
+            self.plot_placeholder.deleteLater()
+            self.plot_canvas.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+            self.plot_canvas.customContextMenuRequested.connect(self._show_errorbar_context_menu)
+        return self.plot_canvas
+
     def _setup_save_directory_selection(self, parent_layout):
             group = QGroupBox("保存路徑設定")
             layout = QVBoxLayout()
@@ -483,19 +739,27 @@ class OESAnalyzerGUI(QMainWindow):
         folder_path = QFileDialog.getExistingDirectory(self, "選擇資料夾")
         if folder_path:
             self.path_edit.setText(folder_path)
+            # 重新選擇資料夾時重新偵測檔案格式
+            self.controller.forget_formats([folder_path])
 
             # 自動掃描 start_index 和 end_index
             try:
-                base_name, start_index, end_index = self.controller.scan_file_indices(folder_path)
-                self.start_index = start_index
-                self.end_index = end_index
-                self.base_name = base_name
-
-                QMessageBox.information(
-                    self,
-                    "成功",
-                    f"檢測到檔案範圍：起始索引 {start_index}, 結束索引 {end_index}"
-                )
+                runs = self.controller.discover_runs(folder_path)
+                if not runs:
+                    raise ValueError("資料夾中找不到光譜檔案")
+                run = runs[0]
+                self.start_index = run.start_index
+                self.end_index = run.end_index
+                self.base_name = run.base_name
+
+                message = f"檢測到檔案範圍：起始索引 {run.start_index}, 結束索引 {run.end_index}"
+                if run.gaps:
+                    message += f"\n缺少 {len(run.gaps)} 個檔案序號：{', '.join(map(str, run.gaps[:10]))}"
+                if run.duplicates:
+                    message += f"\n重複的檔案序號：{', '.join(map(str, run.duplicates[:10]))}"
+                if len(runs) > 1:
+                    message += f"\n其他檔案名稱：{', '.join(r.base_name for r in runs[1:])}"
+                QMessageBox.information(self, "成功", message)
 
             except Exception as e:
                 QMessageBox.critical(self, "錯誤", str(e))
@@ -507,22 +771,35 @@ class OESAnalyzerGUI(QMainWindow):
                 raise ValueError("請選擇至少一個資料夾進行分析")
 
             detect_wave = self.detect_wave_spin.value()
+            lines = [detect_wave] + [line for line in self.controller.parse_lines(self.extra_waves.text()) if line != detect_wave]
             threshold = self.threshold_spin.value()
             section_count = self.section_spin.value()
 
             # 初始化結果字典
             self.analysis_results = {}
             self.time_info = {}  # 新增：用於存儲時間信息
-            failed_folders = []  # 用於存儲分析失敗的資料夾
+            self.segment_info = {}  # 每個資料夾各譜線的啟動區間
+            activation = self._activation_config()
             
             # 創建進度對話框
             progress = QProgressDialog("正在分析資料夾...", "取消", 0, len(self.selected_folders), self)
             progress.setWindowTitle("分析進度")
             progress.setWindowModality(Qt.WindowModality.WindowModal)
             progress.setMinimumDuration(0)  # 立即顯示進度對話框
+
+            # 先只讀取檢測波長，一次檢查所有資料夾的啟動區間，未通過的資料夾不載入
+            progress.setLabelText("正在檢查各資料夾的啟動區間...")
+            passed, failed_folders = self.controller.screen_activation(
+                self.selected_folders, detect_wave, threshold,
+                progress_callback=lambda done, total: QApplication.processEvents(),
+                activation=activation)
+            for folder, error in failed_folders:
+                logger.warning(f"資料夾 {folder} 未通過啟動檢查: {error}")
             
             # 對每個資料夾進行分析
             for index, folder in enumerate(self.selected_folders):
+                if folder not in passed:
+                    continue
                 # 更新進度對話框
                 progress.setValue(index)
                 progress.setLabelText(f"正在分析第 {index + 1}/{len(self.selected_folders)} 個資料夾:\n{os.path.basename(folder)}")
@@ -537,28 +814,32 @@ class OESAnalyzerGUI(QMainWindow):
                     if not base_path:
                         raise ValueError("請選擇資料夾路徑")
                     logger.info(f"分析第 {index + 1} 筆資料夾: {folder}")
-                    # 獲取 base_name, start_index, end_index
-                    base_name, start_index, end_index = self.controller.scan_file_indices(folder)
-                    # 使用原有的方法加載和處理資料
+                    # 獲取 base_name, start_index, end_index（啟動檢查時已掃描）
+                    base_name, start_index, end_index = passed[folder]
+                    # 所有譜線一次載入
                     self.controller.load_and_process_data(
                         base_path, 
                         base_name=base_name, 
                         start_index=start_index, 
-                        end_index=end_index)
+                        end_index=end_index,
+                        wavelengths=self.controller.expand_lines(lines, base_path, base_name, start_index))
 
-                    # 調用原有的 analyze_data 方法進行分析
-                    results_df, activate_time, end_time = self.controller.analyze_data(
-                        detect_wave=detect_wave,
+                    # 所有譜線的區段統計合併為一張表
+                    results_df, windows = self.controller.analyze_lines(
+                        lines,
                         threshold=threshold,
                         section_count=section_count,
                         base_name=base_name,
                         base_path=base_path,
-                        start_index=start_index
+                        start_index=start_index,
+                        activation=activation,
+                        robust=self.robust_checkbox.isChecked()
                     )
                     # 存儲每個資料夾的結果
                     self.analysis_results[folder] = results_df
                     # 存儲時間信息
-                    self.time_info[folder] = (activate_time, end_time)
+                    self.time_info[folder] = windows
+                    self.segment_info[folder] = dict(self.controller.activation_segments)
                 except Exception as e:
                     logger.error(f"分析資料夾 {folder} 時發生錯誤: {str(e)}")
                     failed_folders.append((folder, str(e)))
@@ -580,8 +861,8 @@ class OESAnalyzerGUI(QMainWindow):
                     self._update_results_table(self.analysis_results[first_successful_folder])
                     # 更新時間信息
                     if first_successful_folder in self.time_info:
-                        activate_time, end_time = self.time_info[first_successful_folder]
-                        self.time_info_label.setText(f"Activation Time: {activate_time}, End Time: {end_time}")
+                        self._update_time_info(self.time_info[first_successful_folder],
+                                               self.segment_info.get(first_successful_folder))
             
             # 顯示分析結果摘要
             success_count = len(self.selected_folders) - len(failed_folders)
@@ -610,13 +891,6 @@ class OESAnalyzerGUI(QMainWindow):
                 QMessageBox.warning(self, "警告", "請選擇資料夾路徑和保存路徑")
                 return
             
-            self.controller.load_and_process_data(
-                base_path=folder_path,
-                base_name=self.base_name,
-                start_index=self.start_index,
-                end_index=self.end_index
-            )
-
             base_name = self.base_name
             initial_start = int(self.initial_start.text())
             initial_end = int(self.initial_end.text())
@@ -637,8 +911,8 @@ class OESAnalyzerGUI(QMainWindow):
                 for i in range(initial_start, initial_end + 1)
             ]
             
-            # 調用 Controller 進行分析
-            _, _, self.output_path, _ = self.controller.execute_OES_analysis(
+            # 調用 Controller 進行分析，Excel 與圖檔在背景寫出
+            excel_future, specific_excel_future, plot_future, peak_points = self.controller.execute_OES_analysis(
                 folder_path,
                 save_folder_path,
                 base_name,
@@ -649,31 +923,280 @@ class OESAnalyzerGUI(QMainWindow):
                 thresholds,
                 skip_range_nm,
                 self.filter_checkbox.isChecked(),
-                float(self.intensity_threshold.text()) if self.filter_checkbox.isChecked() else None
+                float(self.intensity_threshold.text()) if self.filter_checkbox.isChecked() else None,
+                background=True,
+                preprocessing=self._preprocess_config(),
+                quality=self._quality_config()
             )
-            # 檢查 output_path 是否為 None
-            if self.output_path is None:
-                raise ValueError("分析過程中未生成有效的輸出路徑。")
-            
-            # 修改圖片名稱以顯示過濾狀態
-            if self.filter_checkbox.isChecked():
-                filtered_output_path = self.output_path.replace(".png", "_filtered.png")
-                # 如果檔案已存在，直接覆蓋
-                if os.path.exists(filtered_output_path):
-                    os.remove(filtered_output_path)
-                os.rename(self.output_path, filtered_output_path)
-                self.output_path = filtered_output_path
-
-            self.update_image_display(self.output_path)
+            self.analyzed_spectrum = (save_folder_path, base_name, skip_range_nm)
+            self._track_exports([excel_future, specific_excel_future], plot_future)
             result_message = (
-                f"分析完成！結果已保存至：{os.path.basename(save_folder_path)}\n"
+                f"分析完成！結果將保存至：{os.path.basename(save_folder_path)}\n"
             )
+            if peak_points:
+                result_message += f"最高峰：{peak_points[0]['波段']} nm（{peak_points[0]['最大值']:.1f}）\n"
+                if len(peak_points) > 1:
+                    result_message += "其他峰值：" + "、".join(
+                        f"{peak['波段']} nm（{peak['最大值']:.1f}）" for peak in peak_points[1:]) + "\n"
+            flagged = self.controller.analyzer.quality_report
+            if flagged:
+                excluded = sum(flag.excluded for flag in flagged)
+                result_message += f"\n異常光譜：{len(flagged)} 個（已排除 {excluded} 個），詳見「異常光譜」工作表\n"
             QMessageBox.information(self, "完成", result_message)
         except ValueError as e:
             QMessageBox.critical(self, "輸入錯誤", str(e))
         except Exception as e:
             QMessageBox.critical(self, "錯誤", f"分析過程發生錯誤: {str(e)}")
 
+    def _track_exports(self, excel_futures, plot_future=None):
+        """背景寫檔完成時透過 export_done 訊號通知主執行緒"""
+        for future in excel_futures:
+            future.add_done_callback(self.export_done.emit)
+        if plot_future is not None:
+            self._plot_future = plot_future
+            plot_future.add_done_callback(self.export_done.emit)
+
+    def _on_export_done(self, future):
+        """顯示背景寫出的結果；較舊的圖表要求已被取代時不處理"""
+        if future.exception() is not None:
+            QMessageBox.critical(self, "錯誤", f"寫出結果時發生錯誤: {future.exception()}")
+            return
+        if future is not self._plot_future:
+            if future.result():
+                self.statusBar().showMessage(f"已保存：{os.path.basename(future.result())}", 5000)
+            return
+        self._plot_future = None
+        self.output_path = future.result()
+        try:
+            self._show_spectrum_plot()
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", f"顯示全波段圖時發生錯誤: {str(e)}")
+
+    def closeEvent(self, event):
+        """關閉前等待背景寫檔完成，避免留下不完整的檔案"""
+        self.controller.export_queue.shutdown()
+        super().closeEvent(event)
+
+    def _show_spectrum_plot(self):
+        """顯示全波段圖，啟用過濾時將圖片改名為 _filtered.png"""
+        # 檢查 output_path 是否為 None
+        if self.output_path is None:
+            raise ValueError("分析過程中未生成有效的輸出路徑。")
+        
+        # 修改圖片名稱以顯示過濾狀態
+        if self.filter_checkbox.isChecked():
+            filtered_output_path = self.output_path.replace(".png", "_filtered.png")
+            # 如果檔案已存在，直接覆蓋
+            if os.path.exists(filtered_output_path):
+                os.remove(filtered_output_path)
+            os.rename(self.output_path, filtered_output_path)
+            self.output_path = filtered_output_path
+
+        self.update_image_display(self.output_path)
+
+    def _apply_intensity_filter(self):
+        """切換過濾設定時只重新計算遮罩後的包絡線與圖表，不重新讀取檔案"""
+        if self.analyzed_spectrum is None:
+            return
+        try:
+            save_folder_path, base_name, skip_range_nm = self.analyzed_spectrum
+            filter_enabled = self.filter_checkbox.isChecked()
+            plot_future, _ = self.controller.update_intensity_filter(
+                save_folder_path,
+                base_name,
+                skip_range_nm,
+                filter_enabled,
+                float(self.intensity_threshold.text()) if filter_enabled else None,
+                background=True
+            )
+            self._track_exports([], plot_future)
+        except ValueError as e:
+            QMessageBox.critical(self, "輸入錯誤", str(e))
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", f"更新過濾設定時發生錯誤: {str(e)}")
+
+    def _sweep_thresholds(self):
+        """計算顯著波段數對閾值的曲線，並列出幾個波段數對應的建議閾值"""
+        if self.analyzed_spectrum is None:
+            QMessageBox.warning(self, "警告", "請先執行光譜分析")
+            return
+        try:
+            save_folder_path, base_name, _ = self.analyzed_spectrum
+            wavebands = [float(x.strip()) for x in self.wavebands.text().split(",")]
+            sweep, plot_future = self.controller.sweep_thresholds(
+                save_folder_path, base_name, wavebands, background=True
+            )
+            self._track_exports([plot_future])
+
+            message = "各閾值下的顯著波段數：\n"
+            for threshold, count, specific in sweep.compact_table(10).itertuples(index=False):
+                message += f"{threshold:>10.1f}：{count} 個（特定波段 {specific} 個）\n"
+            suggestions = [(band_count, sweep.threshold_for(band_count)) for band_count in (10, 50, 100)]
+            suggestions = [(band_count, threshold) for band_count, threshold in suggestions if threshold is not None]
+            if suggestions:
+                message += "\n建議閾值：\n"
+                for band_count, threshold in suggestions:
+                    message += f"- 最多 {band_count} 個顯著波段：{threshold:.1f}\n"
+            QMessageBox.information(self, "閾值掃描", message)
+        except ValueError as e:
+            QMessageBox.critical(self, "輸入錯誤", str(e))
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", f"閾值掃描時發生錯誤: {str(e)}")
+
+    @staticmethod
+    def _top_bands_message(rankings, rows: int = 10) -> str:
+        """前幾名的最大值與差值波段摘要"""
+        message = ""
+        for by, title in ((RANK_BY_MAXIMUM, "最大值"), (RANK_BY_RANGE, "差值")):
+            message += f"依{title}排序：\n"
+            for rank, band in enumerate(rankings[by][:rows], 1):
+                source = f"，{band.run}" if band.run else ""
+                message += f"{rank:>3}. {band.wavelength} nm：{band.value:.1f}（{band.file_name}{source}）\n"
+            message += "\n"
+        return message
+
+    def _export_top_bands(self):
+        """輸出上次光譜分析的前 K 強波段"""
+        if self.analyzed_spectrum is None:
+            QMessageBox.warning(self, "警告", "請先執行光譜分析")
+            return
+        try:
+            save_folder_path, base_name, _ = self.analyzed_spectrum
+            rankings, excel_future = self.controller.export_top_bands(
+                save_folder_path, base_name, self.top_k_spin.value(), background=True
+            )
+            self._track_exports([excel_future])
+            QMessageBox.information(self, "前K強波段", self._top_bands_message(rankings))
+        except ValueError as e:
+            QMessageBox.critical(self, "輸入錯誤", str(e))
+        except Exception as e:
+            QMessageBox.critical(self, "錯誤", f"輸出前K強波段時發生錯誤: {str(e)}")
+
+    def _merge_top_bands(self):
+        """合併所有已選資料夾的前 K 強波段（在背景執行緒讀取）"""
+        if not self.selected_folders:
+            QMessageBox.warning(self, "警告", "請先選擇資料夾")
+            return
+        save_dir = QFileDialog.getExistingDirectory(self, '選擇保存位置')
+        if not save_dir:
+            return
+        self.top_bands_progress = QProgressDialog("正在排序波段...", None, 0, 0, self)
+        self.top_bands_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.top_bands_progress.show()
+        self.top_bands_worker = TopBandsWorker(self.controller, list(self.selected_folders), save_dir,
+                                               self.top_k_spin.value(), self)
+        self.top_bands_worker.progress.connect(self._on_top_bands_progress)
+        self.top_bands_worker.finished_ranking.connect(self._on_top_bands_ready)
+        self.top_bands_worker.failed.connect(self._on_top_bands_failed)
+        self.top_bands_worker.start()
+
+    def _on_top_bands_progress(self, done, total):
+        self.top_bands_progress.setMaximum(total)
+        self.top_bands_progress.setValue(done)
+        self.top_bands_progress.setLabelText(f"正在排序波段 {done}/{total}")
+
+    def _on_top_bands_ready(self, rankings, excel_name):
+        self.top_bands_progress.close()
+        QMessageBox.information(self, "跨實驗前K強波段",
+                                self._top_bands_message(rankings) + f"已保存至：{excel_name}")
+
+    def _on_top_bands_failed(self, message):
+        self.top_bands_progress.close()
+        QMessageBox.critical(self, "錯誤", f"排序波段時發生錯誤: {message}")
+
+    def _batch_envelope(self):
+        """逐一讀取所有已選資料夾，計算跨實驗的強度包絡線（在背景執行緒讀取）"""
+        if not self.selected_folders:
+            QMessageBox.warning(self, "警告", "請先選擇資料夾")
+            return
+        save_dir = QFileDialog.getExistingDirectory(self, '選擇保存位置')
+        if not save_dir:
+            return
+        try:
+            skip_range_nm = float(self.skip_range.text())
+            preprocessing = self._preprocess_config()
+            quality = self._quality_config()
+        except ValueError as e:
+            QMessageBox.critical(self, "輸入錯誤", str(e))
+            return
+        self.envelope_progress = QProgressDialog("正在計算包絡線...", None, 0, 0, self)
+        self.envelope_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.envelope_progress.show()
+        self.envelope_worker = EnvelopeWorker(self.controller, list(self.selected_folders), save_dir,
+                                              skip_range_nm, preprocessing, quality, self)
+        self.envelope_worker.progress.connect(self._on_envelope_progress)
+        self.envelope_worker.finished_envelope.connect(self._on_envelope_ready)
+        self.envelope_worker.failed.connect(self._on_envelope_failed)
+        self.envelope_worker.start()
+
+    def _on_envelope_progress(self, done, total):
+        self.envelope_progress.setMaximum(total)
+        self.envelope_progress.setValue(done)
+        self.envelope_progress.setLabelText(f"正在讀取資料夾 {done}/{total}")
+
+    def _on_envelope_ready(self, envelope, plot_path, excel_name):
+        self.envelope_progress.close()
+        self.update_image_display(plot_path)
+        message = f"已合併 {len(envelope)} 個實驗\n最高峰：\n"
+        # 使用開始計算時已驗證的峰間距，欄位在計算期間可能已被修改
+        for peak in envelope.peaks(self.envelope_worker.skip_range_nm):
+            message += f"- {peak['波段']} nm：{peak['最大值']:.1f}（{peak['實驗']}）\n"
+        message += f"\n已保存至：{excel_name}"
+        QMessageBox.information(self, "跨實驗包絡線", message)
+
+    def _on_envelope_failed(self, message):
+        self.envelope_progress.close()
+        QMessageBox.critical(self, "錯誤", f"計算包絡線時發生錯誤: {message}")
+
+    def _analyze_bands(self):
+        """計算目前資料夾各積分波段與比值的時間序列及穩定度（在背景執行緒讀取）"""
+        selected_folder = self.folder_selector.currentText()
+        folder_path = next((folder for folder in self.selected_folders if os.path.basename(folder) == selected_folder), None)
+        if not folder_path:
+            QMessageBox.warning(self, "警告", "請先選擇一個資料夾")
+            return
+        try:
+            bands, ratios = self.controller.parse_bands(self.band_edit.text())
+            if not bands:
+                raise ValueError("請輸入積分波段，例如 656±1")
+        except ValueError as e:
+            QMessageBox.critical(self, "輸入錯誤", str(e))
+            return
+        save_dir = QFileDialog.getExistingDirectory(self, '選擇保存位置')
+        if not save_dir:
+            return
+        method = INTEGRATE_TRAPEZOID if self.trapezoid_checkbox.isChecked() else INTEGRATE_SUM
+        self.band_progress = QProgressDialog("正在計算積分強度...", None, 0, 0, self)
+        self.band_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.band_progress.show()
+        self.band_worker = BandWorker(self.controller, folder_path, self.base_names[folder_path], save_dir,
+                                      bands, ratios, self.band_threshold_spin.value(), self.section_spin.value(),
+                                      self._activation_config(), self.robust_checkbox.isChecked(), method, self)
+        self.band_worker.progress.connect(self._on_band_progress)
+        self.band_worker.finished_bands.connect(self._on_bands_ready)
+        self.band_worker.failed.connect(self._on_bands_failed)
+        self.band_worker.start()
+
+    def _on_band_progress(self, done, total):
+        self.band_progress.setMaximum(total)
+        self.band_progress.setValue(done)
+        self.band_progress.setLabelText(f"正在讀取光譜 {done}/{total}")
+
+    def _on_bands_ready(self, series, stability, window, plot_path):
+        self.band_progress.close()
+        self.update_image_display(plot_path)
+        message = f"已計算 {len(series.bands)} 個積分波段、{len(series.ratios)} 個比值\n"
+        if stability is None:
+            message += f"{series.labels[0]}nm 未偵測到啟動區間，只輸出時間序列"
+        else:
+            self._update_results_table(stability)
+            message += f"啟動時間點：{window[0]}，結束時間點：{window[1]}"
+        QMessageBox.information(self, "積分強度", f"{message}\n結果已保存至：{os.path.dirname(plot_path)}")
+
+    def _on_bands_failed(self, message):
+        self.band_progress.close()
+        QMessageBox.critical(self, "錯誤", f"計算積分強度時發生錯誤: {message}")
+
     def _save_results(self):
         """Save analysis results through the controller."""
         try:
@@ -682,20 +1205,37 @@ class OESAnalyzerGUI(QMainWindow):
             if not save_dir:
                 raise ValueError("請選擇資料夾路徑")        
 
-            self.controller.save_results_to_excel(save_dir, self.threshold_spin.value(), self.selected_folders)
+            self.controller.save_results_to_excel(save_dir, self.threshold_spin.value(), self.selected_folders, self.analysis_results)
             QMessageBox.information(self, "成功", "結果已儲存！")
 
         except Exception as e:
             QMessageBox.critical(self, "錯誤", str(e))
 
+    def _update_time_info(self, windows, segments=None):
+        """顯示每條譜線的啟動與結束時間（多個啟動區間時一併列出）"""
+        def describe(label, activate_time, end_time):
+            text = f"Activation Time: {activate_time}, End Time: {end_time}"
+            line_segments = (segments or {}).get(label, [])
+            if len(line_segments) > 1:
+                text += f" ({len(line_segments)} segments: " + ", ".join(f"{start}-{end}" for start, end in line_segments) + ")"
+            return text
+
+        if len(windows) == 1:
+            label, (activate_time, end_time) = next(iter(windows.items()))
+            self.time_info_label.setText(describe(label, activate_time, end_time))
+            return
+        self.time_info_label.setText("\n".join(
+            f"{label}nm - {describe(label, activate_time, end_time)}"
+            for label, (activate_time, end_time) in windows.items()))
+
     def _update_results_table(self, result):
         """Update the results table with analysis data."""
-        self.results_table.setRowCount(0)  # 清空現有的行
-        for index, row in result.iterrows():
-            row_position = self.results_table.rowCount()
-            self.results_table.insertRow(row_position)
-            for column, data in enumerate(row):
-                self.results_table.setItem(row_position, column, QTableWidgetItem(str(data)))
+        # 多條譜線時表格多一欄「波長」
+        self.results_model.set_frame(result)
+
+    def _filter_results_table(self, text):
+        """依關鍵字篩選結果表格"""
+        self.results_model.set_filter(text)
 
     def _show_context_menu(self, pos):
         """顯示右鍵選單"""
@@ -721,52 +1261,32 @@ class OESAnalyzerGUI(QMainWindow):
 
     def _copy_cell(self):
         """複製選中儲存格"""
-        if self.results_table.currentItem() is not None:
+        index = self.results_table.currentIndex()
+        if index.isValid():
             clipboard = QApplication.clipboard()
-            clipboard.setText(self.results_table.currentItem().text())
+            clipboard.setText(self.results_model.data(index))
             QMessageBox.information(self, "複製成功", "已複製選中儲存格內容")
 
     def _copy_row(self):
         """複製整行"""
-        current_row = self.results_table.currentRow()
+        current_row = self.results_table.currentIndex().row()
         if current_row >= 0:
             row_data = []
-            for col in range(self.results_table.columnCount()):
-                item = self.results_table.item(current_row, col)
-                if item is not None:
-                    # 只添加數值內容
-                    try:
-                        # 嘗試將文本轉換為浮點數
-                        value = float(item.text())
-                        row_data.append(str(value))
-                    except ValueError:
-                        # 如果轉換失敗，跳過該項
-                        continue
-            
+            for value in self.results_model.row_values(current_row):
+                # 只添加數值內容
+                try:
+                    row_data.append(str(float(str(value))))
+                except ValueError:
+                    continue
             clipboard = QApplication.clipboard()
             clipboard.setText('\t'.join(row_data))
             QMessageBox.information(self, "複製成功", "已複製整行數值內容")
 
     def _copy_all(self):
         """複製全部內容"""
-        all_data = []
-        # 添加表頭
-        headers = []
-        for col in range(self.results_table.columnCount()):
-            headers.append(self.results_table.horizontalHeaderItem(col).text())
-        all_data.append('\t'.join(headers))
-        
-        # 添加數據
-        for row in range(self.results_table.rowCount()):
-            row_data = []
-            for col in range(self.results_table.columnCount()):
-                item = self.results_table.item(row, col)
-                if item is not None:
-                    row_data.append(item.text())
-            all_data.append('\t'.join(row_data))
-        
+        # 直接由表格資料產生文字（含表頭，依目前的排序與篩選）
         clipboard = QApplication.clipboard()
-        clipboard.setText('\n'.join(all_data))
+        clipboard.setText(self.results_model.to_text())
         QMessageBox.information(self, "複製成功", "已複製全部內容")
 
     def _generate_intensity_plot(self):
@@ -788,52 +1308,17 @@ class OESAnalyzerGUI(QMainWindow):
             if not save_dir:
                 return
 
-            # 生成圖表
-            plt.figure(figsize=(10, 6))
-            
-            # 讀取所有檔案並繪製強度圖
-            files = os.listdir(folder_path)
-            spectrum_files = [f for f in files if f.endswith('.txt') and f.startswith(self.base_names[folder_path])]
-            
-            times = []
-            intensities = []
-            
-            for file_name in sorted(spectrum_files):
-                try:
-                    file_path = os.path.join(folder_path, file_name)
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        for line in file:
-                            parts = line.strip().split(';')
-                            if len(parts) > 1:
-                                try:
-                                    wave = float(parts[0])
-                                    if abs(wave - detect_wave) < 0.1:  # 允許0.1nm的誤差
-                                        time_point = int(file_name.split('_S')[-1].split('.')[0])
-                                        intensity = float(parts[1])
-                                        times.append(time_point)
-                                        intensities.append(intensity)
-                                        break
-                                except ValueError:
-                                    continue
-                except Exception as e:
-                    logger.error(f"Error processing file {file_name}: {e}")
-                    continue
+            # 讀取所有檔案並繪製強度圖（檔案格式依資料夾自動偵測）
+            times, intensities = self.controller.intensity_over_time(
+                folder_path, self.base_names[folder_path], detect_wave)
 
             if not times:
                 QMessageBox.warning(self, "警告", f"在波長 {detect_wave}nm 處未找到數據")
                 return
 
-            # 繪製圖表
-            plt.plot(times, intensities, 'b-', linewidth=2)
-            plt.title(f'{detect_wave}nm intensity change')
-            plt.xlabel('Time point')
-            plt.ylabel('Intensity (a.u.)')
-            plt.grid(True)
-
-            # 保存圖表
+            # 繪製並保存圖表
             output_path = os.path.join(save_dir, f'intensity_plot_{detect_wave}nm.png')
-            plt.savefig(output_path, dpi=300, bbox_inches='tight')
-            plt.close()
+            render_intensity_plot(times, intensities, detect_wave, output_path)
 
             QMessageBox.information(self, "成功", f"強度圖已保存至：{output_path}")
 
@@ -854,33 +1339,9 @@ class OESAnalyzerGUI(QMainWindow):
             # 獲取檢測波長
             detect_wave = self.detect_wave_spin.value()
             
-            # 讀取所有檔案並繪製強度圖
-            files = os.listdir(folder_path)
-            spectrum_files = [f for f in files if f.endswith('.txt') and f.startswith(self.base_names[folder_path])]
-            
-            times = []
-            intensities = []
-            
-            for file_name in sorted(spectrum_files):
-                try:
-                    file_path = os.path.join(folder_path, file_name)
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        for line in file:
-                            parts = line.strip().split(';')
-                            if len(parts) > 1:
-                                try:
-                                    wave = float(parts[0])
-                                    if abs(wave - detect_wave) < 0.1:  # 允許0.1nm的誤差
-                                        time_point = int(file_name.split('_S')[-1].split('.')[0])
-                                        intensity = float(parts[1])
-                                        times.append(time_point)
-                                        intensities.append(intensity)
-                                        break
-                                except ValueError:
-                                    continue
-                except Exception as e:
-                    logger.error(f"Error processing file {file_name}: {e}")
-                    continue
+            # 讀取所有檔案並繪製強度圖（檔案格式依資料夾自動偵測）
+            times, intensities = self.controller.intensity_over_time(
+                folder_path, self.base_names[folder_path], detect_wave)
 
             if not times:
                 QMessageBox.warning(self, "警告", f"在波長 {detect_wave}nm 處未找到數據")
@@ -893,8 +1354,8 @@ class OESAnalyzerGUI(QMainWindow):
             layout = QVBoxLayout(plot_window)
 
             # 創建新的figure
-            fig = Figure(figsize=(10, 6))
-            canvas = FigureCanvas(fig)
+            canvas = create_figure_canvas((10, 6))
+            fig = canvas.figure
             ax = fig.add_subplot(111)
             
             # 繪製圖表
@@ -959,7 +1420,7 @@ class OESAnalyzerGUI(QMainWindow):
             detect_wave = self.detect_wave_spin.value()
             
             # 生成包含更多信息的文件名
-            timestamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             output_path = os.path.join(save_dir, f'{folder_name}_{detect_wave}nm_{timestamp}.png')
             
             figure.savefig(output_path, dpi=300, bbox_inches='tight')
@@ -967,26 +1428,85 @@ class OESAnalyzerGUI(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "錯誤", f"保存圖表時發生錯誤: {str(e)}")
 
+    def _render_batch_plots(self):
+        """以多行程平行繪製所有已選資料夾的全波段圖與檢測波長強度圖"""
+        if not self.selected_folders:
+            QMessageBox.warning(self, "警告", "請先選擇要繪圖的資料夾")
+            return
+        save_dir = QFileDialog.getExistingDirectory(self, '選擇保存位置')
+        if not save_dir:
+            return
+        self.batch_progress = QProgressDialog("正在繪製圖表...", None, 0, 0, self)
+        self.batch_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.batch_progress.show()
+        self.batch_worker = BatchRenderWorker(
+            self.controller, list(self.selected_folders), save_dir,
+            [self.detect_wave_spin.value()], float(self.skip_range.text()), self)
+        self.batch_worker.progress.connect(self._on_batch_progress)
+        self.batch_worker.finished_rendering.connect(self._on_batch_finished)
+        self.batch_worker.failed.connect(self._on_batch_failed)
+        self.batch_worker.start()
+
+    def _on_batch_progress(self, done, total):
+        self.batch_progress.setMaximum(total)
+        self.batch_progress.setValue(done)
+        self.batch_progress.setLabelText(f"正在繪製圖表 {done}/{total}")
+
+    def _on_batch_finished(self, rendered, total, output_directory):
+        self.batch_progress.close()
+        QMessageBox.information(self, "完成", f"已繪製 {rendered}/{total} 張圖表至：{output_directory}")
+
+    def _on_batch_failed(self, message):
+        self.batch_progress.close()
+        QMessageBox.critical(self, "錯誤", f"批次繪圖時發生錯誤: {message}")
+
+    def _view_heatmap(self):
+        """顯示目前資料夾的時間 x 波長強度熱圖（首次開啟時在背景建立圖塊）"""
+        selected_folder = self.folder_selector.currentText()
+        folder_path = next((folder for folder in self.selected_folders if os.path.basename(folder) == selected_folder), None)
+        if not folder_path:
+            QMessageBox.warning(self, "警告", "請先選擇一個資料夾")
+            return
+        self.heatmap_progress = QProgressDialog("正在建立光譜熱圖...", None, 0, 0, self)
+        self.heatmap_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.heatmap_progress.show()
+        self.heatmap_worker = HeatmapWorker(self.controller, folder_path, self.base_names[folder_path], self)
+        self.heatmap_worker.progress.connect(self._on_heatmap_progress)
+        self.heatmap_worker.finished_building.connect(self._on_heatmap_ready)
+        self.heatmap_worker.failed.connect(self._on_heatmap_failed)
+        self.heatmap_worker.start()
+
+    def _on_heatmap_progress(self, done, total):
+        self.heatmap_progress.setMaximum(total)
+        self.heatmap_progress.setValue(done)
+        self.heatmap_progress.setLabelText(f"正在讀取光譜 {done}/{total}")
+
+    def _on_heatmap_ready(self, heatmap, title):
+        self.heatmap_progress.close()
+        HeatmapDialog(heatmap, title, self).show()
+
+    def _on_heatmap_failed(self, message):
+        self.heatmap_progress.close()
+        QMessageBox.critical(self, "錯誤", f"建立光譜熱圖時發生錯誤: {message}")
+
     def _browse_folders(self):
         """Handle folder browsing action for stability analysis using custom dialog."""
-        dialog = MultiFolderDialog(self)
+        dialog = MultiFolderDialog(self, self.controller)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             self.selected_folders = dialog.get_selected_folders()
+            self.controller.forget_formats(self.selected_folders)
             self.folder_selector.blockSignals(True)
             self.folder_selector.clear()
             self.folder_selector.addItems([os.path.basename(folder) for folder in self.selected_folders])
             self.folder_selector.blockSignals(False)
             
-            # 對每個選擇的資料夾進行掃描以獲取 base_name, start_index, end_index
-            for folder in self.selected_folders:
-                try:
-                    base_name, start_index, end_index = self.controller.scan_file_indices(folder)
-                    # 可以將這些值存儲在一個字典中以便後續使用
-                    self.base_names[folder] = base_name
-                    self.start_indices[folder] = start_index
-                    self.end_indices[folder] = end_index
-                except Exception as e:
-                    QMessageBox.critical(self, "錯誤", f"在資料夾 {folder} 中掃描檔案時發生錯誤: {str(e)}")
+            # 對每個選擇的資料夾進行掃描以獲取 base_name, start_index, end_index（執行記錄只寫入一次）
+            # scan_file_indices 已處理掃描錯誤，失敗的資料夾為 (None, None, None)
+            for folder, (base_name, start_index, end_index) in self.controller.scan_folders(self.selected_folders).items():
+                # 可以將這些值存儲在一個字典中以便後續使用
+                self.base_names[folder] = base_name
+                self.start_indices[folder] = start_index
+                self.end_indices[folder] = end_index
 
             QMessageBox.information(self, "成功", f"已選擇 {len(self.selected_folders)} 個資料夾進行分析")
 
@@ -1000,8 +1520,7 @@ class OESAnalyzerGUI(QMainWindow):
             result = self.analysis_results[folder_path]
             self._update_results_table(result)
             if folder_path in self.time_info:
-                activate_time, end_time = self.time_info[folder_path]
-                self.time_info_label.setText(f"Activation Time: {activate_time}, End Time: {end_time}")
+                self._update_time_info(self.time_info[folder_path], self.segment_info.get(folder_path))
         else:
             # 只有在分析結果真的為空時才跳警告
             if self.analysis_results:  # 只有有分析結果時才跳
@@ -1014,48 +1533,45 @@ class OESAnalyzerGUI(QMainWindow):
                 QMessageBox.warning(self, "警告", "請先進行分析")
                 return
 
-            exp_labels = []
-            total_stabilities = []
-            lowers = []
-            uppers = []
+            comparison = self.controller.compare_experiments(self.analysis_results, self.selected_folders)
 
-            for idx, folder_path in enumerate(self.selected_folders):
-                df = self.analysis_results.get(folder_path)
-                if df is None or df.empty:
-                    continue
-                stabilities = df['穩定度'].tolist()
-                total_stability = stabilities[-1]  # 總區段
-                min_stability = min(stabilities)
-                max_stability = max(stabilities)
-                lower = total_stability - min_stability
-                upper = max_stability - total_stability
-                exp_labels.append(f"Exp.{idx+1}")
-                total_stabilities.append(total_stability)
-                lowers.append(lower)
-                uppers.append(upper)
-
-            if not exp_labels:
+            if not len(comparison):
                 QMessageBox.warning(self, "警告", "沒有可用的分析結果")
                 return
 
-            yerr = np.array([lowers, uppers])
-
+            self._ensure_plot_canvas()
             self.plot_canvas.figure.clear()
             ax = self.plot_canvas.figure.add_subplot(111)
-            ax.errorbar(range(len(exp_labels)), total_stabilities, yerr=yerr, fmt='o', capsize=10, capthick=2, elinewidth=2, color='blue')
-            ax.set_xticks(range(len(exp_labels)))
-            ax.set_xticklabels(exp_labels, rotation=0)
-            ax.set_title('Total Stability with Section Range (All Experiments)')
-            ax.set_xlabel('Experiment')
-            ax.set_ylabel('Stability')
-            ax.grid(True)
+            self._draw_error_bars(ax, comparison)
             self.plot_canvas.figure.tight_layout()
             self.plot_canvas.draw()
-            self.plot_canvas.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-            self.plot_canvas.customContextMenuRequested.connect(self._show_errorbar_context_menu)
         except Exception as e:
             QMessageBox.critical(self, "錯誤", f"更新圖表時發生錯誤: {str(e)}")
 
+    def _draw_error_bars(self, ax, comparison):
+        """繪製 error bar 圖，多條譜線時左右錯開並加上圖例，離群實驗以紅色叉號標示"""
+        bars = comparison.error_bars()
+        outliers = comparison.outliers()
+        many = len(bars) > 1
+        width = 0.6 / len(bars) if many else 0
+        for number, (label, (positions, totals, lowers, uppers)) in enumerate(bars.items()):
+            offset = (number - (len(bars) - 1) / 2) * width
+            ax.errorbar(positions + offset, totals, yerr=np.array([lowers, uppers]), fmt='o',
+                        capsize=10, capthick=2, elinewidth=2,
+                        color=None if many else 'blue',
+                        label=f"{label}nm" if many else None)
+            flagged = outliers[number, positions]
+            if flagged.any():
+                ax.plot(positions[flagged] + offset, totals[flagged], 'x', color='red', markersize=12, mew=2)
+        ax.set_xticks(range(len(comparison.labels)))
+        ax.set_xticklabels(comparison.labels, rotation=0)
+        ax.set_title('Total Stability with Section Range (All Experiments)')
+        ax.set_xlabel('Experiment')
+        ax.set_ylabel('Stability')
+        ax.grid(True)
+        if many:
+            ax.legend()
+
     def _show_errorbar_context_menu(self, pos):
         """顯示 error bar 圖的右鍵選單"""
         menu = QMenu()
@@ -1070,36 +1586,11 @@ class OESAnalyzerGUI(QMainWindow):
             self.zoom_errorbar_window = QWidget()
             self.zoom_errorbar_window.setWindowTitle("放大 Error Bar 圖表")
             layout = QVBoxLayout(self.zoom_errorbar_window)
-            fig = Figure(figsize=(10, 6))
+            canvas = create_figure_canvas((10, 6))
+            fig = canvas.figure
             ax = fig.add_subplot(111)
-            exp_labels = []
-            total_stabilities = []
-            lowers = []
-            uppers = []
-            for idx, folder_path in enumerate(self.selected_folders):
-                df = self.analysis_results.get(folder_path)
-                if df is None or df.empty:
-                    continue
-                stabilities = df['穩定度'].tolist()
-                total_stability = stabilities[-1]
-                min_stability = min(stabilities)
-                max_stability = max(stabilities)
-                lower = total_stability - min_stability
-                upper = max_stability - total_stability
-                exp_labels.append(f"Exp.{idx+1}")
-                total_stabilities.append(total_stability)
-                lowers.append(lower)
-                uppers.append(upper)
-            yerr = np.array([lowers, uppers])
-            ax.errorbar(range(len(exp_labels)), total_stabilities, yerr=yerr, fmt='o', capsize=10, capthick=2, elinewidth=2, color='blue')
-            ax.set_xticks(range(len(exp_labels)))
-            ax.set_xticklabels(exp_labels, rotation=0)
-            ax.set_title('Total Stability with Section Range (All Experiments)')
-            ax.set_xlabel('Experiment')
-            ax.set_ylabel('Stability')
-            ax.grid(True)
+            self._draw_error_bars(ax, self.controller.compare_experiments(self.analysis_results, self.selected_folders))
             fig.tight_layout()
-            canvas = FigureCanvas(fig)
             layout.addWidget(canvas)
             self.zoom_errorbar_window.setLayout(layout)
             self.zoom_errorbar_window.resize(900, 600)
@@ -1109,14 +1600,229 @@ class OESAnalyzerGUI(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "錯誤", f"放大圖表時發生錯誤: {str(e)}")
 
+class ArchiveIndexWorker(QThread):
+    """Background thread that indexes an archive root into the run catalog."""
+    progress = pyqtSignal(int, int)
+    finished_indexing = pyqtSignal(int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, controller, root, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.root = root
+
+    def run(self):
+        try:
+            count = self.controller.index_archive(self.root, self.progress.emit)
+            self.finished_indexing.emit(count)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class BatchRenderWorker(QThread):
+    """Background thread that renders the plots of many folders on the process pool."""
+    progress = pyqtSignal(int, int)
+    finished_rendering = pyqtSignal(int, int, str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, controller, folders, save_dir, detect_waves, skip_range_nm, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.folders = folders
+        self.save_dir = save_dir
+        self.detect_waves = detect_waves
+        self.skip_range_nm = skip_range_nm
+
+    def run(self):
+        try:
+            results = self.controller.render_batch(
+                self.folders, self.save_dir, self.detect_waves, self.skip_range_nm,
+                progress_callback=self.progress.emit)
+            paths = [path for path in results.values() if path is not None]
+            output_directory = os.path.dirname(paths[0]) if paths else self.save_dir
+            self.finished_rendering.emit(len(paths), len(results), output_directory)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class TopBandsWorker(QThread):
+    """Background thread that ranks the strongest wavebands of many folders."""
+    progress = pyqtSignal(int, int)
+    finished_ranking = pyqtSignal(object, str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, controller, folders, save_dir, k, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.folders = folders
+        self.save_dir = save_dir
+        self.k = k
+
+    def run(self):
+        try:
+            rankings, excel_name = self.controller.merge_top_bands(
+                self.folders, self.save_dir, self.k, progress_callback=self.progress.emit)
+            self.finished_ranking.emit(rankings, excel_name)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class EnvelopeWorker(QThread):
+    """Background thread that combines the spectra of many folders into one envelope."""
+    progress = pyqtSignal(int, int)
+    finished_envelope = pyqtSignal(object, str, str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, controller, folders, save_dir, skip_range_nm, preprocessing, quality, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.folders = folders
+        self.save_dir = save_dir
+        self.skip_range_nm = skip_range_nm
+        self.preprocessing = preprocessing
+        self.quality = quality
+
+    def run(self):
+        try:
+            envelope, plot_path, excel_name = self.controller.batch_envelope(
+                self.folders, self.save_dir, self.skip_range_nm, self.preprocessing, self.quality,
+                progress_callback=self.progress.emit)
+            self.finished_envelope.emit(envelope, plot_path, excel_name)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class BandWorker(QThread):
+    """Background thread that integrates the bands of one run and exports their time series."""
+    progress = pyqtSignal(int, int)
+    finished_bands = pyqtSignal(object, object, object, str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, controller, folder_path, base_name, save_dir, bands, ratios, threshold, section_count,
+                 activation, robust, method, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.folder_path = folder_path
+        self.base_name = base_name
+        self.save_dir = save_dir
+        self.bands = bands
+        self.ratios = ratios
+        self.threshold = threshold
+        self.section_count = section_count
+        self.activation = activation
+        self.robust = robust
+        self.method = method
+
+    def run(self):
+        try:
+            series, stability, window, plot_path = self.controller.analyze_bands(
+                self.folder_path, self.base_name, self.save_dir, self.bands, self.ratios, self.threshold,
+                self.section_count, self.activation, self.robust, self.method,
+                progress_callback=self.progress.emit)
+            self.finished_bands.emit(series, stability, window, plot_path)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class HeatmapWorker(QThread):
+    """Background thread that opens (or builds) the heatmap pyramid of one run."""
+    progress = pyqtSignal(int, int)
+    finished_building = pyqtSignal(object, str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, controller, folder_path, base_name, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.folder_path = folder_path
+        self.base_name = base_name
+
+    def run(self):
+        try:
+            heatmap = self.controller.spectral_heatmap(self.folder_path, self.base_name,
+                                                       progress_callback=self.progress.emit)
+            self.finished_building.emit(heatmap, f"{os.path.basename(self.folder_path)} - {self.base_name}")
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class HeatmapDialog(QDialog):
+    """
+    Time x wavelength intensity heatmap with pan and zoom.
+
+    Only the visible window is drawn, at the pyramid level matching the
+    canvas size; after every pan or zoom the image data is swapped for the
+    new window's tiles instead of redrawing the whole matrix.
+    """
+
+    def __init__(self, heatmap, title, parent=None):
+        super().__init__(parent)
+        from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
+        self.heatmap = heatmap
+        self._refresh_pending = False
+        self.setWindowTitle(f'Spectral Heatmap - {title}')
+        self.setModal(False)
+        self.resize(1000, 700)
+        layout = QVBoxLayout(self)
+
+        self.canvas = create_figure_canvas((10, 7))
+        fig = self.canvas.figure
+        self.ax = fig.add_subplot(111)
+        wave_low, wave_high, time_low, time_high = heatmap.extent
+        vmin, vmax = heatmap.color_limits()
+        # 時間由上往下遞增（瀑布圖）
+        self.image = self.ax.imshow(np.zeros((1, 1)), aspect='auto', origin='upper', cmap='inferno',
+                                    interpolation='nearest', vmin=vmin, vmax=vmax,
+                                    extent=(wave_low, wave_high, time_high, time_low))
+        fig.colorbar(self.image, ax=self.ax, label='Intensity (a.u.)')
+        self.ax.set_xlabel('Wavelength (nm)')
+        self.ax.set_ylabel('Time point')
+        self.ax.set_xlim(wave_low, wave_high)
+        self.ax.set_ylim(time_high, time_low)
+        self.ax.set_autoscale_on(False)
+        self.ax.callbacks.connect('xlim_changed', self._schedule_refresh)
+        self.ax.callbacks.connect('ylim_changed', self._schedule_refresh)
+
+        layout.addWidget(NavigationToolbar2QT(self.canvas, self))
+        layout.addWidget(self.canvas)
+        close_button = QPushButton("關閉")
+        close_button.clicked.connect(self.close)
+        layout.addWidget(close_button)
+        self._refresh()
+
+    def _schedule_refresh(self, _ax=None):
+        # 平移時 x 與 y 範圍會連續變動，合併成一次更新
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            QTimer.singleShot(0, self._refresh)
+
+    def _refresh(self):
+        self._refresh_pending = False
+        if not self.heatmap.is_open:
+            return
+        bbox = self.ax.get_window_extent()
+        image, (wave_low, wave_high, time_low, time_high) = self.heatmap.region(
+            self.ax.get_ylim(), self.ax.get_xlim(), max(int(bbox.height), 1), max(int(bbox.width), 1))
+        self.image.set_data(image)
+        self.image.set_extent((wave_low, wave_high, time_high, time_low))
+        self.canvas.draw_idle()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._schedule_refresh()
+
+    def closeEvent(self, event):
+        # 關閉時釋放 memmap，快取清理才能刪除此熱圖
+        self.heatmap.close()
+        super().closeEvent(event)
+
 class MultiFolderDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, controller=None):
         super().__init__(parent)
+        self.controller = controller
+        self.index_worker = None
         self.setWindowTitle("選擇多個資料夾")
         self.setMinimumSize(400, 300)
 
         self.layout = QVBoxLayout(self)
 
+        # 封存索引：從 SQLite 目錄直接搜尋實驗，不需逐一瀏覽資料夾
+        if self.controller is not None:
+            self._setup_archive_section()
+
         # List to display selected folders
         self.folder_list = QListWidget()
         self.folder_list.setSelectionMode(QListWidget.SelectionMode.MultiSelection)
@@ -1137,6 +1843,93 @@ class MultiFolderDialog(QDialog):
         self.confirm_button.clicked.connect(self.accept)
         self.layout.addWidget(self.confirm_button)
 
+    def _setup_archive_section(self):
+        """Create the archive catalog search section."""
+        group = QGroupBox("封存索引搜尋")
+        layout = QVBoxLayout()
+
+        index_layout = QHBoxLayout()
+        self.index_button = QPushButton("索引根目錄")
+        self.index_button.clicked.connect(self.index_archive)
+        self.index_status = QLabel()
+        index_layout.addWidget(self.index_button)
+        index_layout.addWidget(self.index_status)
+        layout.addLayout(index_layout)
+
+        filter_layout = QHBoxLayout()
+        self.archive_filter = QLineEdit()
+        self.archive_filter.setPlaceholderText("輸入路徑或檔案名稱關鍵字...")
+        self.archive_filter.textChanged.connect(self.refresh_archive_results)
+        self.min_files_spin = QSpinBox()
+        self.min_files_spin.setRange(0, 1000000)
+        self.min_files_spin.setPrefix("最少檔案數: ")
+        self.min_files_spin.valueChanged.connect(self.refresh_archive_results)
+        filter_layout.addWidget(self.archive_filter)
+        filter_layout.addWidget(self.min_files_spin)
+        layout.addLayout(filter_layout)
+
+        self.archive_list = QListWidget()
+        self.archive_list.setSelectionMode(QListWidget.SelectionMode.ExtendedSelection)
+        layout.addWidget(self.archive_list)
+
+        add_archive_button = QPushButton("加入選取的實驗")
+        add_archive_button.clicked.connect(self.add_archive_selection)
+        layout.addWidget(add_archive_button)
+
+        group.setLayout(layout)
+        self.layout.addWidget(group)
+        self.refresh_archive_results()
+
+    def index_archive(self):
+        """Select an archive root and index it in a background thread."""
+        root = QFileDialog.getExistingDirectory(self, "選擇封存根目錄")
+        if not root:
+            return
+        self.index_button.setEnabled(False)
+        self.index_status.setText("索引中...")
+        self.index_worker = ArchiveIndexWorker(self.controller, root, self)
+        self.index_worker.progress.connect(
+            lambda scanned, total: self.index_status.setText(f"索引中... {scanned}/{total} 個資料夾"))
+        self.index_worker.finished_indexing.connect(self._on_index_finished)
+        self.index_worker.failed.connect(self._on_index_failed)
+        self.index_worker.start()
+
+    def _on_index_finished(self, count):
+        self.index_button.setEnabled(True)
+        self.index_status.setText(f"索引完成，共 {count} 筆實驗")
+        self.refresh_archive_results()
+
+    def _on_index_failed(self, error):
+        self.index_button.setEnabled(True)
+        self.index_status.setText("")
+        QMessageBox.critical(self, "錯誤", f"索引封存資料夾時發生錯誤: {error}")
+
+    def refresh_archive_results(self):
+        """Query the catalog with the current filters."""
+        try:
+            runs = self.controller.query_archive(self.archive_filter.text().strip(), self.min_files_spin.value())
+        except Exception as e:
+            logger.error(f"Error querying archive catalog: {e}")
+            return
+        self.archive_list.clear()
+        for run in runs:
+            wave_range = ""
+            if run.wavelength_min is not None:
+                wave_range = f", {run.wavelength_min:.0f}-{run.wavelength_max:.0f}nm"
+            self.archive_list.addItem(
+                f"{run.folder}  [{run.base_name} S{run.start_index:04d}-S{run.end_index:04d}, "
+                f"{run.file_count} 檔, {run.total_bytes / 1e6:.1f} MB{wave_range}]")
+            self.archive_list.item(self.archive_list.count() - 1).setData(Qt.ItemDataRole.UserRole, run.folder)
+
+    def add_archive_selection(self):
+        """Add the selected catalog runs to the folder list."""
+        existing = {self.folder_list.item(i).text() for i in range(self.folder_list.count())}
+        for item in self.archive_list.selectedItems():
+            folder = item.data(Qt.ItemDataRole.UserRole)
+            if folder not in existing:
+                self.folder_list.addItem(folder)
+                existing.add(folder)
+
     def add_folder(self):
         """Open a dialog to select a folder and add its parent folder's contents to the list."""
         folder = QFileDialog.getExistingDirectory(self, "選擇資料夾", "", QFileDialog.Option.ShowDirsOnly | QFileDialog.Option.DontUseNativeDialog)
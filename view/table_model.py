@@ -0,0 +1,175 @@
+import re
+import logging
+from typing import Any, List, Optional, TYPE_CHECKING
+import numpy as np
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+# pandas 只在呼叫端傳入 DataFrame 時才需要
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_DIGITS = re.compile(r'(\d+)')
+
+
+def natural_key(text: str) -> tuple:
+    """Sort key comparing the digit runs of a text as numbers, so 區段2 comes before 區段10."""
+    return tuple((0, int(part), '') if part.isdigit() else (1, 0, part) for part in _DIGITS.split(text) if part)
+
+
+class DataFrameTableModel(QAbstractTableModel):
+    """
+    Read-only table model over the columns of a DataFrame.
+
+    Every column is kept as a numpy array and the view only asks for the
+    cells it paints, so a table with thousands of rows costs nothing until it
+    is scrolled. Sorting and filtering only rearrange an array of row numbers
+    (``_rows``) into the columns; the cells themselves are formatted lazily in
+    ``data``. Clipboard text is built from the columns, not from view items.
+    Text columns sort by the numbers in their text (區段2 before 區段10) and
+    missing values sort last in either order.
+    """
+
+    def __init__(self, headers: Optional[List[str]] = None, parent=None):
+        """
+        Initialize an empty model.
+
+        Args:
+            headers: Column names shown before the first frame is set
+        """
+        super().__init__(parent)
+        self._headers: List[str] = list(headers or [])
+        self._columns: List[np.ndarray] = [np.empty(0, dtype=object) for _ in self._headers]
+        self._text: List[Optional[np.ndarray]] = [None] * len(self._headers)  # 篩選用的字串欄位，首次篩選時建立
+        self._ranks: List[Optional[np.ndarray]] = [None] * len(self._headers)  # 文字欄位的自然排序名次，首次排序時建立
+        self._rows = np.empty(0, dtype=np.int64)  # 顯示順序 -> 原始列號
+        self._filter_text = ""
+        self._sort_column: Optional[int] = None
+        self._sort_order = Qt.SortOrder.AscendingOrder
+
+    def set_frame(self, frame: 'pd.DataFrame') -> None:
+        """Show a new DataFrame, keeping the current filter and sort order."""
+        self.beginResetModel()
+        self._headers = [str(column) for column in frame.columns]
+        self._columns = [frame[column].to_numpy() for column in frame.columns]
+        self._text = [None] * len(self._columns)
+        self._ranks = [None] * len(self._columns)
+        if self._sort_column is not None and self._sort_column >= len(self._columns):
+            self._sort_column = None
+        self._rows = self._arrange()
+        self.endResetModel()
+
+    @property
+    def source_row_count(self) -> int:
+        """Number of rows of the frame before filtering."""
+        return len(self._columns[0]) if self._columns else 0
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._headers)
+
+    def value(self, row: int, column: int) -> Any:
+        """Underlying value of a visible cell."""
+        return self._columns[column][self._rows[row]]
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return str(self.value(index.row(), index.column()))
+        if role == Qt.ItemDataRole.TextAlignmentRole and self._columns[index.column()].dtype.kind in 'iuf':
+            return int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        return None
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self._headers[section] if section < len(self._headers) else None
+        return str(section + 1)
+
+    def _column_text(self, column: int) -> np.ndarray:
+        if self._text[column] is None:
+            values = self._columns[column]
+            self._text[column] = values.astype(str) if values.dtype.kind in 'iufU' else np.array([str(v) for v in values])
+        return self._text[column]
+
+    def _sort_key(self, column: int) -> np.ndarray:
+        values = self._columns[column]
+        if values.dtype.kind in 'iufb':
+            return values
+        if self._ranks[column] is None:
+            text = self._column_text(column)
+            order = sorted(range(len(text)), key=lambda row: natural_key(text[row]))
+            ranks = np.empty(len(text), dtype=np.int64)
+            ranks[order] = np.arange(len(text))
+            self._ranks[column] = ranks
+        return self._ranks[column]
+
+    def _missing(self, column: int) -> np.ndarray:
+        """True where a cell has no value (NaN or None)."""
+        values = self._columns[column]
+        if values.dtype.kind == 'f':
+            return np.isnan(values)
+        if values.dtype.kind == 'O':
+            return np.array([value is None or (isinstance(value, float) and value != value) for value in values],
+                            dtype=bool)
+        return np.zeros(len(values), dtype=bool)
+
+    def _arrange(self) -> np.ndarray:
+        """Row numbers matching the filter, in the current sort order."""
+        rows = np.arange(self.source_row_count)
+        if self._filter_text:
+            keep = np.zeros(len(rows), dtype=bool)
+            for column in range(len(self._columns)):
+                keep |= np.char.find(self._column_text(column), self._filter_text) >= 0
+            rows = rows[keep]
+        if self._sort_column is not None:
+            # 穩定排序，相同值保留原始順序
+            rows = rows[np.argsort(self._sort_key(self._sort_column)[rows], kind='stable')]
+            if self._sort_order == Qt.SortOrder.DescendingOrder:
+                rows = rows[::-1]
+            # 缺值在遞增與遞減時都排在最後
+            missing = self._missing(self._sort_column)[rows]
+            if missing.any():
+                rows = np.concatenate([rows[~missing], rows[missing]])
+        return rows
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder) -> None:
+        self.layoutAboutToBeChanged.emit()
+        # 欄位 -1 表示取消排序，恢復原始順序
+        self._sort_column = column if 0 <= column < len(self._columns) else None
+        self._sort_order = order
+        self._rows = self._arrange()
+        self.layoutChanged.emit()
+
+    def set_filter(self, text: str) -> None:
+        """Only show rows where any cell contains ``text`` (empty text shows all rows)."""
+        self.beginResetModel()
+        self._filter_text = text.strip()
+        self._rows = self._arrange()
+        self.endResetModel()
+
+    def row_values(self, row: int) -> List[Any]:
+        """Values of a visible row."""
+        return [self.value(row, column) for column in range(len(self._columns))]
+
+    def to_text(self, rows: Optional[List[int]] = None, header: bool = True) -> str:
+        """
+        Tab-separated text of the visible table.
+
+        Args:
+            rows: Visible rows to include (default: all visible rows)
+            header: Include the column names as the first line
+
+        Returns:
+            Text suitable for pasting into a spreadsheet
+        """
+        selected = self._rows if rows is None else self._rows[np.asarray(rows, dtype=np.int64)]
+        columns = [column[selected].tolist() for column in self._columns]
+        lines = ['\t'.join(self._headers)] if header else []
+        lines.extend('\t'.join(map(str, values)) for values in zip(*columns))
+        return '\n'.join(lines)